@@ -0,0 +1,181 @@
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from processors import metrics
+
+# first-pos "-" [ last-pos ] or "-" suffix-length (RFC 9110 section 14.1.2)
+_RANGE_SPEC = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+class FileRangeResponse(Response):
+    """
+    Streams a byte range of a file, using zero-copy sendfile when the ASGI
+    server supports the "http.response.zerocopysend" extension
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path: str, start: int, length: int, status_code: int,
+                 headers: Dict[str, str], send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False
+                })
+            metrics.download_bytes.inc(self.length)
+            return
+
+        remaining = self.length
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        metrics.download_bytes.inc(self.length - remaining)
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" Range header
+
+    Args:
+        range_header: Value of the Range header
+        size: File size in bytes
+
+    Returns:
+        Inclusive (start, end) byte positions, or None if a well-formed range
+        cannot be satisfied (the caller answers 416)
+
+    Raises:
+        ValueError: If the header is malformed (e.g. "bytes=5--3" or "bytes=5-3")
+                    or requests multiple ranges; the caller ignores it and
+                    serves the whole file
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("Unsupported range")
+
+    match = _RANGE_SPEC.fullmatch(spec.strip())
+    if match is None or match.group(0) == "-":
+        raise ValueError(f"Malformed range: {spec}")
+    start_text, end_text = match.groups()
+    if start_text == "":
+        # Suffix range: the last N bytes
+        suffix = int(end_text)
+        if suffix <= 0:
+            return None
+        return max(size - suffix, 0), size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end_text and start > end:
+        # Invalid rather than unsatisfiable (RFC 9110 section 14.1.1)
+        raise ValueError(f"Malformed range: {spec}")
+    if start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+def file_response(request: Request, path: str, media_type: str, filename: str) -> Response:
+    """
+    Serve a file with ETag/conditional GET and single byte-range support
+
+    Args:
+        request: Incoming request (its Range/If-* headers are honoured)
+        path: Path to the file
+        media_type: Content type
+        filename: Download filename for Content-Disposition
+
+    Returns:
+        200, 206, 304 or 416 response
+    """
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise FileNotFoundError(path)
+
+    size = st.st_size
+    etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+        "content-disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    send_body = request.method != "HEAD"
+    range_header = request.headers.get("range")
+    # An empty file has no byte ranges; it is always served whole
+    ranged = (bool(range_header) and size > 0
+              and _if_range_matches(request.headers.get("if-range"), etag, st.st_mtime))
+    if ranged:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            # A malformed or multi-range header is ignored (RFC 9110): full 200 response
+            ranged = False
+    if ranged:
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+
+        start, end = byte_range
+        length = end - start + 1
+        headers.update({
+            "content-type": media_type,
+            "content-length": str(length),
+            "content-range": f"bytes {start}-{end}/{size}",
+        })
+        return FileRangeResponse(path, start, length, 206, headers, send_body)
+
+    headers.update({"content-type": media_type, "content-length": str(size)})
+    return FileRangeResponse(path, 0, size, 200, headers, send_body)
+
+
+def _if_range_matches(if_range: Optional[str], etag: str, mtime: float) -> bool:
+    """
+    Check whether a Range request still applies to the current file version
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) >= int(mtime)
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the job queue has reached its configured capacity
+    """
+
+
+class SQLiteJobQueue:
+    """
+    Job queue shared by the API and any number of worker processes
+
+    Workers claim a job by taking a lease on it and keep the lease alive with
+    heartbeats. A job whose lease expires (its worker crashed or was stopped)
+    is put back in the queue, up to max_attempts times. Jobs are started in
+    FIFO order, skipping jobs whose class (e.g. "motion" or "static") already
+    has class_limits[class] leased jobs across all workers.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS job_queue (
+            job_id TEXT PRIMARY KEY,
+            job_type TEXT NOT NULL,
+            job_class TEXT NOT NULL,
+            params TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id TEXT,
+            lease_expires_at REAL,
+            enqueued_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_job_queue_state ON job_queue (state, enqueued_at);
+    """
+
+    def __init__(self, path: str, max_queue: int = 32, lease_seconds: float = 60.0,
+                 max_attempts: int = 3, class_limits: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.max_queue = max_queue
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.class_limits = class_limits or {}
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, job_id: str, job_type: str, job_class: str, params: Dict[str, Any]) -> int:
+        """
+        Add a job to the queue
+
+        Args:
+            job_id: Job identifier
+            job_type: Name of the job function run by the worker
+            job_class: Concurrency class of the job
+            params: JSON-serializable keyword arguments of the job function
+
+        Returns:
+            Queue position of the job (1-based)
+
+        Raises:
+            QueueFullError: If max_queue jobs are already waiting
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM job_queue WHERE state = 'queued'").fetchone()[0]
+            if queued >= self.max_queue:
+                raise QueueFullError("Job queue is full")
+            conn.execute(
+                "INSERT INTO job_queue (job_id, job_type, job_class, params, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, job_type, job_class, json.dumps(params), time.time())
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return queued + 1
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        """
+        Lease the oldest queued job whose class has capacity
+
+        Args:
+            worker_id: Identifier of the claiming worker
+
+        Returns:
+            Tuple of (job_id, job_type, params), or None if nothing can start
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            running: Dict[str, int] = {}
+            for row in conn.execute("SELECT job_class, COUNT(*) AS n FROM job_queue "
+                                    "WHERE state = 'leased' GROUP BY job_class"):
+                running[row["job_class"]] = row["n"]
+
+            claimed = None
+            for row in conn.execute("SELECT job_id, job_type, job_class, params FROM job_queue "
+                                    "WHERE state = 'queued' ORDER BY enqueued_at"):
+                limit = self.class_limits.get(row["job_class"])
+                if limit is None or running.get(row["job_class"], 0) < limit:
+                    claimed = row
+                    break
+
+            if claimed is not None:
+                conn.execute(
+                    "UPDATE job_queue SET state = 'leased', worker_id = ?, lease_expires_at = ?, "
+                    "attempts = attempts + 1 WHERE job_id = ?",
+                    (worker_id, now + self.lease_seconds, claimed["job_id"])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if claimed is None:
+            return None
+        return claimed["job_id"], claimed["job_type"], json.loads(claimed["params"])
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Extend the lease of a running job
+
+        Returns:
+            False if the worker no longer holds the lease
+        """
+        cursor = self._connect().execute(
+            "UPDATE job_queue SET lease_expires_at = ? WHERE job_id = ? AND worker_id = ? AND state = 'leased'",
+            (time.time() + self.lease_seconds, job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        """
+        Remove a finished job from the queue
+
+        Returns:
+            False if the worker no longer holds the lease
+        """
+        cursor = self._connect().execute(
+            "DELETE FROM job_queue WHERE job_id = ? AND worker_id = ? AND state = 'leased'",
+            (job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, job_id: str, worker_id: str) -> bool:
+        """
+        Put a job that a stopping worker gave up on back in the queue
+
+        Returns:
+            False if the worker no longer holds the lease
+        """
+        cursor = self._connect().execute(
+            "UPDATE job_queue SET state = 'queued', worker_id = NULL, lease_expires_at = NULL "
+            "WHERE job_id = ? AND worker_id = ? AND state = 'leased'",
+            (job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def requeue_expired(self) -> Tuple[List[str], List[str]]:
+        """
+        Put jobs whose lease has expired back in the queue
+
+        Jobs that have already been attempted max_attempts times are removed
+        instead.
+
+        Returns:
+            Tuple of (requeued job IDs, abandoned job IDs)
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(
+                "SELECT job_id, attempts FROM job_queue WHERE state = 'leased' AND lease_expires_at < ?",
+                (time.time(),)
+            ).fetchall()
+            requeued = [row["job_id"] for row in expired if row["attempts"] < self.max_attempts]
+            abandoned = [row["job_id"] for row in expired if row["attempts"] >= self.max_attempts]
+            conn.executemany(
+                "UPDATE job_queue SET state = 'queued', worker_id = NULL, lease_expires_at = NULL "
+                "WHERE job_id = ?",
+                [(job_id,) for job_id in requeued]
+            )
+            conn.executemany("DELETE FROM job_queue WHERE job_id = ?", [(job_id,) for job_id in abandoned])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return requeued, abandoned
+
+    def position(self, job_id: str) -> Optional[int]:
+        """
+        Get the 1-based position of a waiting job, or None if it is not queued
+        """
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM job_queue WHERE state = 'queued' AND enqueued_at <= "
+            "(SELECT enqueued_at FROM job_queue WHERE job_id = ? AND state = 'queued')",
+            (job_id,)
+        ).fetchone()
+        return row[0] or None
+
+    def leased_job_ids(self) -> Set[str]:
+        """
+        Get the IDs of jobs a worker is running
+        """
+        return {row["job_id"] for row in
+                self._connect().execute("SELECT job_id FROM job_queue WHERE state = 'leased'")}
+
+    def active_job_ids(self) -> Set[str]:
+        """
+        Get the IDs of queued and running jobs
+        """
+        return {row["job_id"] for row in self._connect().execute("SELECT job_id FROM job_queue")}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth and leased job counts per class
+        """
+        conn = self._connect()
+        queued = conn.execute("SELECT COUNT(*) FROM job_queue WHERE state = 'queued'").fetchone()[0]
+        running = {row["job_class"]: row["n"] for row in conn.execute(
+            "SELECT job_class, COUNT(*) AS n FROM job_queue WHERE state = 'leased' GROUP BY job_class"
+        )}
+        return {"queued": queued, "running": running}
+
+
+def create_job_queue(config: Dict[str, Any]) -> SQLiteJobQueue:
+    """
+    Create the job queue described by the "jobs" config section
+
+    The queue lives in the job store database unless queue_path is set.
+    """
+    return SQLiteJobQueue(
+        config.get("queue_path", config.get("store_path", "./temp/jobs/jobs.sqlite3")),
+        max_queue=config.get("max_queue", 32),
+        lease_seconds=config.get("lease_seconds", 60),
+        max_attempts=config.get("max_attempts", 3),
+        class_limits=config.get("class_limits", {"motion": 1})
+    )
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Allowed predecessor states for each status transition
+TRANSITIONS = {
+    # A job goes back to pending when its worker is lost and it is re-queued
+    "pending": ("pending", "processing"),
+    "processing": ("pending", "processing"),
+    "completed": ("pending", "processing"),
+    "failed": ("pending", "processing"),
+}
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class JobStore:
+    """
+    Interface for job status storage
+    """
+
+    def create(self, job_id: str, status: str, progress: int, message: str,
+               file_id: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        raise NotImplementedError
+
+    def update(self, job_id: str, status: str, progress: int, message: str,
+               file_id: Optional[str] = None, data: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Transition a job to a new status
+
+        Returns:
+            False if the transition is not allowed from the job's current status
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete_older_than(self, hours: int = 24) -> int:
+        """
+        Delete finished jobs not updated within the given number of hours
+
+        Returns:
+            Number of deleted jobs
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Write out any buffered progress updates
+        """
+
+
+class MemoryJobStore(JobStore):
+    """
+    Process-local job store (single worker process only)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, job_id, status, progress, message, file_id=None, data=None):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                "status": status, "progress": progress, "message": message,
+                "file_id": file_id, "data": dict(data or {}),
+                "created_at": now, "updated_at": now
+            }
+
+    def update(self, job_id, status, progress, message, file_id=None, data=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in TRANSITIONS.get(status, ()):
+                return False
+            job.update(status=status, progress=progress, message=message,
+                       file_id=file_id or job["file_id"], updated_at=time.time())
+            job["data"].update(data or {})
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return _to_status(job) if job else None
+
+    def delete_older_than(self, hours=24):
+        cutoff = time.time() - hours * 3600
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["updated_at"] < cutoff and job["status"] in TERMINAL_STATUSES]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store backed by a SQLite database in WAL mode
+
+    Safe to share between several worker processes. Progress updates that do
+    not change the status are buffered and written at most once per
+    flush_interval seconds per job; status changes are written immediately.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            progress INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            file_id TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+        CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at);
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, tuple] = {}
+        self._last_write: Dict[str, float] = {}
+        self._flusher: Optional[threading.Thread] = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id, status, progress, message, file_id=None, data=None):
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, progress, message, file_id, data, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, status, progress, message, file_id, json.dumps(data or {}), now, now)
+        )
+
+    def update(self, job_id, status, progress, message, file_id=None, data=None):
+        now = time.time()
+
+        # Buffer progress-only updates while a job keeps the same status
+        if status == "processing" and file_id is None:
+            with self._lock:
+                buffered = job_id in self._last_write and now - self._last_write[job_id] < self.flush_interval
+                if buffered:
+                    previous_data = self._pending.get(job_id, (None, None, {}))[2]
+                    self._pending[job_id] = (progress, message, {**previous_data, **(data or {})})
+                    self._start_flusher()
+                    return True
+
+        with self._lock:
+            self._pending.pop(job_id, None)
+            self._last_write[job_id] = now
+            if status in TERMINAL_STATUSES:
+                self._last_write.pop(job_id, None)
+
+        return self._write(job_id, status, progress, message, file_id, data, now)
+
+    def _write(self, job_id, status, progress, message, file_id, data, now, allowed=None) -> bool:
+        allowed = allowed or TRANSITIONS.get(status, ())
+        placeholders = ",".join("?" for _ in allowed)
+        cursor = self._connect().execute(
+            f"UPDATE jobs SET status = ?, progress = ?, message = ?, "
+            f"file_id = COALESCE(?, file_id), data = json_patch(data, ?), updated_at = ? "
+            f"WHERE job_id = ? AND status IN ({placeholders})",
+            (status, progress, message, file_id, json.dumps(data or {}), now, job_id, *allowed)
+        )
+        return cursor.rowcount == 1
+
+    def _start_flusher(self):
+        # Called with self._lock held
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name="job-store-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    self._flusher = None
+                    return
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        now = time.time()
+        for job_id, (progress, message, data) in pending.items():
+            # Only progress for a job still processing: it may have been re-queued
+            # (possibly by another process) since the update was buffered
+            self._write(job_id, "processing", progress, message, None, data, now, allowed=("processing",))
+
+    def get(self, job_id):
+        with self._lock:
+            pending = self._pending.get(job_id)
+        if pending:
+            self.flush()
+
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["data"] = json.loads(job["data"] or "{}")
+        return _to_status(job)
+
+    def delete_older_than(self, hours=24):
+        cutoff = time.time() - hours * 3600
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE updated_at < ? AND status IN ('completed', 'failed')",
+            (cutoff,)
+        )
+        return cursor.rowcount
+
+
+def _to_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a stored job into the /api/status payload
+    """
+    return {
+        **job["data"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "updated_at": datetime.fromtimestamp(job["updated_at"]).isoformat(),
+        "file_id": job["file_id"]
+    }
+
+
+def create_job_store(config: Dict[str, Any]) -> JobStore:
+    """
+    Create the job store selected in the "jobs" config section
+
+    Args:
+        config: The "jobs" config section
+
+    Returns:
+        JobStore instance
+    """
+    backend = config.get("store", "sqlite")
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        return SQLiteJobStore(
+            config.get("store_path", "./temp/jobs/jobs.sqlite3"),
+            flush_interval=config.get("progress_flush_interval", 2.0)
+        )
+    raise ValueError(f"Unknown job store backend: {backend}")
@@ -0,0 +1,386 @@
+import os
+import uuid
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from processors.audio_processor import AudioProcessor
+from processors.pcm_buffer import PCMBuffer
+from processors.config import Config
+from processors.video_processor import VideoProcessor
+from processors.result_cache import ResultCache
+from processors.ffmpeg_runner import FFmpegRunner
+from processors.progress import ProgressTracker, scaled
+from processors import metrics, storage_manager
+from app.job_store import TERMINAL_STATUSES, create_job_store
+
+# Job status storage shared by the API and the worker processes
+job_store = create_job_store(Config.section("jobs"))
+
+DEFAULT_IMAGE = "./assets/default_background.jpg"
+
+# Content-addressed cache of rendered audio and video
+cache_config = Config.section("cache")
+result_cache = ResultCache(
+    "./temp/cache",
+    max_bytes=cache_config.get("max_bytes", 10 * 1024 ** 3),
+    enabled=cache_config.get("enabled", True)
+)
+
+def prebuild_default_segments(motion_type: str):
+    """
+    Prebuild the loopable video tracks of the default background
+    """
+    try:
+        VideoProcessor.prebuild_segments(DEFAULT_IMAGE, motion_type)
+    except Exception as e:
+        print(f"Failed to prebuild default background segments: {e}")
+
+def job_class_for(add_motion: bool) -> str:
+    """
+    Get the concurrency class of a job
+    """
+    return "motion" if add_motion else "static"
+
+def render_variant(audio_path: str, image_path: Optional[str], duration: int,
+                   frequency: Optional[float], fade_in: int, fade_out: int, add_motion: bool,
+                   audio_profile: str, apply_frequency_optimization: bool,
+                   audio_key: Optional[str] = None, video_key: Optional[str] = None,
+                   on_audio_progress: Optional[Callable[[float], None]] = None,
+                   on_video_progress: Optional[Callable[[float], None]] = None,
+                   encoding_tier: Optional[str] = None) -> str:
+    """
+    Render the audio and video of one output, reusing cached results
+    
+    Returns:
+        Path to the rendered video in the outputs directory
+    """
+    output_dir = "./temp/outputs"
+    processed_audio = None
+    try:
+        # Step 1: Process audio (reuse a cached result when available)
+        cached_audio = result_cache.get("audio", audio_key, ".mp3") if audio_key else None
+        if cached_audio:
+            processed_audio = ResultCache.link_or_copy(
+                cached_audio, os.path.join(output_dir, f"{uuid.uuid4()}_final.mp3")
+            )
+        else:
+            processed_audio = AudioProcessor.process_audio(
+                audio_path, output_dir, duration, frequency, fade_in, fade_out,
+                profile=audio_profile, apply_frequency_optimization=apply_frequency_optimization,
+                on_progress=on_audio_progress
+            )
+            if audio_key:
+                result_cache.put("audio", audio_key, ".mp3", processed_audio)
+        
+        if on_audio_progress:
+            on_audio_progress(1.0)
+        
+        # Step 2: Create video (the default background if no image was provided)
+        motion_type = Config.section("video").get("motion_type", "zoom")
+        video_file = VideoProcessor.process_video(
+            processed_audio, image_path or DEFAULT_IMAGE, output_dir, duration, add_motion, motion_type,
+            on_progress=on_video_progress, encoding_tier=encoding_tier
+        )
+        
+        if video_key:
+            result_cache.put("video", video_key, ".mp4", video_file)
+        return video_file
+    finally:
+        # Clean up the processed audio file
+        if processed_audio and os.path.exists(processed_audio):
+            os.remove(processed_audio)
+
+def process_job(job_id: str, audio_path: str, image_path: Optional[str], 
+               duration: int, frequency: Optional[float], 
+               fade_in: int, fade_out: int, add_motion: bool,
+               audio_profile: str, apply_frequency_optimization: bool,
+               audio_key: Optional[str] = None, video_key: Optional[str] = None,
+               encoding_tier: Optional[str] = None):
+    """
+    Process audio and video for a job (runs on a worker, never on the event loop)
+    """
+    # Audio is reported in the 10-50% range and video in 50-99%
+    messages = {"audio": "Processing audio...", "video": "Creating video..."}
+    tracker = ProgressTracker(
+        {"audio": 0.4, "video": 0.49},
+        lambda percent, stage, eta: update_job_status(
+            job_id, "processing", percent, messages[stage],
+            data={"stage": stage, "eta_seconds": round(eta) if eta is not None else None}
+        ),
+        start_percent=10, end_percent=99
+    )
+    try:
+        # Update job status
+        update_job_status(job_id, "processing", 10, "Processing audio...", data={"stage": "audio"})
+        
+        video_file = render_variant(
+            audio_path, image_path, duration, frequency, fade_in, fade_out, add_motion,
+            audio_profile, apply_frequency_optimization, audio_key, video_key,
+            on_audio_progress=tracker.stage("audio"), on_video_progress=tracker.stage("video"),
+            encoding_tier=encoding_tier
+        )
+        
+        # Finalize job
+        storage_manager.track(video_file, "output", job_id)
+        file_id = os.path.basename(video_file).split('.')[0]
+        update_job_status(job_id, "completed", 100, "Video ready", file_id=file_id,
+                          data={"stage": None, "eta_seconds": 0})
+            
+    except Exception as e:
+        # A cancelled job belongs to another worker now (or runs again later): keep its status and uploads
+        if FFmpegRunner.is_cancelled(job_id):
+            print(f"Job {job_id} was cancelled")
+            return
+        
+        # Update job status with error
+        update_job_status(job_id, "failed", 0, f"Error: {str(e)}")
+        
+        # Clean up files on error
+        for file_path in [audio_path, image_path]:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+
+def plan_batch(variants: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Group batch variants so that shared work is done once
+    
+    Variants that differ only in duration form one group: the longest one is
+    rendered and the others are cut from it by stream copy. Groups that share
+    a frequency adjustment can start from one decoded source.
+    
+    Args:
+        variants: Normalized variants (see app.main.parse_variants)
+        
+    Returns:
+        List of groups with "render" (index of the variant to render),
+        "derive" (indexes of variants cut from it, longest first) and
+        "frequency"
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    for index, variant in enumerate(variants):
+        params = (variant["frequency"], variant["audio_profile"],
+                  variant["apply_frequency_optimization"], variant["add_motion"],
+                  variant.get("encoding_tier"))
+        groups.setdefault(params, []).append(index)
+    
+    plan = []
+    for params, indexes in groups.items():
+        indexes.sort(key=lambda i: variants[i]["duration"], reverse=True)
+        plan.append({"render": indexes[0], "derive": indexes[1:], "frequency": params[0]})
+    return plan
+
+def process_batch_job(job_id: str, audio_path: str, image_path: Optional[str],
+                      variants: List[Dict[str, Any]], fade_in: int, fade_out: int):
+    """
+    Render several variants of one upload as a single job
+    
+    Args:
+        variants: Normalized variants with their "audio_key" and "video_key"
+    """
+    output_dir = "./temp/outputs"
+    plan = plan_batch(variants)
+    statuses = [{"index": i, "duration": v["duration"], "audio_profile": v["audio_profile"],
+                 "frequency": v["frequency"], "add_motion": v["add_motion"],
+                 "apply_frequency_optimization": v["apply_frequency_optimization"],
+                 "encoding_tier": v.get("encoding_tier"), "status": "pending", "file_id": None, "error": None}
+                for i, v in enumerate(variants)]
+    
+    # Rendering time is roughly proportional to the rendered duration
+    weights = {f"group{n}": variants[group["render"]]["duration"] for n, group in enumerate(plan)}
+    progress = {"percent": 5, "message": "Rendering variants..."}
+    
+    def report(percent: int, stage: str, eta: Optional[float]):
+        progress["percent"] = percent
+        update_job_status(job_id, "processing", percent, progress["message"],
+                          data={"stage": stage, "eta_seconds": round(eta) if eta is not None else None})
+    
+    tracker = ProgressTracker(weights, report, start_percent=5, end_percent=99)
+    
+    def set_status(index: int, status: str, file_id: Optional[str] = None, error: Optional[str] = None):
+        statuses[index].update(status=status, file_id=file_id, error=error)
+        if file_id:
+            storage_manager.track(os.path.join(output_dir, f"{file_id}.mp4"), "output", job_id)
+        done = sum(1 for s in statuses if s["status"] in ("completed", "failed"))
+        progress["message"] = f"Rendering variants ({done} of {len(statuses)} done)..."
+        update_job_status(job_id, "processing", progress["percent"], progress["message"],
+                          data={"variants": statuses})
+    
+    decoded_sources: Dict[Optional[float], str] = {}
+    try:
+        update_job_status(job_id, "processing", 5, "Rendering variants...", data={"variants": statuses})
+        
+        for n, group in enumerate(plan):
+            stage = tracker.stage(f"group{n}")
+            render = variants[group["render"]]
+            
+            # Looked up once per group: every lookup counts in the cache stats and refreshes the entry
+            cached_video = result_cache.get("video", render["video_key"], ".mp4")
+            
+            # Decode once per frequency when several groups render from the same source
+            source = audio_path
+            shared = sum(1 for g in plan if g["frequency"] == group["frequency"]) > 1
+            if shared and not cached_video:
+                if group["frequency"] not in decoded_sources:
+                    decoded_sources[group["frequency"]] = AudioProcessor.decode_source(
+                        audio_path, os.path.join(output_dir, f"{uuid.uuid4()}_source{PCMBuffer.EXTENSION}"),
+                        group["frequency"]
+                    )
+                source = decoded_sources[group["frequency"]]
+            
+            set_status(group["render"], "processing")
+            try:
+                if cached_video:
+                    video_file = ResultCache.link_or_copy(
+                        cached_video, os.path.join(output_dir, f"{uuid.uuid4()}.mp4")
+                    )
+                else:
+                    video_file = render_variant(
+                        source, image_path, render["duration"],
+                        None if source != audio_path else render["frequency"],
+                        fade_in, fade_out, render["add_motion"], render["audio_profile"],
+                        render["apply_frequency_optimization"], render["audio_key"], render["video_key"],
+                        on_audio_progress=scaled(stage, 0.0, 0.45), on_video_progress=scaled(stage, 0.45, 0.95),
+                        encoding_tier=render.get("encoding_tier")
+                    )
+            except Exception as e:
+                if FFmpegRunner.is_cancelled(job_id):
+                    raise
+                # Variants cut from this render fail with it
+                for index in [group["render"]] + group["derive"]:
+                    set_status(index, "failed", error=str(e))
+                stage(1.0)
+                continue
+            set_status(group["render"], "completed", file_id=os.path.basename(video_file).split('.')[0])
+            
+            # Shorter variants are cut from the longest render by stream copy
+            for index in group["derive"]:
+                variant = variants[index]
+                set_status(index, "processing")
+                try:
+                    derived_file = os.path.join(output_dir, f"{uuid.uuid4()}.mp4")
+                    if variant["duration"] == render["duration"]:
+                        ResultCache.link_or_copy(video_file, derived_file)
+                    else:
+                        VideoProcessor.trim_video(video_file, derived_file, variant["duration"])
+                    result_cache.put("video", variant["video_key"], ".mp4", derived_file)
+                    set_status(index, "completed", file_id=os.path.basename(derived_file).split('.')[0])
+                except Exception as e:
+                    if FFmpegRunner.is_cancelled(job_id):
+                        raise
+                    set_status(index, "failed", error=str(e))
+            stage(1.0)
+        
+        completed = [s for s in statuses if s["status"] == "completed"]
+        if not completed:
+            raise RuntimeError(statuses[0]["error"] or "No variant could be rendered")
+        
+        # The job's own file_id points at the first requested variant that succeeded
+        update_job_status(job_id, "completed", 100, f"{len(completed)} of {len(statuses)} videos ready",
+                          file_id=completed[0]["file_id"],
+                          data={"stage": None, "eta_seconds": 0, "variants": statuses})
+    
+    except Exception as e:
+        if FFmpegRunner.is_cancelled(job_id):
+            print(f"Job {job_id} was cancelled")
+            return
+        
+        update_job_status(job_id, "failed", 0, f"Error: {str(e)}", data={"variants": statuses})
+        
+        for file_path in [audio_path, image_path]:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+    finally:
+        for file_path in decoded_sources.values():
+            PCMBuffer.delete(file_path)
+
+# Bump when a code change alters rendered audio or video, so older cache entries stop matching
+RENDER_VERSION = 1
+
+# Settings that only place caches or split work between threads; they never change a rendered file
+NON_RENDER_SETTINGS = {
+    "audio": {"loop_cache_dir"},
+    "video": {"image_cache_dir", "segment_cache_dir", "prebuild_default_background"},
+    "optimizer": {"workers", "blocksize"},
+}
+
+def render_settings_digest(kind: str, audio_profile: str) -> str:
+    """
+    Get a digest of the configuration that shapes a render and RENDER_VERSION
+
+    Args:
+        kind: "audio" (audio and optimizer settings, frequency profile) or
+              "video" (the video settings on top of those)
+        audio_profile: Frequency profile of the render
+    """
+    sections = ["audio", "optimizer"] + (["video"] if kind == "video" else [])
+
+    def compute() -> str:
+        settings = {
+            section: {key: value for key, value in Config.section(section).items()
+                      if key not in NON_RENDER_SETTINGS[section]}
+            for section in sections
+        }
+        return ResultCache.make_key("settings", version=RENDER_VERSION,
+                                    profile=Config.get_profile(audio_profile)[1], **settings)
+    return Config.memoize(("render_settings_digest", kind, audio_profile), compute)
+
+@lru_cache(maxsize=1)
+def default_image_hash() -> str:
+    """
+    Get the content hash of the default background image
+    """
+    return ResultCache.hash_file(DEFAULT_IMAGE)
+
+def build_cache_keys(audio_hash: str, image_hash: Optional[str], duration: int,
+                     frequency: Optional[float], fade_in: int, fade_out: int,
+                     add_motion: bool, audio_profile: str,
+                     apply_frequency_optimization: bool,
+                     encoding_tier: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Build the result cache keys for the processed audio and the final video
+    
+    Args:
+        audio_hash: Content hash of the uploaded audio
+        image_hash: Content hash of the uploaded image (None for the default background)
+        encoding_tier: Encoding tier of the video (None for the default tier)
+    """
+    image_hash = image_hash or default_image_hash()
+    # Keyed by the tier and render settings, so editing the configuration does not serve stale results
+    _, encoding = Config.get_tier(encoding_tier)
+    
+    audio_params = {
+        "settings": render_settings_digest("audio", audio_profile),
+        "audio": audio_hash,
+        "duration": duration,
+        "frequency": frequency,
+        "fade_in": fade_in,
+        "fade_out": fade_out,
+        "audio_profile": audio_profile,
+        "apply_frequency_optimization": apply_frequency_optimization
+    }
+    audio_key = ResultCache.make_key("audio", **audio_params)
+    video_key = ResultCache.make_key("video", image=image_hash, add_motion=add_motion, encoding=encoding,
+                                     **{**audio_params, "settings": render_settings_digest("video", audio_profile)})
+    return audio_key, video_key
+
+def create_job(job_id: str, status: str, progress: int, message: str, file_id: str = None,
+               data: Optional[Dict[str, Any]] = None):
+    """
+    Register a new job in the job store
+    """
+    job_store.create(job_id, status, progress, message, file_id=file_id, data=data)
+    if status in TERMINAL_STATUSES:
+        metrics.jobs_finished.inc(status=status)
+
+def update_job_status(job_id: str, status: str, progress: int, message: str, file_id: str = None,
+                      data: Optional[Dict[str, Any]] = None):
+    """
+    Update job status in the job store
+    
+    Args:
+        data: Extra fields merged into the status payload (e.g. stage, eta_seconds)
+    """
+    if not job_store.update(job_id, status, progress, message, file_id=file_id, data=data):
+        print(f"Ignored invalid status transition for job {job_id} to '{status}'")
+    elif status in TERMINAL_STATUSES:
+        metrics.jobs_finished.inc(status=status)
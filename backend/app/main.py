@@ -1,17 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
 import uuid
-import shutil
 import json
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
 import asyncio
 
 # Import processors
-from processors.audio_processor import AudioProcessor
-from processors.video_processor import VideoProcessor
+from processors import metrics, storage_manager
+from processors.config import Config
+from processors.frequency_optimizer import FrequencyOptimizer
+from processors.result_cache import ResultCache
+from app.jobs import (job_store, result_cache, create_job, update_job_status,
+                      build_cache_keys, job_class_for, prebuild_default_segments)
+from app.job_queue import QueueFullError, create_job_queue
+from app.worker import METRICS_DIR, create_worker
+from app.uploads import UploadRejected, save_upload
+from app.downloads import file_response
 
 app = FastAPI(title="BGM Creator API")
 
@@ -33,88 +40,46 @@ app.add_middleware(
 # Create directories
 os.makedirs("./temp/uploads", exist_ok=True)
 os.makedirs("./temp/outputs", exist_ok=True)
-os.makedirs("./temp/jobs", exist_ok=True)
 
-# In-memory job storage (in production, use a database or Redis)
-jobs = {}
+# Rendering runs on workers that pull from the shared job queue; the API only
+# submits jobs and reports their status
+jobs_config = Config.section("jobs")
+job_queue = create_job_queue(jobs_config)
 
-@app.get("/")
-def read_root():
-    return {"message": "BGM Creator API is running"}
+# Files of queued and running jobs are never evicted
+storage = storage_manager.get_storage_manager()
+storage.active_jobs = job_queue.active_job_ids
+# Render leftovers are only swept while no worker (here or standalone) runs a job
+storage.running_jobs = job_queue.leased_job_ids
 
-async def process_job(job_id: str, audio_path: str, image_path: Optional[str], 
-               duration: int, frequency: Optional[float], 
-               fade_in: int, fade_out: int, add_motion: bool,
-               audio_profile: str, apply_frequency_optimization: bool):
-    """
-    Background task to process audio and video
-    """
-    try:
-        # Update job status
-        update_job_status(job_id, "processing", 10, "Processing audio...")
-        
-        # Step 1: Process audio
-        output_dir = "./temp/outputs"
-        processed_audio = AudioProcessor.process_audio(
-            audio_path, output_dir, duration, frequency, fade_in, fade_out,
-            profile=audio_profile, apply_frequency_optimization=apply_frequency_optimization
-        )
-        
-        update_job_status(job_id, "processing", 50, "Creating video...")
-        
-        # Step 2: Create video
-        motion_type = "zoom"
-        if image_path:
-            video_file = VideoProcessor.process_video(
-                processed_audio, image_path, output_dir, duration, add_motion, motion_type
-            )
-        else:
-            # If no image provided, use a default image or create a placeholder
-            default_image = "./assets/default_background.jpg"
-            video_file = VideoProcessor.process_video(
-                processed_audio, default_image, output_dir, duration, add_motion, motion_type
-            )
-        
-        # Step 3: Finalize job
-        file_id = os.path.basename(video_file).split('.')[0]
-        update_job_status(job_id, "completed", 100, "Video ready", file_id=file_id)
-        
-        # Clean up the processed audio file
-        if os.path.exists(processed_audio):
-            os.remove(processed_audio)
-            
-    except Exception as e:
-        # Update job status with error
-        update_job_status(job_id, "failed", 0, f"Error: {str(e)}")
-        
-        # Clean up files on error
-        for file_path in [audio_path, image_path, processed_audio]:
-            if file_path and os.path.exists(file_path):
-                os.remove(file_path)
+# Workers started inside the API process (0 when only standalone workers are used)
+embedded_worker = None
+if jobs_config.get("embedded_workers", 2) > 0:
+    embedded_worker = create_worker(jobs_config.get("embedded_workers", 2))
 
-def update_job_status(job_id: str, status: str, progress: int, message: str, file_id: str = None):
+# Upload size limits
+uploads_config = Config.section("uploads")
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
     """
-    Update job status in memory and on disk
+    Reject oversized uploads from the Content-Length header before reading the body
     """
-    job_info = {
-        "status": status,
-        "progress": progress,
-        "message": message,
-        "updated_at": datetime.now().isoformat(),
-        "file_id": file_id
-    }
-    
-    # Update in-memory job status
-    jobs[job_id] = job_info
-    
-    # Write to disk for persistence
-    job_file = os.path.join("./temp/jobs", f"{job_id}.json")
-    with open(job_file, 'w') as f:
-        json.dump(job_info, f)
+    max_request_bytes = (uploads_config.get("max_audio_bytes", 500 * 1024 ** 2)
+                         + uploads_config.get("max_image_bytes", 50 * 1024 ** 2)
+                         + 1024 ** 2)
+    content_length = request.headers.get("content-length")
+    if request.method == "POST" and content_length and content_length.isdigit() \
+            and int(content_length) > max_request_bytes:
+        return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+    return await call_next(request)
+
+@app.get("/")
+def read_root():
+    return {"message": "BGM Creator API is running"}
 
 @app.post("/api/process")
-async def process_files(background_tasks: BackgroundTasks,
-                       audio_file: UploadFile = File(...),
+async def process_files(audio_file: UploadFile = File(...),
                        image_file: Optional[UploadFile] = File(None),
                        duration: int = Form(...),  # Duration in seconds
                        frequency: Optional[float] = Form(None),  # Hz adjustment
@@ -122,116 +87,418 @@ async def process_files(background_tasks: BackgroundTasks,
                        fade_out: Optional[int] = Form(0),  # Fade out duration in seconds
                        add_motion: bool = Form(False),  # Whether to add motion to static images
                        audio_profile: str = Form("default"),  # Audio optimization profile
-                       apply_frequency_optimization: bool = Form(True)  # Whether to apply frequency optimization
+                       apply_frequency_optimization: bool = Form(True),  # Whether to apply frequency optimization
+                       encoding_tier: Optional[str] = Form(None)  # Encoding speed/size tier (default from config)
                        ):
+    if encoding_tier is not None and encoding_tier not in Config.tier_names():
+        raise HTTPException(status_code=422, detail=f"Unknown encoding tier: {encoding_tier}")
+    
     # Generate job ID
     job_id = str(uuid.uuid4())
     
-    # Save uploaded files
+    # Stream uploaded files to disk, hashing them on the way
     upload_dir = "./temp/uploads"
-    audio_path = os.path.join(upload_dir, f"{job_id}_{audio_file.filename}")
-    with open(audio_path, "wb") as buffer:
-        shutil.copyfileobj(audio_file.file, buffer)
-    
+    chunk_size = uploads_config.get("chunk_size", 1024 * 1024)
+    audio_path = None
     image_path = None
-    if image_file:
-        image_path = os.path.join(upload_dir, f"{job_id}_{image_file.filename}")
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image_file.file, buffer)
+    image_hash = None
+    try:
+        audio_path, audio_hash = await save_upload(
+            audio_file, upload_dir, f"{job_id}_audio", "audio",
+            uploads_config.get("max_audio_bytes", 500 * 1024 ** 2), chunk_size
+        )
+        if image_file:
+            image_path, image_hash = await save_upload(
+                image_file, upload_dir, f"{job_id}_image", "image",
+                uploads_config.get("max_image_bytes", 50 * 1024 ** 2), chunk_size
+            )
+    except UploadRejected as e:
+        await run_in_threadpool(discard_uploads, [audio_path, image_path])
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    await run_in_threadpool(track_uploads, job_id, [audio_path, image_path])
+    
+    # Serve repeat requests straight from the result cache
+    audio_key, video_key = await run_in_threadpool(
+        build_cache_keys, audio_hash, image_hash, duration, frequency,
+        fade_in, fade_out, add_motion, audio_profile, apply_frequency_optimization, encoding_tier
+    )
+    # The lookup may copy a large file, so it runs off the event loop like every store call
+    if await run_in_threadpool(serve_cached_video, job_id, video_key):
+        return {"job_id": job_id, "message": "Processing started"}
     
     # Initialize job status
-    update_job_status(job_id, "pending", 0, "Job queued, waiting to start...")
+    await run_in_threadpool(create_job, job_id, "pending", 0, "Job queued, waiting to start...")
     
-    # Start processing in background
-    background_tasks.add_task(
-        process_job, job_id, audio_path, image_path, duration, frequency, 
-        fade_in, fade_out, add_motion, audio_profile, apply_frequency_optimization
-    )
+    # Queue processing for the workers
+    params = {
+        "audio_path": audio_path,
+        "image_path": image_path,
+        "duration": duration,
+        "frequency": frequency,
+        "fade_in": fade_in,
+        "fade_out": fade_out,
+        "add_motion": add_motion,
+        "audio_profile": audio_profile,
+        "apply_frequency_optimization": apply_frequency_optimization,
+        "encoding_tier": encoding_tier,
+        "audio_key": audio_key,
+        "video_key": video_key
+    }
+    try:
+        queue_position = await run_in_threadpool(
+            job_queue.enqueue, job_id, "single", job_class_for(add_motion), params
+        )
+    except QueueFullError:
+        await run_in_threadpool(reject_job, job_id, [audio_path, image_path])
+        raise HTTPException(status_code=503, detail="Job queue is full")
+    
+    return {"job_id": job_id, "message": "Processing started", "queue_position": queue_position}
+
+@app.post("/api/batch")
+async def process_batch(audio_file: UploadFile = File(...),
+                        image_file: Optional[UploadFile] = File(None),
+                        variants: str = Form(...),  # JSON list of variant objects
+                        fade_in: Optional[int] = Form(0),
+                        fade_out: Optional[int] = Form(0),
+                        frequency: Optional[float] = Form(None),  # Defaults for the variants
+                        add_motion: bool = Form(False),
+                        audio_profile: str = Form("default"),
+                        apply_frequency_optimization: bool = Form(True),
+                        encoding_tier: Optional[str] = Form(None)
+                        ):
+    """
+    Render several variants (durations, profiles, ...) of one upload as a single job
+    
+    Each variant is an object with a required "duration" (seconds) and optional
+    "frequency", "audio_profile", "apply_frequency_optimization",
+    "add_motion" and "encoding_tier" overriding the form defaults. Per-variant status and file IDs
+    are reported in the "variants" field of the job status.
+    """
+    defaults = {
+        "frequency": frequency,
+        "audio_profile": audio_profile,
+        "apply_frequency_optimization": apply_frequency_optimization,
+        "add_motion": add_motion,
+        "encoding_tier": encoding_tier
+    }
+    try:
+        parsed_variants = parse_variants(variants, defaults, jobs_config.get("max_batch_variants", 8))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    job_id = str(uuid.uuid4())
+    
+    upload_dir = "./temp/uploads"
+    chunk_size = uploads_config.get("chunk_size", 1024 * 1024)
+    audio_path = None
+    image_path = None
+    image_hash = None
+    try:
+        audio_path, audio_hash = await save_upload(
+            audio_file, upload_dir, f"{job_id}_audio", "audio",
+            uploads_config.get("max_audio_bytes", 500 * 1024 ** 2), chunk_size
+        )
+        if image_file:
+            image_path, image_hash = await save_upload(
+                image_file, upload_dir, f"{job_id}_image", "image",
+                uploads_config.get("max_image_bytes", 50 * 1024 ** 2), chunk_size
+            )
+    except UploadRejected as e:
+        await run_in_threadpool(discard_uploads, [audio_path, image_path])
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    await run_in_threadpool(track_uploads, job_id, [audio_path, image_path])
+    
+    for variant in parsed_variants:
+        variant["audio_key"], variant["video_key"] = await run_in_threadpool(
+            build_cache_keys, audio_hash, image_hash, variant["duration"], variant["frequency"],
+            fade_in, fade_out, variant["add_motion"], variant["audio_profile"],
+            variant["apply_frequency_optimization"], variant["encoding_tier"]
+        )
+    
+    await run_in_threadpool(create_job, job_id, "pending", 0, "Job queued, waiting to start...",
+                            data={"batch": True})
+    
+    job_class = job_class_for(any(variant["add_motion"] for variant in parsed_variants))
+    params = {
+        "audio_path": audio_path,
+        "image_path": image_path,
+        "variants": parsed_variants,
+        "fade_in": fade_in,
+        "fade_out": fade_out
+    }
+    try:
+        queue_position = await run_in_threadpool(job_queue.enqueue, job_id, "batch", job_class, params)
+    except QueueFullError:
+        await run_in_threadpool(reject_job, job_id, [audio_path, image_path])
+        raise HTTPException(status_code=503, detail="Job queue is full")
+    
+    return {"job_id": job_id, "message": "Processing started", "queue_position": queue_position,
+            "variants": len(parsed_variants)}
+
+def parse_variants(variants: str, defaults: Dict[str, Any], max_variants: int) -> List[Dict[str, Any]]:
+    """
+    Parse and validate the variants of a batch request
+    
+    Raises:
+        ValueError: If the variants are malformed
+    """
+    try:
+        items = json.loads(variants)
+    except ValueError:
+        raise ValueError("variants must be a JSON list")
+    if not isinstance(items, list) or not items:
+        raise ValueError("variants must be a non-empty JSON list")
+    if len(items) > max_variants:
+        raise ValueError(f"At most {max_variants} variants are allowed")
     
-    return {"job_id": job_id, "message": "Processing started"}
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Each variant must be an object")
+        duration = item.get("duration")
+        if not isinstance(duration, int) or isinstance(duration, bool) or duration <= 0:
+            raise ValueError("Each variant needs a positive integer duration")
+        variant = {"duration": duration}
+        for key, default in defaults.items():
+            value = item.get(key, default)
+            if key == "frequency" and value is not None and not isinstance(value, (int, float)):
+                raise ValueError("frequency must be a number")
+            if key == "audio_profile" and not isinstance(value, str):
+                raise ValueError("audio_profile must be a string")
+            if key == "encoding_tier" and value is not None and value not in Config.tier_names():
+                raise ValueError(f"Unknown encoding tier: {value}")
+            if key in ("add_motion", "apply_frequency_optimization") and not isinstance(value, bool):
+                raise ValueError(f"{key} must be a boolean")
+            variant[key] = value
+        parsed.append(variant)
+    return parsed
 
 @app.get("/api/status/{job_id}")
 def get_job_status(job_id: str):
-    # Check in-memory cache first
-    if job_id in jobs:
-        return jobs[job_id]
-    
-    # Try to read from disk
-    job_file = os.path.join("./temp/jobs", f"{job_id}.json")
-    if os.path.exists(job_file):
-        with open(job_file, 'r') as f:
-            try:
-                return json.load(f)
-            except:
-                pass
+    job_info = job_store.get(job_id)
+    if job_info is not None:
+        return with_queue_position(job_id, job_info)
     
     # Return not found if job doesn't exist
     raise HTTPException(status_code=404, detail="Job not found")
 
-@app.get("/api/download/{file_id}")
-def download_file(file_id: str):
+@app.get("/api/events/{job_id}")
+async def stream_job_status(job_id: str, request: Request):
+    """
+    Push job status updates as Server-Sent Events until the job finishes
+    """
+    job_info = await run_in_threadpool(job_store.get, job_id)
+    if job_info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        last_payload = None
+        idle_seconds = 0.0
+        while True:
+            info = await run_in_threadpool(job_store.get, job_id)
+            if info is None:
+                return
+            payload = json.dumps(with_queue_position(job_id, info))
+            if payload != last_payload:
+                last_payload = payload
+                idle_seconds = 0.0
+                yield f"data: {payload}\n\n"
+            elif idle_seconds >= 15:
+                # Keep-alive comment so proxies do not close the connection
+                idle_seconds = 0.0
+                yield ": keep-alive\n\n"
+            
+            if info["status"] in ("completed", "failed") or await request.is_disconnected():
+                return
+            
+            await asyncio.sleep(1)
+            idle_seconds += 1
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def with_queue_position(job_id: str, job_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add the current queue position to a pending job's status
+    """
+    if job_info.get("status") == "pending":
+        return {**job_info, "queue_position": job_queue.position(job_id)}
+    return job_info
+
+@app.api_route("/api/download/{file_id}", methods=["GET", "HEAD"])
+def download_file(file_id: str, request: Request):
+    # Only accept generated IDs so the path cannot escape the outputs directory
+    if not all(c in "0123456789abcdef-" for c in file_id):
+        raise HTTPException(status_code=404, detail="File not found")
+    
     # Construct file path
     file_path = f"./temp/outputs/{file_id}.mp4"
     
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
-        
-    return FileResponse(
+    
+    storage_manager.touch(file_path)
+    return file_response(
+        request,
         file_path,
         media_type="video/mp4",
         filename=f"bgm_{file_id}.mp4"
     )
 
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """
+    Get result cache hit/miss counters
+    """
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Expose pipeline, queue and storage metrics in the Prometheus text format
+    """
+    text = await run_in_threadpool(collect_metrics)
+    return Response(content=text, media_type="text/plain; version=0.0.4")
+
+def collect_metrics() -> str:
+    """
+    Refresh the scrape-time gauges and render all metrics
+    """
+    queue_stats = job_queue.stats()
+    metrics.queue_depth.set(queue_stats["queued"])
+    metrics.active_jobs.clear()
+    for job_class, count in queue_stats["running"].items():
+        metrics.active_jobs.set(count, job_class=job_class)
+    
+    metrics.temp_disk_bytes.clear()
+    for name in os.listdir("./temp"):
+        path = os.path.join("./temp", name)
+        if os.path.isdir(path):
+            metrics.temp_disk_bytes.set(metrics.directory_size(path), directory=name)
+    
+    return metrics.registry.render(snapshot_dir=METRICS_DIR)
+
 @app.get("/api/profiles")
 def get_audio_profiles():
     """
     Get available audio optimization profiles
     """
-    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
-    
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                return {
-                    "profiles": list(config.get("profiles", {}).keys())
-                }
-        except Exception as e:
-            return {"profiles": ["default"]}
-    
-    return {"profiles": ["default"]}
+    return {"profiles": Config.profile_names()}
+
+@app.get("/api/encoding-tiers")
+def get_encoding_tiers():
+    """
+    Get available encoding tiers and the default one
+    """
+    return {"tiers": Config.tier_names(), "default": Config.get_tier()[0]}
+
+# Storage maintenance
+@app.on_event("startup")
+async def setup_storage_maintenance():
+    asyncio.create_task(storage_maintenance())
+
+@app.on_event("startup")
+async def prebuild_default_background():
+    """
+    Encode the default background track in the background at startup
+    """
+    video_config = Config.section("video")
+    if video_config.get("prebuild_default_background", True):
+        asyncio.create_task(run_in_threadpool(
+            prebuild_default_segments, video_config.get("motion_type", "zoom")
+        ))
+
+@app.on_event("startup")
+async def precompute_profile_filters():
+    """
+    Design the filters of every frequency profile before the first job needs them
+    """
+    asyncio.create_task(run_in_threadpool(FrequencyOptimizer.precompute_filters))
 
-# Cleanup task
 @app.on_event("startup")
-async def setup_periodic_cleanup():
-    asyncio.create_task(periodic_cleanup())
+def start_embedded_worker():
+    if embedded_worker is not None:
+        embedded_worker.start()
 
-async def periodic_cleanup():
+@app.on_event("shutdown")
+def stop_embedded_worker():
+    # Running jobs have their ffmpeg processes stopped and go back to the queue for another worker
+    if embedded_worker is not None:
+        embedded_worker.stop(wait=False)
+
+def serve_cached_video(job_id: str, video_key: str) -> bool:
     """
-    Periodically clean up old files
+    Complete a job with a previously rendered video from the result cache
+    
+    Returns:
+        Whether the video was cached
     """
+    cached_video = result_cache.get("video", video_key, ".mp4")
+    if not cached_video:
+        return False
+    file_id = str(uuid.uuid4())
+    output_file = ResultCache.link_or_copy(cached_video, os.path.join("./temp/outputs", f"{file_id}.mp4"))
+    storage_manager.track(output_file, "output", job_id)
+    create_job(job_id, "completed", 100, "Video ready", file_id=file_id)
+    return True
+
+def reject_job(job_id: str, file_paths: List[Optional[str]]):
+    """
+    Fail a job the queue had no room for and delete its uploads
+    """
+    update_job_status(job_id, "failed", 0, "Error: server is busy, please try again later")
+    discard_uploads(file_paths)
+
+def discard_uploads(file_paths: List[Optional[str]]):
+    """
+    Delete the uploaded files of a job that will not run
+    """
+    for file_path in file_paths:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+def track_uploads(job_id: str, file_paths: List[Optional[str]]):
+    """
+    Register a job's uploaded files with the storage manager
+    """
+    for file_path in file_paths:
+        if file_path:
+            storage_manager.track(file_path, "upload", job_id)
+
+async def storage_maintenance():
+    """
+    Keep ./temp within its quota
+    
+    Every check_interval seconds, leftovers of interrupted renders are swept
+    (whenever no job is running), uploads and outputs older than the
+    retention period are deleted and artifacts are evicted (least recently
+    used first) while the quota is exceeded or the disk is low on space.
+    All file system work runs in the threadpool.
+    """
+    storage_config = Config.section("storage")
     while True:
-        # Clean up files older than 24 hours
-        cleanup_old_files("./temp/uploads", hours=24)
-        cleanup_old_files("./temp/outputs", hours=24)
-        cleanup_old_files("./temp/jobs", hours=24)
+        try:
+            await run_in_threadpool(run_storage_maintenance, storage_config.get("retention_hours", 24))
+        except Exception as e:
+            print(f"Error during storage maintenance: {e}")
         
-        # Wait for 1 hour
-        await asyncio.sleep(3600)
+        await asyncio.sleep(storage_config.get("check_interval", 300))
 
-def cleanup_old_files(directory: str, hours: int = 24):
+def run_storage_maintenance(retention_hours: float):
     """
-    Delete files older than specified hours
+    Sweep render leftovers, expire old uploads, outputs and jobs, then enforce the storage quota
     """
-    now = datetime.now()
-    cutoff = now - timedelta(hours=hours)
+    removed = storage.sweep()
+    if removed:
+        print(f"Removed {removed} orphaned temp file(s)")
+    storage.expire(["upload", "output"], retention_hours)
+    job_store.delete_older_than(hours=retention_hours)
     
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-        if os.path.isfile(file_path):
-            file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-            if file_modified < cutoff:
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting file {file_path}: {e}")
+    # Keep the result cache within its own size limit
+    result_cache.evict()
+    storage.enforce()
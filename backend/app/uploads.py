@@ -0,0 +1,133 @@
+import os
+import hashlib
+from typing import Optional, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from processors import metrics
+
+
+class UploadRejected(Exception):
+    """
+    Raised when an upload fails validation
+
+    Attributes:
+        status_code: HTTP status code to report (413 or 415)
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_audio(header: bytes) -> Optional[str]:
+    """
+    Detect an audio container from its first bytes
+
+    Returns:
+        File extension for the detected format, or None if not audio
+    """
+    if header.startswith(b'ID3'):
+        return ".mp3"
+    if len(header) >= 2 and header[0] == 0xFF:
+        if header[1] & 0xF6 == 0xF0:
+            return ".aac"
+        if header[1] & 0xE0 == 0xE0:
+            return ".mp3"
+    if header.startswith(b'RIFF') and header[8:12] == b'WAVE':
+        return ".wav"
+    if header.startswith(b'fLaC'):
+        return ".flac"
+    if header.startswith(b'OggS'):
+        return ".ogg"
+    if header.startswith(b'FORM') and header[8:12] in (b'AIFF', b'AIFC'):
+        return ".aiff"
+    if header[4:8] == b'ftyp':
+        return ".m4a"
+    return None
+
+
+def sniff_image(header: bytes) -> Optional[str]:
+    """
+    Detect an image format from its first bytes
+
+    Returns:
+        File extension for the detected format, or None if not an image
+    """
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return ".png"
+    if header.startswith(b'\xff\xd8\xff'):
+        return ".jpg"
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return ".gif"
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return ".webp"
+    if header.startswith(b'BM'):
+        return ".bmp"
+    return None
+
+
+SNIFFERS = {
+    "audio": sniff_audio,
+    "image": sniff_image,
+}
+
+
+async def save_upload(upload: UploadFile, upload_dir: str, name: str, kind: str,
+                      max_bytes: int, chunk_size: int = 1024 * 1024) -> Tuple[str, str]:
+    """
+    Copy an upload to the uploads directory in chunks while hashing it
+
+    The first chunk is checked against known audio/image signatures before
+    anything is written, and the copy is aborted as soon as it exceeds
+    max_bytes. The client-supplied filename is never used in the path.
+
+    These checks keep bad files out of the uploads directory, but they do
+    not save bandwidth: FastAPI has already received the whole multipart
+    body into its own spooled temporary file when the endpoint runs, so a
+    rejected upload has still been transferred in full and an accepted one
+    is written twice. Hashing runs on the thread pool, off the event loop.
+
+    Args:
+        upload: Uploaded file
+        upload_dir: Directory to write to
+        name: Base name for the stored file (without extension)
+        kind: "audio" or "image"
+        max_bytes: Maximum accepted size in bytes
+        chunk_size: Read size in bytes
+
+    Returns:
+        Tuple of the stored file path and the SHA-256 hex digest of its contents
+
+    Raises:
+        UploadRejected: If the payload is not of the expected kind or too large
+    """
+    header = await upload.read(chunk_size)
+    ext = SNIFFERS[kind](header)
+    if ext is None:
+        raise UploadRejected(415, f"Unsupported {kind} file")
+
+    file_path = os.path.join(upload_dir, f"{name}{ext}")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            chunk = header
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"{kind.capitalize()} file exceeds {max_bytes} bytes")
+                await run_in_threadpool(digest.update, chunk)
+                await buffer.write(chunk)
+                chunk = await upload.read(chunk_size)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    metrics.upload_bytes.inc(size, kind=kind)
+    return file_path, digest.hexdigest()
@@ -0,0 +1,227 @@
+"""
+Rendering worker
+
+Claims jobs from the shared job queue and runs them. Start one or more with
+
+    python -m app.worker [--concurrency N]
+
+from the backend directory. Workers only need access to the job database
+and the ./temp directory, so they can run on other machines that share it.
+"""
+import os
+import sys
+import uuid
+import socket
+import signal
+import time
+import argparse
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from processors import metrics, storage_manager
+from processors.config import Config
+from processors.ffmpeg_runner import FFmpegRunner
+from processors.storage_manager import get_storage_manager
+from app.job_queue import SQLiteJobQueue, create_job_queue
+from app.job_store import TERMINAL_STATUSES
+from app.jobs import job_store, process_job, process_batch_job, update_job_status
+
+# Where standalone workers publish their metrics for the API's /metrics endpoint
+METRICS_DIR = "./temp/metrics"
+
+# Job functions by the job_type stored in the queue
+JOB_TYPES: Dict[str, Callable] = {
+    "single": process_job,
+    "batch": process_batch_job,
+}
+
+
+class Worker:
+    """
+    Pulls jobs from the queue on a fixed number of threads
+
+    Each running job is kept leased by a heartbeat. Leases that other workers
+    let expire are re-queued by whichever worker polls next. A job whose lease
+    is lost anyway (e.g. after a long stall) is cancelled here, since another
+    worker may already be running it.
+    """
+
+    def __init__(self, queue: SQLiteJobQueue, concurrency: int = 1, poll_interval: float = 1.0,
+                 heartbeat_interval: float = 15.0, worker_id: Optional[str] = None):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._running: Set[str] = set()
+        self._interrupted: Set[str] = set()
+
+    def start(self):
+        """
+        Start the worker threads in the background
+        """
+        for n in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait: bool = False, timeout: float = 10.0):
+        """
+        Stop claiming jobs
+
+        Args:
+            wait: Let running jobs finish. Otherwise their ffmpeg processes are
+                  stopped and the jobs are put back in the queue.
+            timeout: Seconds to wait for interrupted jobs to hand back their leases
+        """
+        self._stopping.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            return
+
+        with self._lock:
+            running = set(self._running)
+            self._interrupted |= running
+        for job_id in running:
+            FFmpegRunner.cancel(job_id)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._requeue_expired()
+                claimed = self.queue.claim(self.worker_id)
+            except Exception as e:
+                print(f"Worker {self.worker_id} could not poll the queue: {e}")
+                claimed = None
+
+            if claimed is None:
+                self._stopping.wait(self.poll_interval)
+                continue
+
+            job_id, job_type, params = claimed
+            if self._stopping.is_set():
+                # Claimed while stop() was running: leave it to another worker
+                self.queue.release(job_id, self.worker_id)
+                break
+            self._run_job(job_id, job_type, params)
+
+    def _requeue_expired(self):
+        requeued, abandoned = self.queue.requeue_expired()
+        for job_id in requeued:
+            update_job_status(job_id, "pending", 0, "Worker stopped responding, job queued again")
+        for job_id in abandoned:
+            update_job_status(job_id, "failed", 0, "Error: job was interrupted too many times")
+
+    def _run_job(self, job_id: str, job_type: str, params: Dict):
+        done = threading.Event()
+        lost = threading.Event()
+
+        def keep_leased():
+            while not done.wait(self.heartbeat_interval):
+                if not self.queue.heartbeat(job_id, self.worker_id):
+                    # The job may already run elsewhere: stop rendering it here
+                    print(f"Worker {self.worker_id} lost the lease on job {job_id}, cancelling it")
+                    lost.set()
+                    FFmpegRunner.cancel(job_id)
+                    return
+
+        with self._lock:
+            self._running.add(job_id)
+        heartbeat = threading.Thread(target=keep_leased, name=f"heartbeat-{job_id}", daemon=True)
+        heartbeat.start()
+        try:
+            fn = JOB_TYPES.get(job_type)
+            if fn is None:
+                update_job_status(job_id, "failed", 0, f"Error: unknown job type '{job_type}'")
+            else:
+                # Job functions record their own failures in the job store; the shared
+                # artifacts they read stay pinned against eviction until they return
+                with FFmpegRunner.job_scope(job_id), storage_manager.job_scope(job_id):
+                    fn(job_id=job_id, **params)
+        except Exception as e:
+            print(f"Job {job_id} raised an unhandled error: {e}")
+            with self._lock:
+                cancelled = lost.is_set() or job_id in self._interrupted
+            if not cancelled:
+                update_job_status(job_id, "failed", 0, f"Error: {str(e)}")
+        finally:
+            done.set()
+            heartbeat.join()
+            with self._lock:
+                self._running.discard(job_id)
+                interrupted = job_id in self._interrupted
+                self._interrupted.discard(job_id)
+            if interrupted and not self._finished(job_id):
+                if self.queue.release(job_id, self.worker_id):
+                    update_job_status(job_id, "pending", 0, "Worker stopped, job queued again")
+            else:
+                self.queue.complete(job_id, self.worker_id)
+
+    @staticmethod
+    def _finished(job_id: str) -> bool:
+        job = job_store.get(job_id)
+        return job is None or job["status"] in TERMINAL_STATUSES
+
+
+def create_worker(concurrency: Optional[int] = None) -> Worker:
+    """
+    Create a worker from the "jobs" config section
+    """
+    jobs_config = Config.section("jobs")
+    queue = create_job_queue(jobs_config)
+
+    # Evictions triggered by this worker's outputs skip the files of queued and running jobs
+    get_storage_manager().active_jobs = queue.active_job_ids
+    get_storage_manager().running_jobs = queue.leased_job_ids
+    return Worker(
+        queue,
+        concurrency=concurrency or jobs_config.get("worker_concurrency", 2),
+        poll_interval=jobs_config.get("poll_interval", 1.0),
+        heartbeat_interval=jobs_config.get("heartbeat_interval", 15.0)
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run rendering jobs from the shared job queue")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Number of jobs run at the same time (default: jobs.worker_concurrency)")
+    args = parser.parse_args(argv)
+
+    worker = create_worker(args.concurrency)
+    stopped = threading.Event()
+
+    def request_stop(signum, frame):
+        # Finish running jobs, then exit; a second signal stops them and re-queues them
+        if stopped.is_set():
+            print("Stopping running jobs...")
+            worker.stop(wait=False)
+            sys.exit(1)
+        print("Stopping after the running jobs finish...")
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    os.makedirs("./temp/outputs", exist_ok=True)
+    print(f"Worker {worker.worker_id} started with {worker.concurrency} slot(s)")
+    worker.start()
+
+    # The API adds these counters to its own /metrics output
+    snapshot_path = os.path.join(METRICS_DIR, f"{worker.worker_id}.json")
+    interval = Config.section("jobs").get("metrics_interval", 15)
+    while not stopped.wait(interval):
+        metrics.registry.write_snapshot(snapshot_path)
+    worker.stop(wait=True)
+    metrics.registry.write_snapshot(snapshot_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""
+Benchmarks for the audio and video pipeline
+
+Run from the backend directory:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare baseline.json results.json
+
+Synthetic fixtures are generated locally, so no media files are needed.
+"""
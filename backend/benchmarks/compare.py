@@ -0,0 +1,66 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.10]
+
+Prints the change in wall time, CPU time and peak RSS for every stage
+measured in both files and exits with status 1 if any stage got slower
+than the threshold allows.
+"""
+import sys
+import json
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+METRICS = ("wall_s", "cpu_s", "peak_rss_mb")
+
+
+def load(path: str) -> Dict[Tuple, Dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r["suite"], r["case"], r["stage"], r["duration"]): r
+            for r in report["results"] if not r.get("error")}
+
+
+def change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative wall/CPU time increase reported as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.5,
+                        help="Ignore stages faster than this in the baseline (too noisy)")
+    args = parser.parse_args(argv)
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    regressions = 0
+    print(f"{'stage':60} " + " ".join(f"{m:>16}" for m in METRICS))
+    for key in sorted(set(baseline) & set(candidate), key=str):
+        old, new = baseline[key], candidate[key]
+        changes = {m: change(old.get(m), new.get(m)) for m in METRICS}
+        regressed = old["wall_s"] >= args.min_seconds and any(
+            changes[m] is not None and changes[m] > args.threshold for m in ("wall_s", "cpu_s")
+        )
+        regressions += regressed
+
+        suite, case, stage, duration = key
+        label = f"{suite}/{case}/{stage}" + (f"@{duration}s" if duration else "")
+        cells = " ".join(f"{new.get(m)!s:>8} ({changes[m]:+6.1%})" if changes[m] is not None else f"{'-':>16}"
+                         for m in METRICS)
+        print(f"{label:60} {cells}{'  REGRESSION' if regressed else ''}")
+
+    missing = set(baseline) - set(candidate)
+    if missing:
+        print(f"{len(missing)} stage(s) from the baseline are missing or failed in the candidate")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import subprocess
+from typing import Dict, List
+
+import numpy as np
+import soundfile as sf
+from PIL import Image
+
+# Synthetic audio sources: (name, kind, seconds, sample rate, channels)
+AUDIO_FIXTURES = [
+    ("sine_44k_stereo", "sine", 180, 44100, 2),
+    ("noise_48k_mono", "noise", 60, 48000, 1),
+    ("music_44k_stereo", "music", 180, 44100, 2),
+    ("music_22k_mono", "music", 120, 22050, 1),
+]
+
+# Synthetic images: (name, kind, width, height, format)
+IMAGE_FIXTURES = [
+    ("gradient_1080p", "gradient", 1920, 1080, "JPEG"),
+    ("noise_12mp", "noise", 4000, 3000, "PNG"),
+    ("gradient_small", "gradient", 640, 480, "JPEG"),
+]
+
+
+def synth_audio(kind: str, seconds: float, samplerate: int, channels: int, seed: int = 0) -> np.ndarray:
+    """
+    Generate a synthetic signal
+
+    Args:
+        kind: "sine" (440 Hz tone), "noise" (pink-ish noise) or "music"
+              (a chord progression with bass, envelopes and a noisy hi-hat)
+        seconds: Length in seconds
+        samplerate: Sample rate in Hz
+        channels: Number of channels (1 or 2)
+        seed: Random seed
+
+    Returns:
+        float32 array of shape (frames, channels) in [-1, 1]
+    """
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * samplerate)
+    t = np.arange(frames) / samplerate
+
+    if kind == "sine":
+        mono = 0.5 * np.sin(2 * np.pi * 440 * t)
+    elif kind == "noise":
+        # Integrated white noise tilts the spectrum towards low frequencies
+        white = rng.standard_normal(frames)
+        mono = np.cumsum(white)
+        mono -= np.convolve(mono, np.ones(256) / 256, mode="same")
+    elif kind == "music":
+        chords = [(261.6, 329.6, 392.0), (220.0, 261.6, 329.6), (174.6, 220.0, 261.6), (196.0, 246.9, 293.7)]
+        beat = 0.5
+        mono = np.zeros(frames)
+        bar_frames = int(4 * beat * samplerate)
+        for start in range(0, frames, bar_frames):
+            chord = chords[(start // bar_frames) % len(chords)]
+            segment = t[start:start + bar_frames] - t[start]
+            envelope = np.exp(-segment * 0.8)
+            tones = sum(np.sin(2 * np.pi * f * segment) for f in chord) / len(chord)
+            bass = np.sin(2 * np.pi * chord[0] / 2 * segment)
+            mono[start:start + bar_frames] = 0.4 * envelope * tones + 0.3 * bass * envelope
+        # Hi-hat: short noise bursts on every beat
+        beat_frames = int(beat * samplerate)
+        burst = rng.standard_normal(beat_frames) * np.exp(-np.arange(beat_frames) / (0.02 * samplerate))
+        for start in range(0, frames - beat_frames, beat_frames):
+            mono[start:start + beat_frames] += 0.1 * burst
+    else:
+        raise ValueError(f"Unknown audio fixture kind: {kind}")
+
+    mono = mono / (np.max(np.abs(mono)) or 1.0) * 0.8
+    if channels == 1:
+        return mono[:, np.newaxis].astype(np.float32)
+    # Slightly decorrelated right channel
+    right = np.roll(mono, int(0.0005 * samplerate))
+    return np.column_stack([mono, right]).astype(np.float32)
+
+
+def synth_image(kind: str, width: int, height: int, seed: int = 0) -> Image.Image:
+    """
+    Generate a synthetic RGB image ("gradient" or "noise")
+    """
+    if kind == "gradient":
+        x = np.linspace(0, 255, width)[np.newaxis, :]
+        y = np.linspace(0, 255, height)[:, np.newaxis]
+        pixels = np.stack([np.broadcast_to(x, (height, width)),
+                           np.broadcast_to(y, (height, width)),
+                           (x + y) / 2 * np.ones((height, width))], axis=2)
+    elif kind == "noise":
+        pixels = np.random.default_rng(seed).integers(0, 256, (height, width, 3))
+    else:
+        raise ValueError(f"Unknown image fixture kind: {kind}")
+    return Image.fromarray(pixels.astype(np.uint8), "RGB")
+
+
+def build_fixtures(fixture_dir: str) -> Dict[str, List[Dict]]:
+    """
+    Generate all fixtures (skipping ones that already exist)
+
+    Audio is written as MP3, like a typical upload.
+
+    Returns:
+        Dict with "audio" and "image" lists describing each fixture and its path
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    fixtures: Dict[str, List[Dict]] = {"audio": [], "image": []}
+
+    for name, kind, seconds, samplerate, channels in AUDIO_FIXTURES:
+        path = os.path.join(fixture_dir, f"{name}.mp3")
+        if not os.path.exists(path):
+            wav_path = os.path.join(fixture_dir, f"{name}.wav")
+            sf.write(wav_path, synth_audio(kind, seconds, samplerate, channels), samplerate)
+            subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', wav_path, '-q:a', '2', path], check=True)
+            os.remove(wav_path)
+        fixtures["audio"].append({"name": name, "kind": kind, "seconds": seconds,
+                                  "sample_rate": samplerate, "channels": channels, "path": path})
+
+    for name, kind, width, height, image_format in IMAGE_FIXTURES:
+        path = os.path.join(fixture_dir, f"{name}.{'jpg' if image_format == 'JPEG' else 'png'}")
+        if not os.path.exists(path):
+            synth_image(kind, width, height).save(path, format=image_format)
+        fixtures["image"].append({"name": name, "kind": kind, "width": width, "height": height, "path": path})
+
+    return fixtures
@@ -0,0 +1,75 @@
+import sys
+import time
+import resource
+import traceback
+import multiprocessing
+from typing import Any, Callable, Dict
+
+
+def _usage() -> Dict[str, float]:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        "own_maxrss": own.ru_maxrss,
+        "children_maxrss": children.ru_maxrss,
+    }
+
+
+def _to_mb(maxrss: float) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def _measure_here(fn: Callable, args: tuple) -> Dict[str, Any]:
+    before = _usage()
+    started = time.perf_counter()
+    error = None
+    try:
+        fn(*args)
+    except Exception:
+        error = traceback.format_exc(limit=3)
+    wall = time.perf_counter() - started
+    after = _usage()
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(after["cpu"] - before["cpu"], 4),
+        "peak_rss_mb": round(_to_mb(after["own_maxrss"]), 1),
+        "peak_child_rss_mb": round(_to_mb(after["children_maxrss"]), 1),
+        "error": error,
+    }
+
+
+def _child(conn, fn: Callable, args: tuple):
+    conn.send(_measure_here(fn, args))
+    conn.close()
+
+
+def measure(fn: Callable, *args) -> Dict[str, Any]:
+    """
+    Run fn(*args) and record wall time, CPU time and peak RSS
+
+    The call runs in a forked process, so peak RSS belongs to this call only.
+    CPU time includes ffmpeg and other child processes; peak_child_rss_mb is
+    the largest child process.
+
+    Returns:
+        Dict with "wall_s", "cpu_s", "peak_rss_mb", "peak_child_rss_mb" and
+        "error" (traceback text, or None on success)
+    """
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        return _measure_here(fn, args)
+
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(sender, fn, args))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"wall_s": None, "cpu_s": None, "peak_rss_mb": None, "peak_child_rss_mb": None,
+                  "error": f"benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return result
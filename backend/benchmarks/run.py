@@ -0,0 +1,477 @@
+"""
+Time each pipeline stage across target durations and write the results as JSON
+
+    python -m benchmarks.run [--durations 600,3600,36000] [--suites audio,video]
+                             [--quick] [--output results.json]
+
+Suites:
+    audio     Each process_audio stage (frequency adjust while decoding to a
+              PCM buffer, EQ on files and on decoded PCM buffers, loop point
+              analysis, loudness measurement, loop, normalize) for every
+              audio fixture and duration, plus a check that loop point
+              analysis of a 5 minute clip stays within --loop-analysis-budget
+              seconds
+    pipelines single_pass vs multi_pass process_audio end to end (and single_pass
+              with a frequency adjustment, which it applies inline), plus a check
+              that both render equivalent audio (duration, loudness, RMS
+              and band energy in the profile's low and cry ranges, within
+              --equivalence-tolerance dB) for each loop mode
+    video     Each process_video stage (image decode, still segment, mux,
+              motion cycle) plus the full-encode path it replaces
+    no_image  Jobs without an image (prebuilt default background) vs audio time
+    tiers     Still segment, motion cycle and full encode for every encoding
+              tier, with throughput (x realtime) and output bitrate
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+from processors.config import Config
+from processors.audio_looper import AudioLooper
+from processors.audio_processor import AudioProcessor
+from processors.frequency_optimizer import FrequencyOptimizer
+from processors.loop_finder import LoopFinder
+from processors.pcm_buffer import PCMBuffer
+from processors.image_preprocessor import ImagePreprocessor
+from processors.video_processor import VideoProcessor
+from benchmarks.fixtures import build_fixtures, synth_audio
+from benchmarks.measure import measure
+
+DEFAULT_DURATIONS = [600, 3600, 14400, 36000]
+QUICK_DURATIONS = [60, 600]
+SUITES = ["audio", "pipelines", "video", "no_image", "tiers"]
+DEFAULT_IMAGE = "./assets/default_background.jpg"
+
+
+class Benchmark:
+    """
+    Collects measurements and writes them to one JSON document
+    """
+
+    def __init__(self, workdir: str, durations: List[int], max_legacy_duration: int):
+        self.workdir = workdir
+        self.durations = durations
+        self.max_legacy_duration = max_legacy_duration
+        self.results: List[Dict[str, Any]] = []
+        self.checks: List[Dict[str, Any]] = []
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.workdir, *parts)
+
+    def record(self, suite: str, case: str, stage: str, duration: Optional[int], fn, *args, **extra) -> Dict:
+        """
+        Measure one stage and add it to the results
+        """
+        print(f"[{suite}] {case} {stage} {duration or '-'}s ...", end=" ", flush=True)
+        result = {"suite": suite, "case": case, "stage": stage, "duration": duration,
+                  **extra, **measure(fn, *args)}
+        if result["error"]:
+            print("FAILED")
+            print(result["error"])
+        else:
+            print(f"{result['wall_s']:.2f}s wall, {result['cpu_s']:.2f}s CPU, "
+                  f"{result['peak_rss_mb']} MB")
+        self.results.append(result)
+        return result
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Fit wall time = fixed + per_hour * hours for every stage measured at several durations
+
+        A per_hour close to zero means the stage cost does not grow with the
+        target duration.
+        """
+        series: Dict[tuple, List[tuple]] = {}
+        for r in self.results:
+            if r["duration"] and r["wall_s"] is not None and not r["error"]:
+                series.setdefault((r["suite"], r["case"], r["stage"]), []).append((r["duration"] / 3600, r["wall_s"]))
+
+        fits = []
+        for (suite, case, stage), points in sorted(series.items()):
+            if len({hours for hours, _ in points}) < 2:
+                continue
+            hours, walls = np.array(points).T
+            per_hour, fixed = np.polyfit(hours, walls, 1)
+            fits.append({"suite": suite, "case": case, "stage": stage,
+                         "fixed_s": round(float(fixed), 3), "per_hour_s": round(float(per_hour), 3)})
+        return fits
+
+
+def run_audio(bench: Benchmark, audio_fixtures: List[Dict]):
+    crossfade = Config.section("audio").get("crossfade_duration", 3.0)
+    sample_rate = Config.section("audio").get("sample_rate", 44100)
+    for fixture in audio_fixtures:
+        case, source = fixture["name"], fixture["path"]
+        out = lambda name: bench.path("audio", f"{case}_{name}")
+
+        # Stages whose cost depends only on the source length
+        bench.record("audio", case, "probe", None, AudioProcessor.get_audio_duration, source)
+        # Frequency adjustment happens in the PCM decode (compare with "decode" below)
+        bench.record("audio", case, "frequency_adjust", None,
+                     PCMBuffer.decode, source, out("freq.f32"), sample_rate, 2, 1.05)
+        PCMBuffer.delete(out("freq.f32"))
+        bench.record("audio", case, "optimize_source", None,
+                     FrequencyOptimizer.optimize_audio, source, out("optimized.wav"), "default", None, None, crossfade)
+        bench.record("audio", case, "decode", None, AudioProcessor.decode_source, source, out("decoded.f32"))
+        bench.record("audio", case, "loop_points", None, find_loop_points, out("decoded.f32"), crossfade)
+        bench.record("audio", case, "optimize_buffer", None,
+                     optimize_buffer, out("decoded.f32"), out("optimized.f32"), crossfade)
+        bench.record("audio", case, "loudness_measure", None, AudioLooper.measure_loudness, out("optimized.f32"))
+
+        for duration in bench.durations:
+            looped = out(f"loop_{duration}.mp3")
+            bench.record("audio", case, "loop", duration,
+                         AudioLooper.combine_audio_with_loops, out("optimized.wav"), looped, duration)
+            bench.record("audio", case, "normalize", duration,
+                         AudioLooper.normalize_audio_volume, looped, out(f"norm_{duration}.mp3"), duration)
+            if duration <= bench.max_legacy_duration:
+                bench.record("audio", case, "optimize_looped", duration,
+                             FrequencyOptimizer.optimize_audio, looped, out(f"looped_opt_{duration}.wav"), "default")
+            for name in (f"loop_{duration}.mp3", f"norm_{duration}.mp3", f"looped_opt_{duration}.wav"):
+                if os.path.exists(out(name)):
+                    os.remove(out(name))
+
+
+def run_loop_analysis(bench: Benchmark, budget_s: float, seconds: int = 300):
+    """
+    Loop point analysis of a 5 minute clip has to finish within budget_s
+
+    The clip is written straight to a PCM buffer, so only the analysis on
+    the memory-mapped samples is timed (no decode).
+    """
+    audio_config = Config.section("audio")
+    crossfade = audio_config.get("crossfade_duration", 3.0)
+    sample_rate = audio_config.get("sample_rate", 44100)
+    path = bench.path("audio", f"loop_analysis_{seconds}s.f32")
+    data = synth_audio("music", seconds, sample_rate, 2)
+    buffer = PCMBuffer.create(path, sample_rate, 2, len(data))
+    buffer.samples[:] = data
+    buffer.close()
+
+    case = f"music_{seconds}s"
+    result = bench.record("audio", case, "loop_points", None, find_loop_points, path, crossfade)
+    check = {"suite": "audio", "case": case, "stage": "loop_points", "wall_s": result["wall_s"],
+             "budget_s": budget_s}
+    check["passed"] = not result["error"] and result["wall_s"] <= budget_s
+    print(f"[audio] {case}: loop point analysis {result['wall_s']}s (budget {budget_s}s) "
+          f"-> {'ok' if check['passed'] else 'TOO SLOW'}")
+    bench.checks.append(check)
+    PCMBuffer.delete(path)
+
+
+def find_loop_points(buffer_path: str, crossfade: float) -> tuple:
+    buffer = PCMBuffer.open(buffer_path)
+    return LoopFinder.find_loop_points(buffer.samples, buffer.sample_rate, int(crossfade * buffer.sample_rate))
+
+
+def optimize_buffer(buffer_path: str, output_path: str, crossfade: float) -> str:
+    return FrequencyOptimizer.optimize_buffer(PCMBuffer.open(buffer_path), output_path, "default", crossfade).path
+
+
+def run_pipelines(bench: Benchmark, audio_fixtures: List[Dict]):
+    for fixture in audio_fixtures:
+        for duration in bench.durations:
+            for stage, pipeline, frequency in (("single_pass", "single_pass", None),
+                                               ("single_pass_frequency", "single_pass", 1.05),
+                                               ("multi_pass", "multi_pass", None)):
+                output_dir = bench.path("pipelines", f"{fixture['name']}_{stage}_{duration}")
+                os.makedirs(output_dir, exist_ok=True)
+                bench.record("pipelines", fixture["name"], stage, duration,
+                             AudioProcessor.process_audio, fixture["path"], output_dir, duration,
+                             frequency, 0, 0, "default", True, pipeline)
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def run_equivalence(bench: Benchmark, audio_fixtures: List[Dict], tolerance_db: float, duration: int = 120,
+                    duration_tolerance: float = 0.1):
+    """
+    Render the same input with both pipelines and compare the outputs
+
+    The single pass runs the EQ inside the ffmpeg graph in fade mode (pan +
+    firequalizer) while the multi pass filters the PCM buffer with SOS
+    biquads, so the two are only equivalent if their levels and band
+    energies agree.
+    """
+    _, profile = Config.get_profile("default")
+    bands = {"low": profile["low_freq_range"], "cry": profile["cry_freq_range"]}
+    for fixture in audio_fixtures:
+        for loop_mode in ("crossfade", "fade"):
+            case = f"{fixture['name']}_{loop_mode}"
+            output_dir = bench.path("pipelines", f"{case}_equivalence")
+            os.makedirs(output_dir, exist_ok=True)
+            try:
+                with Config.override(audio={"loop_mode": loop_mode}):
+                    # Called directly: process_audio would silently fall back to the multi pass
+                    rendered = {
+                        "single_pass": AudioProcessor.process_audio_single_pass(
+                            fixture["path"], os.path.join(output_dir, "single_pass.mp3"), duration),
+                        "multi_pass": AudioProcessor.process_audio(
+                            fixture["path"], output_dir, duration, None, 0, 0, "default", True, "multi_pass"),
+                    }
+                stats = {pipeline: audio_stats(path, bands) for pipeline, path in rendered.items()}
+            except Exception as e:
+                check = {"suite": "pipelines", "case": case, "duration": duration, "error": str(e), "passed": False}
+                print(f"[pipelines] {case}: equivalence check FAILED: {e}")
+                bench.checks.append(check)
+                continue
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+            diffs = {key: round(abs(stats["single_pass"][key] - stats["multi_pass"][key]), 3)
+                     for key in stats["single_pass"]}
+            check = {
+                "suite": "pipelines", "case": case, "duration": duration,
+                "single_pass": stats["single_pass"], "multi_pass": stats["multi_pass"], "diff": diffs,
+                "tolerance_db": tolerance_db, "duration_tolerance_s": duration_tolerance,
+            }
+            check["passed"] = diffs["duration_s"] <= duration_tolerance and all(
+                value <= tolerance_db for key, value in diffs.items() if key != "duration_s"
+            )
+            print(f"[pipelines] {case}: " + ", ".join(f"{key} {value}" for key, value in diffs.items())
+                  + f" -> {'ok' if check['passed'] else 'MISMATCH'}")
+            bench.checks.append(check)
+
+
+def audio_stats(file_path: str, bands: Dict[str, List[float]]) -> Dict[str, float]:
+    """
+    Duration, integrated loudness, RMS level and band energies of a rendered file
+    """
+    data, samplerate = decode(file_path, f"{file_path}.mono.wav")
+    freqs, power = signal.welch(data, samplerate, nperseg=8192)
+    stats = {
+        "duration_s": round(len(data) / samplerate, 3),
+        "loudness_lufs": AudioLooper.measure_loudness(file_path)["input_i"],
+        "rms_db": round(float(20 * np.log10(np.sqrt(np.mean(data ** 2)) + 1e-12)), 3),
+    }
+    for name, (low, high) in bands.items():
+        energy = np.sum(power[(freqs >= low) & (freqs <= high)])
+        stats[f"{name}_band_db"] = round(float(10 * np.log10(energy + 1e-20)), 3)
+    return stats
+
+
+def decode(file_path: str, wav_path: str) -> tuple:
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', file_path, '-ac', '1', wav_path], check=True)
+    data, samplerate = sf.read(wav_path)
+    return data, samplerate
+
+
+def cycle_motion_type() -> str:
+    """
+    The configured motion type if it is periodic, else zoom_cycle (the cycle stages need one)
+    """
+    motion_type = Config.section("video").get("motion_type", "zoom")
+    return motion_type if motion_type in VideoProcessor.PERIODIC_MOTIONS else "zoom_cycle"
+
+
+def run_video(bench: Benchmark, image_fixtures: List[Dict], audio_file: str):
+    video_config = Config.section("video")
+    width, height = video_config.get("resolution", [1280, 720])
+    segment_duration = video_config.get("segment_duration", 10)
+    cycle_duration = video_config.get("motion_cycle_duration", 20)
+    motion_type = cycle_motion_type()
+
+    for fixture in image_fixtures:
+        case = fixture["name"]
+        out = lambda name: bench.path("video", f"{case}_{name}")
+        cache_dir = bench.path("video", f"{case}_images")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+        bench.record("video", case, "image_prepare", None,
+                     ImagePreprocessor.prepare, fixture["path"], cache_dir, (width, height))
+        bench.record("video", case, "image_prepare_cached", None,
+                     ImagePreprocessor.prepare, fixture["path"], cache_dir, (width, height))
+        frame = ImagePreprocessor.prepare(fixture["path"], cache_dir, (width, height))["path"]
+        motion_frame = ImagePreprocessor.prepare(fixture["path"], cache_dir,
+                                                 (width * 3 // 2, height * 3 // 2))["path"]
+
+        bench.record("video", case, "still_segment", None,
+                     VideoProcessor.render_still_segment, frame, out("still.mp4"), segment_duration)
+        bench.record("video", case, "motion_cycle", None,
+                     VideoProcessor.render_motion_cycle, motion_frame, out("cycle.mp4"), motion_type,
+                     cycle_duration, 30, (width, height))
+
+        for duration in bench.durations:
+            bench.record("video", case, "still_mux", duration,
+                         VideoProcessor.mux_looped_segment, out("still.mp4"), audio_file,
+                         out(f"still_{duration}.mp4"), duration, segment_duration)
+            bench.record("video", case, "motion_mux", duration,
+                         VideoProcessor.mux_looped_segment, out("cycle.mp4"), audio_file,
+                         out(f"motion_{duration}.mp4"), duration, cycle_duration)
+            if duration <= bench.max_legacy_duration:
+                bench.record("video", case, "still_full_encode", duration,
+                             VideoProcessor.create_video_from_image, audio_file, frame,
+                             out(f"full_{duration}.mp4"), duration, None, False, False)
+            for name in (f"still_{duration}.mp4", f"motion_{duration}.mp4", f"full_{duration}.mp4"):
+                if os.path.exists(out(name)):
+                    os.remove(out(name))
+
+
+def run_no_image(bench: Benchmark, audio_fixtures: List[Dict]):
+    """
+    Jobs without an image should cost about as much as their audio
+    """
+    motion_type = Config.section("video").get("motion_type", "zoom")
+    VideoProcessor.prebuild_segments(DEFAULT_IMAGE, motion_type)
+    fixture = audio_fixtures[0]
+
+    for duration in bench.durations:
+        output_dir = bench.path("no_image", str(duration))
+        os.makedirs(output_dir, exist_ok=True)
+        audio_file = os.path.join(output_dir, "audio.mp3")
+        audio = bench.record("no_image", fixture["name"], "audio", duration,
+                             AudioProcessor.process_audio_single_pass, fixture["path"], audio_file, duration)
+        for add_motion in (False, True):
+            stage = "video_motion" if add_motion else "video_static"
+            video = bench.record("no_image", fixture["name"], stage, duration,
+                                 VideoProcessor.process_video, audio_file, DEFAULT_IMAGE, output_dir,
+                                 duration, add_motion, motion_type)
+            if audio["wall_s"] and video["wall_s"] is not None:
+                video["video_to_audio_ratio"] = round(video["wall_s"] / audio["wall_s"], 3)
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def run_tiers(bench: Benchmark, image_fixtures: List[Dict], audio_file: str):
+    """
+    Throughput and size of each encoding tier, to pick one for the server load
+    """
+    video_config = Config.section("video")
+    width, height = video_config.get("resolution", [1280, 720])
+    segment_duration = video_config.get("segment_duration", 10)
+    cycle_duration = video_config.get("motion_cycle_duration", 20)
+    motion_type = cycle_motion_type()
+    fixture = image_fixtures[0]
+    cache_dir = bench.path("tiers", "images")
+    frame = ImagePreprocessor.prepare(fixture["path"], cache_dir, (width, height))["path"]
+    motion_frame = ImagePreprocessor.prepare(fixture["path"], cache_dir, (width * 3 // 2, height * 3 // 2))["path"]
+
+    def encode(tier: str, stage: str, duration: Optional[int], seconds: float, output: str, fn, *args) -> None:
+        result = bench.record("tiers", f"{fixture['name']}_{tier}", stage, duration, fn, *args,
+                              tier=tier, encoded_s=seconds)
+        if result["error"] or not os.path.exists(output):
+            return
+        size = os.path.getsize(output)
+        result["output_bytes"] = size
+        result["kbps"] = round(size * 8 / 1000 / seconds, 1)
+        result["realtime_x"] = round(seconds / result["wall_s"], 2) if result["wall_s"] else None
+        os.remove(output)
+
+    for tier in Config.tier_names():
+        out = lambda name: bench.path("tiers", f"{tier}_{name}")
+        encode(tier, "still_segment", None, segment_duration, out("still.mp4"),
+               VideoProcessor.render_still_segment, frame, out("still.mp4"), segment_duration, 25, tier)
+        encode(tier, "motion_cycle", None, cycle_duration, out("cycle.mp4"),
+               VideoProcessor.render_motion_cycle, motion_frame, out("cycle.mp4"), motion_type,
+               cycle_duration, 30, (width, height), tier)
+        # The full encode is the path whose cost grows with duration; the shortest one is enough to compare tiers
+        duration = min(min(bench.durations), bench.max_legacy_duration)
+        encode(tier, "still_full_encode", duration, duration, out("full.mp4"),
+               VideoProcessor.create_video_from_image, audio_file, frame, out("full.mp4"), duration,
+               None, False, False, tier)
+
+
+def environment() -> Dict[str, Any]:
+    def first_line(cmd: List[str]) -> Optional[str]:
+        try:
+            return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                  text=True, check=True).stdout.splitlines()[0]
+        except Exception:
+            return None
+
+    config = Config.get()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": first_line(['git', 'rev-parse', 'HEAD']),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": first_line(['ffmpeg', '-version']),
+        "config": {section: config.get(section, {}) for section in ("audio", "video", "optimizer", "encoding")},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the audio and video pipeline")
+    parser.add_argument("--durations", help="Comma-separated target durations in seconds "
+                                            f"(default: {','.join(map(str, DEFAULT_DURATIONS))})")
+    parser.add_argument("--suites", default=",".join(SUITES), help="Comma-separated suites to run")
+    parser.add_argument("--audio", help="Comma-separated audio fixture names (default: all)")
+    parser.add_argument("--images", help="Comma-separated image fixture names (default: all)")
+    parser.add_argument("--quick", action="store_true",
+                        help="Short durations and one fixture of each kind, for a smoke run")
+    parser.add_argument("--max-legacy-duration", type=int, default=3600,
+                        help="Longest duration at which the slow legacy paths are measured")
+    parser.add_argument("--loop-analysis-budget", type=float, default=1.0,
+                        help="Allowed loop point analysis time (s) for a 5 minute clip")
+    parser.add_argument("--equivalence-tolerance", type=float, default=1.0,
+                        help="Allowed loudness, RMS and band energy difference (dB) between pipelines")
+    parser.add_argument("--workdir", default="./temp/bench")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    durations = QUICK_DURATIONS if args.quick else DEFAULT_DURATIONS
+    if args.durations:
+        durations = [int(d) for d in args.durations.split(",")]
+    suites = args.suites.split(",")
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    fixtures = build_fixtures(os.path.join(args.workdir, "fixtures"))
+    audio_fixtures = fixtures["audio"]
+    image_fixtures = fixtures["image"]
+    if args.audio:
+        audio_fixtures = [f for f in audio_fixtures if f["name"] in args.audio.split(",")]
+    if args.images:
+        image_fixtures = [f for f in image_fixtures if f["name"] in args.images.split(",")]
+    if args.quick:
+        audio_fixtures, image_fixtures = audio_fixtures[:1], image_fixtures[:1]
+
+    for suite in SUITES:
+        os.makedirs(os.path.join(args.workdir, suite), exist_ok=True)
+
+    bench = Benchmark(args.workdir, durations, args.max_legacy_duration)
+    if "audio" in suites:
+        run_audio(bench, audio_fixtures)
+        run_loop_analysis(bench, args.loop_analysis_budget)
+    if "pipelines" in suites:
+        run_pipelines(bench, audio_fixtures)
+        run_equivalence(bench, audio_fixtures, args.equivalence_tolerance)
+    if "video" in suites or "tiers" in suites:
+        # A silent track long enough for every duration keeps audio cost out of the video numbers
+        silence = os.path.join(args.workdir, "video", "silence.m4a")
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
+                        '-t', str(max(durations)), '-c:a', 'aac', silence], check=True)
+        if "video" in suites:
+            run_video(bench, image_fixtures, silence)
+        if "tiers" in suites:
+            run_tiers(bench, image_fixtures, silence)
+    if "no_image" in suites:
+        run_no_image(bench, audio_fixtures)
+
+    report = {
+        "environment": environment(),
+        "durations": durations,
+        "results": bench.results,
+        "summary": bench.summary(),
+        "checks": bench.checks,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(bench.results)} measurements to {args.output}")
+
+    failed = [r for r in bench.results if r["error"]] + [c for c in bench.checks if not c["passed"]]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,52 +1,36 @@
 import os
-import json
 import uuid
 import math
+import json
 import subprocess
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import shutil
 
+from processors.ffmpeg_runner import FFmpegRunner, JobCancelled
+from processors.media_probe import MediaProbe
+from processors.config import Config
+from processors.loop_finder import LoopFinder, LoopUnitUnavailable
+from processors.pcm_buffer import PCMBuffer
+from processors import metrics
+
 class AudioLooper:
     """
     音声ファイルをループ再生し、クロスフェードを適用するクラス
     """
     
+    # 音量正規化に使用するloudnormフィルタ
+    LOUDNORM_FILTER = 'loudnorm=I=-16:LRA=11:TP=-1.5'
+    
+    # 固定ゲインで正規化する場合の目標値（LOUDNORM_FILTERと同じ）
+    LOUDNESS_TARGET = -16.0
+    TRUE_PEAK_TARGET = -1.5
+    
     @staticmethod
     def load_config() -> Dict:
         """
-        設定ファイルを読み込む
+        設定を取得する（読み込みと検証はConfigで一度だけ行い、変更時のみ再読み込みする）
         """
-        # デフォルト設定
-        default_config = {
-            "audio": {
-                "crossfade_duration": 3.0,
-                "sample_rate": 44100,
-                "quality": 2
-            }
-        }
-        
-        # 設定ファイルのパスを確認
-        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
-        
-        # 設定ファイルが存在する場合は読み込み、なければデフォルト設定を使用
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r') as f:
-                    config = json.load(f)
-                return config
-            except Exception as e:
-                print(f"設定ファイルの読み込みに失敗しました: {str(e)}")
-                return default_config
-        else:
-            # 設定ファイルが存在しない場合はデフォルト設定を保存
-            try:
-                os.makedirs(os.path.dirname(config_path), exist_ok=True)
-                with open(config_path, 'w') as f:
-                    json.dump(default_config, f, indent=4)
-            except Exception as e:
-                print(f"デフォルト設定の保存に失敗しました: {str(e)}")
-            
-            return default_config
+        return Config.get()
     
     @staticmethod
     def get_audio_duration(file_path: str) -> float:
@@ -59,19 +43,14 @@ class AudioLooper:
         Returns:
             float: 再生時間（秒）
         """
-        cmd = [
-            'ffprobe', 
-            '-v', 'error', 
-            '-show_entries', 'format=duration', 
-            '-of', 'default=noprint_wrappers=1:nokey=1', 
-            file_path
-        ]
-        
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return float(result.stdout)
+        if PCMBuffer.is_buffer(file_path):
+            return PCMBuffer.open(file_path).duration
+        return MediaProbe.get_duration(file_path)
     
     @staticmethod
-    def apply_fade_effects(input_file: str, output_file: str, fade_in: float, fade_out: float, duration: float) -> str:
+    @metrics.timed("fade")
+    def apply_fade_effects(input_file: str, output_file: str, fade_in: float, fade_out: float, duration: float,
+                           on_progress: Optional[Callable[[float], None]] = None) -> str:
         """
         フェードイン・フェードアウト効果を適用する
         
@@ -81,6 +60,7 @@ class AudioLooper:
             fade_in: フェードインの時間（秒）
             fade_out: フェードアウトの時間（秒）
             duration: ファイルの再生時間
+            on_progress: 進捗（0.0〜1.0）を受け取るコールバック
             
         Returns:
             str: 処理後のファイルパス
@@ -102,13 +82,13 @@ class AudioLooper:
             filter_str = ','.join(filter_parts)
             cmd = [
                 'ffmpeg',
-                '-i', input_file,
+                *PCMBuffer.input_args(input_file),
                 '-af', filter_str,
                 '-y',
                 output_file
             ]
             
-            subprocess.run(cmd, check=True)
+            FFmpegRunner.run(cmd, duration, on_progress)
             return output_file
         else:
             # フェード効果なしの場合はファイルをコピー
@@ -116,17 +96,89 @@ class AudioLooper:
             return output_file
     
     @staticmethod
+    def build_unit_filter(duration: float, crossfade_duration: float = 3.0, sample_rate: int = 44100,
+                          unit_filter: Optional[str] = None, fades: bool = True) -> str:
+        """
+        ループ単位1回分に適用するffmpegフィルタ文字列を構築する（フォーマット変換、最適化、フェード）
+        
+        ラウドネスの測定にも同じフィルタを使い、実際に繰り返される音声を測定する
+        
+        Args:
+            duration: ループ単位の再生時間（秒）
+            crossfade_duration: クロスフェードの時間（秒）
+            sample_rate: サンプリングレート
+            unit_filter: ループ単位へ適用するフィルタ（周波数最適化など）
+            fades: フェードイン・アウトを入れるかどうか（シームレスなループ単位ではFalse）
+            
+        Returns:
+            str: フィルタ文字列
+        """
+        # プロファイルのパン（pan=stereo|...）はステレオ入力を前提とするため、先にステレオへ変換する
+        filter_parts = [f"aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts=stereo"]
+        
+        if unit_filter:
+            filter_parts.append(unit_filter)
+        
+        if fades:
+            # 短いクリップでもフェードが重ならないように単位の半分までに制限する
+            fade = min(crossfade_duration, duration / 2)
+            filter_parts += [
+                f"afade=t=in:st=0:d={fade}",
+                f"afade=t=out:st={duration-fade}:d={fade}",
+            ]
+        return ','.join(filter_parts)
+    
+    @staticmethod
+    def build_loop_filter(duration: float, target_duration: int, crossfade_duration: float = 3.0,
+                          sample_rate: int = 44100, unit_filter: Optional[str] = None,
+                          fades: bool = True) -> str:
+        """
+        combine_audio_with_loopsと同じループ処理を行うffmpegフィルタ文字列を構築する
+        
+        Args:
+            duration: ループ単位の再生時間（秒）
+            target_duration: 目標の再生時間（秒）
+            crossfade_duration: クロスフェードの時間（秒）
+            sample_rate: サンプリングレート
+            unit_filter: ループ前にループ単位へ適用するフィルタ（周波数最適化など）
+            fades: ループごとにフェードイン・アウトを入れるかどうか（シームレスなループ単位ではFalse）
+            
+        Returns:
+            str: フィルタ文字列
+        """
+        # ループ単位のサンプル数（aloopはサンプル数で指定する）
+        unit_samples = int(round(duration * sample_rate))
+        
+        filter_parts = [
+            AudioLooper.build_unit_filter(duration, crossfade_duration, sample_rate, unit_filter, fades),
+            f"aloop=loop=-1:size={unit_samples}",
+            f"atrim=duration={target_duration}",
+            "asetpts=N/SR/TB"
+        ]
+        return ','.join(filter_parts)
+    
+    @staticmethod
+    @metrics.timed("loop")
     def combine_audio_with_loops(input_file: str, output_file: str, target_duration: int, 
-                             crossfade_duration: float = 3.0, profile: str = "default") -> str:
+                             crossfade_duration: float = 3.0, profile: str = "default",
+                             on_progress: Optional[Callable[[float], None]] = None,
+                             input_duration: Optional[float] = None,
+                             is_loop_unit: bool = False) -> str:
         """
         音声ファイルをループ再生し、クロスフェードを適用して結合する
         
+        loop_modeが"crossfade"の場合はループ点を検出してシームレスなループ単位を作り、
+        "fade"の場合はループごとに無音までフェードアウト・フェードインする（従来方式）
+        
         Args:
             input_file: 入力音声ファイルのパス
             output_file: 出力音声ファイルのパス
             target_duration: 目標の再生時間（秒）
             crossfade_duration: クロスフェードの時間（秒）
             profile: オーディオプロファイル名
+            on_progress: 進捗（0.0〜1.0）を受け取るコールバック
+            input_duration: 入力ファイルの再生時間（既知の場合は再取得しない）
+            is_loop_unit: 入力がすでにLoopFinderで作ったループ単位かどうか
             
         Returns:
             str: 処理後のファイルパス
@@ -140,76 +192,72 @@ class AudioLooper:
         if crossfade_duration <= 0:
             crossfade_duration = audio_config.get('crossfade_duration', 3.0)
         
+        if is_loop_unit or audio_config.get('loop_mode', 'crossfade') == 'crossfade':
+            try:
+                return AudioLooper._repeat_loop_unit(input_file, output_file, target_duration, crossfade_duration,
+                                                     sample_rate, audio_quality, on_progress, input_duration,
+                                                     is_loop_unit)
+            except LoopUnitUnavailable as e:
+                if is_loop_unit:
+                    raise
+                print(f"ループ単位を作成できないため、フェード方式でループします: {str(e)}")
+        
         # 一時ディレクトリを作成
         temp_dir = os.path.join(os.path.dirname(output_file), "temp_" + str(uuid.uuid4()))
         os.makedirs(temp_dir, exist_ok=True)
         
         try:
             # 入力ファイルの長さを取得
-            duration = AudioLooper.get_audio_duration(input_file)
+            duration = input_duration or AudioLooper.get_audio_duration(input_file)
             print(f"入力ファイルの再生時間: {duration}秒")
             
             # 必要なループ回数を計算（確実な切り上げ）
             loop_count = math.ceil(target_duration / duration)
             print(f"必要なループ回数: {loop_count}")
             
-            # 各ループに対してフェード効果を適用
-            temp_files = []
-            file_list_path = os.path.join(temp_dir, "file_list.txt")
+            # フェード効果を適用したループ単位を一度だけエンコードする
+            crossfade_duration = min(crossfade_duration, duration / 2)
+            segment_file = os.path.join(temp_dir, "segment.mp3")
+            print("ループ単位にフェード効果を適用しています...")
+            ffmpeg_cmd = [
+                'ffmpeg', '-y', 
+                *PCMBuffer.input_args(input_file),
+                '-filter_complex', f"[0:a]aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts=stereo,"
+                                 f"volume=1,afade=t=in:st=0:d={crossfade_duration},"
+                                 f"afade=t=out:st={duration-crossfade_duration}:d={crossfade_duration}[a]",
+                '-map', '[a]', 
+                '-acodec', 'libmp3lame', 
+                '-q:a', str(audio_quality),
+                segment_file
+            ]
+            
+            FFmpegRunner.run(ffmpeg_cmd)
             
+            # 同じセグメントをループ回数分ファイルリストに並べる
+            file_list_path = os.path.join(temp_dir, "file_list.txt")
             with open(file_list_path, 'w') as file_list:
-                for i in range(loop_count):
-                    temp_file = os.path.join(temp_dir, f"loop_{i}.mp3")
-                    
-                    # フェード効果を適用
-                    print(f"ループ {i+1}/{loop_count} にフェード効果を適用しています...")
-                    ffmpeg_cmd = [
-                        'ffmpeg', '-y', 
-                        '-i', input_file,
-                        '-filter_complex', f"[0:a]aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts=stereo,"
-                                         f"volume=1,afade=t=in:st=0:d={crossfade_duration},"
-                                         f"afade=t=out:st={duration-crossfade_duration}:d={crossfade_duration}[a]",
-                        '-map', '[a]', 
-                        '-acodec', 'libmp3lame', 
-                        '-q:a', str(audio_quality),
-                        temp_file
-                    ]
-                    
-                    subprocess.run(ffmpeg_cmd, check=True)
-                    temp_files.append(temp_file)
-                    
-                    # ファイルリストに追加
-                    file_list.write(f"file '{temp_file}'\n")
-            
-            # ループした音声ファイルを結合
-            temp_combined = os.path.join(temp_dir, "combined.mp3")
-            print("処理済みの音声ファイルを結合しています...")
+                file_list.write(f"file '{segment_file}'\n" * loop_count)
+            
+            # ストリームコピーで結合し、指定された時間で切り詰める
+            print(f"セグメントを結合し、目標再生時間 {target_duration}秒 で切り詰めています...")
             combine_cmd = [
-                'ffmpeg',
+                'ffmpeg', '-y',
                 '-f', 'concat',
                 '-safe', '0',
                 '-i', file_list_path,
-                '-c', 'copy',
-                temp_combined
-            ]
-            
-            subprocess.run(combine_cmd, check=True)
-            
-            # 指定された時間で切り詰める
-            print(f"目標再生時間 {target_duration}秒 で切り詰めています...")
-            trim_cmd = [
-                'ffmpeg', '-y',
-                '-i', temp_combined,
                 '-t', str(target_duration),
                 '-c', 'copy',
                 output_file
             ]
             
-            subprocess.run(trim_cmd, check=True)
+            FFmpegRunner.run(combine_cmd, target_duration, on_progress)
             
             print(f"ループ処理が完了しました: {output_file}")
             return output_file
             
+        except JobCancelled:
+            raise
+            
         except Exception as e:
             print(f"エラーが発生しました: {str(e)}")
             import traceback
@@ -224,13 +272,108 @@ class AudioLooper:
                 print(f"一時ファイルの削除に失敗しました: {str(e)}")
     
     @staticmethod
-    def normalize_audio_volume(input_file: str, output_file: str) -> str:
+    def _repeat_loop_unit(input_file: str, output_file: str, target_duration: int, crossfade_duration: float,
+                          sample_rate: int, audio_quality: int, on_progress: Optional[Callable[[float], None]],
+                          input_duration: Optional[float], is_loop_unit: bool) -> str:
+        """
+        シームレスなループ単位を目標の再生時間まで繰り返し、一度だけエンコードする
+        """
+        if is_loop_unit:
+            unit_file = input_file
+            unit_duration = input_duration or AudioLooper.get_audio_duration(input_file)
+        else:
+            print("ループ点を検出しています...")
+            unit = LoopFinder.get_loop_unit(input_file, crossfade_duration, sample_rate)
+            unit_file, unit_duration = unit.path, unit.duration
+        
+        print(f"ループ単位（{unit_duration:.3f}秒）を繰り返し、目標再生時間 {target_duration}秒 に拡張しています...")
+        cmd = [
+            'ffmpeg', '-y',
+            *PCMBuffer.input_args(unit_file),
+            '-filter:a', AudioLooper.build_loop_filter(unit_duration, target_duration, crossfade_duration,
+                                                       sample_rate, fades=False),
+            '-acodec', 'libmp3lame',
+            '-q:a', str(audio_quality),
+            output_file
+        ]
+        
+        FFmpegRunner.run(cmd, target_duration, on_progress)
+        return output_file
+    
+    @staticmethod
+    @metrics.timed("loudness_measure")
+    def measure_loudness(input_file: str, pre_filter: Optional[str] = None) -> Dict[str, float]:
+        """
+        loudnormの解析パスでEBU R128の統合ラウドネスとトゥルーピークを測定する
+        
+        繰り返した音声の統合ラウドネスは元の素材と同じなので、ループ単位を一度測定すれば
+        目標の再生時間に関係なく使える
+        
+        Args:
+            input_file: 測定する音声ファイル（またはPCMバッファ）のパス
+            pre_filter: 測定前に適用するフィルタ（周波数調整や最適化など）
+            
+        Returns:
+            Dict[str, float]: "input_i"（LUFS）、"input_tp"（dBTP）、"input_lra"（LU）、"input_thresh"（LUFS）
+        """
+        filters = [pre_filter] if pre_filter else []
+        filters.append(f"{AudioLooper.LOUDNORM_FILTER}:print_format=json")
+        cmd = [
+            'ffmpeg', '-hide_banner', '-nostats',
+            *PCMBuffer.input_args(input_file),
+            '-filter:a', ','.join(filters),
+            '-f', 'null', '-'
+        ]
+        
+        output = FFmpegRunner.run_capture(cmd)
+        report = json.loads(output[output.rindex('{'):output.rindex('}') + 1])
+        measurement = {key: float(report[key]) for key in ("input_i", "input_tp", "input_lra", "input_thresh")}
+        print(f"ラウドネス: {measurement['input_i']} LUFS, トゥルーピーク: {measurement['input_tp']} dBTP")
+        return measurement
+    
+    @staticmethod
+    def loudness_gain(measurement: Dict[str, float]) -> float:
+        """
+        測定結果から目標ラウドネスに合わせる固定ゲインを求める
+        
+        トゥルーピークが目標を超える場合は、超えない範囲までゲインを下げる
+        
+        Args:
+            measurement: measure_loudnessの結果
+            
+        Returns:
+            float: ゲイン（dB）。無音など測定できない場合は0
+        """
+        if not math.isfinite(measurement["input_i"]):
+            return 0.0
+        gain = AudioLooper.LOUDNESS_TARGET - measurement["input_i"]
+        if math.isfinite(measurement["input_tp"]):
+            gain = min(gain, AudioLooper.TRUE_PEAK_TARGET - measurement["input_tp"])
+        return round(gain, 2)
+    
+    @staticmethod
+    def normalization_filter(gain_db: Optional[float]) -> str:
+        """
+        正規化フィルタを取得する（ゲインが指定されていれば固定ゲイン、なければloudnorm）
+        """
+        if gain_db is None:
+            return AudioLooper.LOUDNORM_FILTER
+        return f"volume={gain_db}dB"
+    
+    @staticmethod
+    @metrics.timed("normalize")
+    def normalize_audio_volume(input_file: str, output_file: str, duration: Optional[float] = None,
+                               on_progress: Optional[Callable[[float], None]] = None,
+                               gain_db: Optional[float] = None) -> str:
         """
         音量を正規化する
         
         Args:
             input_file: 入力音声ファイルのパス
             output_file: 出力音声ファイルのパス
+            duration: 入力ファイルの再生時間（進捗の計算に使用）
+            on_progress: 進捗（0.0〜1.0）を受け取るコールバック
+            gain_db: ループ単位で測定した固定ゲイン（dB）。指定しない場合はloudnormで動的に正規化する
             
         Returns:
             str: 処理後のファイルパス
@@ -240,16 +383,16 @@ class AudioLooper:
         audio_config = config.get('audio', {})
         sample_rate = audio_config.get('sample_rate', 44100)
         
-        # loudnormフィルタを用いて正規化
+        # 固定ゲイン、またはloudnormフィルタを用いて正規化
         print("音量を正規化しています...")
         cmd = [
             'ffmpeg', '-y',
-            '-i', input_file,
-            '-filter:a', 'loudnorm=I=-16:LRA=11:TP=-1.5',
+            *PCMBuffer.input_args(input_file),
+            '-filter:a', AudioLooper.normalization_filter(gain_db),
             '-ar', str(sample_rate),
             '-ac', '2',
             output_file
         ]
         
-        subprocess.run(cmd, check=True)
+        FFmpegRunner.run(cmd, duration, on_progress)
         return output_file
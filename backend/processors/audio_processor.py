@@ -3,11 +3,19 @@ import subprocess
 import uuid
 import math
 import shutil
-from typing import Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 # 新しく追加したクラスをインポート
 from processors.frequency_optimizer import FrequencyOptimizer
 from processors.audio_looper import AudioLooper
+from processors.loop_finder import LoopFinder, LoopUnitUnavailable
+from processors.pcm_buffer import PCMBuffer
+from processors.result_cache import ResultCache
+from processors.config import Config
+from processors.ffmpeg_runner import FFmpegRunner, JobCancelled
+from processors.media_probe import MediaProbe
+from processors.progress import scaled
+from processors import metrics
 
 class AudioProcessor:
     @staticmethod
@@ -21,20 +29,25 @@ class AudioProcessor:
         Returns:
             Duration in seconds
         """
-        cmd = [
-            'ffprobe', 
-            '-v', 'error', 
-            '-show_entries', 'format=duration', 
-            '-of', 'default=noprint_wrappers=1:nokey=1', 
-            input_file
-        ]
+        return MediaProbe.get_duration(input_file)
+    
+    @staticmethod
+    def get_audio_sample_rate(input_file: str) -> int:
+        """
+        Get the sample rate of the first audio stream
         
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        duration = float(result.stdout)
-        return duration
+        Args:
+            input_file: Path to input audio file
+            
+        Returns:
+            Sample rate in Hz
+        """
+        return MediaProbe.probe(input_file)["sample_rate"]
     
     @staticmethod
-    def loop_audio(input_file: str, output_file: str, target_duration: int) -> str:
+    def loop_audio(input_file: str, output_file: str, target_duration: int,
+                   on_progress: Optional[Callable[[float], None]] = None,
+                   input_duration: Optional[float] = None, is_loop_unit: bool = False) -> str:
         """
         Loop audio file to reach the target duration
         
@@ -42,12 +55,17 @@ class AudioProcessor:
             input_file: Path to input audio file
             output_file: Path to output audio file
             target_duration: Target duration in seconds
+            on_progress: Optional callback receiving the completed fraction
+            input_duration: Duration of input_file if already known (skips probing)
+            is_loop_unit: Whether input_file is already a seamless loop unit
             
         Returns:
             Path to the processed audio file
         """
         # 新しいAudioLooperクラスを使用
-        return AudioLooper.combine_audio_with_loops(input_file, output_file, target_duration)
+        return AudioLooper.combine_audio_with_loops(input_file, output_file, target_duration,
+                                                    on_progress=on_progress, input_duration=input_duration,
+                                                    is_loop_unit=is_loop_unit)
     
     @staticmethod
     def adjust_frequency(input_file: str, output_file: str, frequency_factor: float) -> str:
@@ -70,9 +88,39 @@ class AudioProcessor:
             output_file
         ]
         
-        subprocess.run(cmd, check=True)
+        FFmpegRunner.run(cmd)
         return output_file
     
+    @staticmethod
+    def decode_source(input_file: str, output_file: str, frequency_factor: Optional[float] = None) -> str:
+        """
+        Decode audio once to a float32 PCM buffer, applying the frequency adjustment
+        
+        Used when several renders start from the same source, so the upload is
+        decoded (and resampled) only once. Later stages read the buffer
+        through a memory map instead of decoding it again. The buffer records
+        the upload hash and frequency factor it was decoded with, so loop
+        units built from it share cache entries with jobs decoding the upload.
+        
+        Args:
+            input_file: Path to input audio file
+            output_file: Path to output PCM buffer (.f32)
+            frequency_factor: Optional factor to adjust frequency
+            
+        Returns:
+            Path to the PCM buffer
+        """
+        sample_rate = Config.section('audio').get('sample_rate', 44100)
+        buffer = PCMBuffer.decode(input_file, output_file, sample_rate, 2, frequency_factor)
+        if buffer.path != input_file:
+            buffer.metadata["origin"] = {
+                "audio": ResultCache.hash_file(input_file),
+                "frequency": None if frequency_factor == 1.0 else frequency_factor,
+            }
+            buffer.write_sidecar()
+        buffer.close()
+        return buffer.path
+    
     @staticmethod
     def add_fade_effects(input_file: str, output_file: str, fade_in: int = 0, fade_out: int = 0) -> str:
         """
@@ -91,12 +139,161 @@ class AudioProcessor:
         duration = AudioProcessor.get_audio_duration(input_file)
         return AudioLooper.apply_fade_effects(input_file, output_file, fade_in, fade_out, duration)
     
+    @staticmethod
+    @metrics.timed("audio_single_pass")
+    def process_audio_single_pass(input_file: str, output_file: str, duration: int, 
+                                  frequency_factor: Optional[float] = None, 
+                                  profile: str = "default", 
+                                  apply_frequency_optimization: bool = True,
+                                  on_progress: Optional[Callable[[float], None]] = None) -> str:
+        """
+        Process audio with one ffmpeg filter graph and a single encode
+        
+        Frequency adjustment, looping, frequency optimization and loudness
+        normalization are compiled into one filter chain, so the audio is
+        encoded exactly once. Loops are joined by a crossfaded loop unit, or
+        with per-loop fades when audio.loop_mode is "fade". Loudness is
+        measured once on the loop unit and applied as a fixed gain, or
+        normalized dynamically by loudnorm when audio.normalization is
+        "loudnorm".
+        
+        Args:
+            input_file: Path to input audio file
+            output_file: Path to output audio file
+            duration: Target duration in seconds
+            frequency_factor: Optional factor to adjust frequency
+            profile: Audio profile for optimization
+            apply_frequency_optimization: Whether to apply frequency optimization
+            on_progress: Optional callback receiving the completed fraction
+            
+        Returns:
+            Path to the processed audio file
+        """
+        audio_config = Config.section('audio')
+        sample_rate = audio_config.get('sample_rate', 44100)
+        audio_quality = audio_config.get('quality', 2)
+        crossfade_duration = audio_config.get('crossfade_duration', 3.0)
+        
+        if audio_config.get('loop_mode', 'crossfade') == 'crossfade':
+            try:
+                return AudioProcessor._process_loop_unit_single_pass(
+                    input_file, output_file, duration, frequency_factor, profile,
+                    apply_frequency_optimization, on_progress
+                )
+            except LoopUnitUnavailable as e:
+                # Too short to crossfade: loop the clip with per-loop fades instead
+                print(f"ループ単位を作成できないため、フェード方式でループします: {str(e)}")
+        
+        # Length of one loop unit after frequency adjustment (one probe for all metadata)
+        metadata = PCMBuffer.probe(input_file)
+        unit_duration = metadata["duration"]
+        if not unit_duration or unit_duration <= 0:
+            raise ValueError(f"No audio to loop in {input_file}")
+        
+        filter_parts = []
+        if frequency_factor is not None and frequency_factor != 1.0:
+            # Resampled inside the loop render: its cost is part of the audio_single_pass stage
+            source_rate = metadata["sample_rate"]
+            filter_parts.append(f"asetrate=44100*{frequency_factor},aresample=44100")
+            unit_duration = unit_duration * source_rate / (44100 * frequency_factor)
+        
+        # The EQ is linear, so it runs on the loop unit instead of the looped output
+        unit_filter = FrequencyOptimizer.build_ffmpeg_filter(profile) if apply_frequency_optimization else None
+        
+        # Loudness of the looped output equals that of one unit, so measure the unit once,
+        # through the same chain (stereo format, EQ, fades) that the render repeats
+        gain_db = None
+        if audio_config.get('normalization', 'gain') == 'gain':
+            unit_chain = AudioLooper.build_unit_filter(unit_duration, crossfade_duration, sample_rate,
+                                                       unit_filter=unit_filter)
+            gain_db = AudioLooper.loudness_gain(AudioLooper.measure_loudness(
+                input_file, ','.join(filter_parts + [unit_chain])
+            ))
+        
+        filter_parts.append(
+            AudioLooper.build_loop_filter(unit_duration, duration, crossfade_duration, sample_rate,
+                                          unit_filter=unit_filter)
+        )
+        
+        filter_parts.append(AudioLooper.normalization_filter(gain_db))
+        
+        cmd = [
+            'ffmpeg', '-y',
+            *PCMBuffer.input_args(input_file),
+            '-filter:a', ','.join(filter_parts),
+            '-ar', str(sample_rate),
+            '-ac', '2',
+            '-acodec', 'libmp3lame',
+            '-q:a', str(audio_quality),
+            output_file
+        ]
+        
+        FFmpegRunner.run(cmd, duration, on_progress)
+        return output_file
+    
+    @staticmethod
+    def _process_loop_unit_single_pass(input_file: str, output_file: str, duration: int,
+                                       frequency_factor: Optional[float], profile: str,
+                                       apply_frequency_optimization: bool,
+                                       on_progress: Optional[Callable[[float], None]]) -> str:
+        """
+        Single-pass processing built on a seamless, crossfaded loop unit
+        
+        The unit (frequency adjustment included) is cached per upload as a
+        PCM buffer. The frequency optimization runs on views of it, with its
+        tail as filter pre-roll so the filtered unit still loops without a
+        seam; only the final output is encoded.
+        """
+        audio_config = Config.section('audio')
+        sample_rate = audio_config.get('sample_rate', 44100)
+        audio_quality = audio_config.get('quality', 2)
+        crossfade_duration = audio_config.get('crossfade_duration', 3.0)
+        
+        unit = LoopFinder.get_loop_unit(input_file, crossfade_duration, sample_rate, frequency_factor)
+        loop_source = unit
+        optimized_unit = None
+        try:
+            if apply_frequency_optimization:
+                optimized_unit = FrequencyOptimizer.optimize_buffer(
+                    unit, os.path.join(os.path.dirname(output_file), f"{uuid.uuid4()}_unit{PCMBuffer.EXTENSION}"),
+                    profile, pad_seconds=crossfade_duration
+                )
+                loop_source = optimized_unit
+            
+            # Measure the (optimized) unit once; the gain is applied in the final encode
+            gain_db = None
+            if audio_config.get('normalization', 'gain') == 'gain':
+                gain_db = AudioLooper.loudness_gain(AudioLooper.measure_loudness(loop_source.path))
+            
+            # The only encode of the pipeline
+            loop_filter = AudioLooper.build_loop_filter(unit.duration, duration, crossfade_duration,
+                                                        sample_rate, fades=False)
+            cmd = [
+                'ffmpeg', '-y',
+                *loop_source.ffmpeg_input(),
+                '-filter:a', f"{loop_filter},{AudioLooper.normalization_filter(gain_db)}",
+                '-ar', str(sample_rate),
+                '-ac', '2',
+                '-acodec', 'libmp3lame',
+                '-q:a', str(audio_quality),
+                output_file
+            ]
+            
+            FFmpegRunner.run(cmd, duration, on_progress)
+            return output_file
+        finally:
+            unit.close()
+            if optimized_unit is not None:
+                optimized_unit.remove()
+    
     @staticmethod
     def process_audio(input_file: str, output_dir: str, duration: int, 
                      frequency_factor: Optional[float] = None, 
                      fade_in: int = 0, fade_out: int = 0, 
                      profile: str = "default", 
-                     apply_frequency_optimization: bool = True) -> str:
+                     apply_frequency_optimization: bool = True,
+                     pipeline: Optional[str] = None,
+                     on_progress: Optional[Callable[[float], None]] = None) -> str:
         """
         Process audio with all required operations
         
@@ -109,56 +306,127 @@ class AudioProcessor:
             fade_out: Fade-out duration in seconds
             profile: Audio profile for optimization
             apply_frequency_optimization: Whether to apply frequency optimization
+            pipeline: "single_pass" or "multi_pass" (defaults to the config value)
+            on_progress: Optional callback receiving the completed fraction (0.0-1.0)
             
         Returns:
             Path to the final processed audio file
         """
+        if pipeline is None:
+            pipeline = Config.section('audio').get('pipeline', 'single_pass')
+        
+        if pipeline == "single_pass":
+            final_audio = os.path.join(output_dir, f"{uuid.uuid4()}_final.mp3")
+            try:
+                print("音声処理を開始します（シングルパス）...")
+                AudioProcessor.process_audio_single_pass(
+                    input_file, final_audio, duration, frequency_factor,
+                    profile=profile, apply_frequency_optimization=apply_frequency_optimization,
+                    on_progress=on_progress
+                )
+                print("音声処理が完了しました")
+                return final_audio
+            except JobCancelled:
+                # Not a single-pass failure: the job must stop, not fall back
+                if os.path.exists(final_audio):
+                    os.remove(final_audio)
+                raise
+            except Exception as e:
+                # Fall back to the multi-file pipeline
+                print(f"シングルパス処理に失敗しました。マルチパス処理に切り替えます: {str(e)}")
+                if os.path.exists(final_audio):
+                    os.remove(final_audio)
+        
         # Create temporary filenames
         temp_filename = str(uuid.uuid4())
-        temp_file1 = os.path.join(output_dir, f"{temp_filename}_1.mp3")
+        temp_pcm = os.path.join(output_dir, f"{temp_filename}_source{PCMBuffer.EXTENSION}")
+        temp_unit = os.path.join(output_dir, f"{temp_filename}_unit{PCMBuffer.EXTENSION}")
         temp_file2 = os.path.join(output_dir, f"{temp_filename}_2.mp3")
         temp_file3 = os.path.join(output_dir, f"{temp_filename}_3.mp3")
         final_audio = os.path.join(output_dir, f"{temp_filename}_final.mp3")
         
+        audio_config = Config.section('audio')
+        sample_rate = audio_config.get('sample_rate', 44100)
+        optimize_before_loop = audio_config.get('optimize_before_loop', True)
+        crossfade_duration = audio_config.get('crossfade_duration', 3.0)
+        crossfade_loop = audio_config.get('loop_mode', 'crossfade') == 'crossfade'
+        
         try:
             print("音声処理を開始します...")
             
-            # Step 1: Adjust frequency if needed
-            current_file = input_file
-            if frequency_factor is not None and frequency_factor != 1.0:
-                print(f"周波数を調整しています（係数: {frequency_factor}）...")
-                current_file = AudioProcessor.adjust_frequency(current_file, temp_file1, frequency_factor)
-            else:
-                # Just copy to temp_file1 to maintain the workflow
-                shutil.copyfile(input_file, temp_file1)
-                current_file = temp_file1
-            
-            # Step 2: Loop audio to target duration
+            # Step 1: Decode once to a PCM buffer (frequency adjustment included),
+            # or use the cached loop unit that was built the same way
+            if crossfade_loop:
+                print("ループ点を検出しています...")
+                try:
+                    source = LoopFinder.get_loop_unit(input_file, crossfade_duration, sample_rate, frequency_factor)
+                except LoopUnitUnavailable as e:
+                    print(f"ループ単位を作成できないため、フェード方式でループします: {str(e)}")
+                    crossfade_loop = False
+            if not crossfade_loop:
+                if frequency_factor is not None and frequency_factor != 1.0:
+                    print(f"周波数を調整しています（係数: {frequency_factor}）...")
+                source = PCMBuffer.decode(input_file, temp_pcm, sample_rate, 2, frequency_factor)
+            current_file, unit_duration = source.path, source.duration
+            
+            # Step 2: Apply frequency optimization to the loop source once (on views of the buffer)
+            if apply_frequency_optimization and optimize_before_loop:
+                print(f"ループ前の音声に周波数最適化を適用しています（プロファイル: {profile}）...")
+                optimized = FrequencyOptimizer.optimize_buffer(source, temp_unit, profile,
+                                                               pad_seconds=crossfade_duration)
+                optimized.close()
+                current_file = optimized.path
+            source.close()
+            
+            # Measure loudness on the loop source; with the legacy ordering the EQ
+            # (and its peak normalization) comes later, so loudnorm is used instead
+            gain_db = None
+            if audio_config.get('normalization', 'gain') == 'gain' and (optimize_before_loop or
+                                                                         not apply_frequency_optimization):
+                gain_db = AudioLooper.loudness_gain(AudioLooper.measure_loudness(
+                    current_file, AudioLooper.build_unit_filter(unit_duration, crossfade_duration, sample_rate,
+                                                                fades=not crossfade_loop)
+                ))
+            
+            # Step 3: Loop audio to target duration
             print(f"音声をループして{duration}秒に拡張しています...")
-            current_file = AudioProcessor.loop_audio(current_file, temp_file2, duration)
+            current_file = AudioProcessor.loop_audio(current_file, temp_file2, duration,
+                                                     on_progress=scaled(on_progress, 0.1, 0.4),
+                                                     input_duration=unit_duration, is_loop_unit=crossfade_loop)
             
-            # Step 3: Apply frequency optimization if requested
-            if apply_frequency_optimization:
+            # Step 3b: Apply frequency optimization to the looped output (legacy ordering)
+            if apply_frequency_optimization and not optimize_before_loop:
                 print(f"周波数最適化を適用しています（プロファイル: {profile}）...")
-                FrequencyOptimizer.optimize_audio(current_file, temp_file3, profile)
+                # optimize_audio reports failure by its return value, not an exception
+                if not FrequencyOptimizer.optimize_audio(current_file, temp_file3, profile):
+                    raise RuntimeError("Frequency optimization of the looped audio failed")
                 current_file = temp_file3
+                if on_progress:
+                    on_progress(0.6)
             
             # Step 4: Normalize audio volume
             print("音量を正規化しています...")
-            current_file = AudioLooper.normalize_audio_volume(current_file, final_audio)
+            current_file = AudioLooper.normalize_audio_volume(current_file, final_audio, duration,
+                                                              on_progress=scaled(on_progress, 0.6, 1.0),
+                                                              gain_db=gain_db)
             
             # Clean up temporary files
-            for file in [temp_file1, temp_file2, temp_file3]:
-                if os.path.exists(file):
-                    os.remove(file)
+            AudioProcessor._remove_temp_files([temp_pcm, temp_unit, temp_file2, temp_file3])
             
             print("音声処理が完了しました")
             return final_audio
             
         except Exception as e:
-            print(f"音声処理中にエラーが発生しました: {str(e)}")
+            if not isinstance(e, JobCancelled):
+                print(f"音声処理中にエラーが発生しました: {str(e)}")
             # Clean up on error
-            for file in [temp_file1, temp_file2, temp_file3, final_audio]:
-                if os.path.exists(file):
-                    os.remove(file)
-            raise e
\ No newline at end of file
+            AudioProcessor._remove_temp_files([temp_pcm, temp_unit, temp_file2, temp_file3, final_audio])
+            raise e
+    
+    @staticmethod
+    def _remove_temp_files(files: List[str]) -> None:
+        for file in files:
+            if file.endswith(PCMBuffer.EXTENSION):
+                PCMBuffer.delete(file)
+            elif os.path.exists(file):
+                os.remove(file)
@@ -0,0 +1,449 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
+
+DEFAULT_CONFIG = {
+    "profiles": {
+        "default": {
+            "low_freq_range": [50, 200],
+            "low_boost": 3.0,
+            "cry_freq_range": [2500, 5000],
+            "cry_reduction": -3.0
+        },
+        "work": {
+            "low_freq_range": [40, 180],
+            "low_boost": 4.0,
+            "cry_freq_range": [2800, 5500],
+            "cry_reduction": -4.0
+        },
+        "relax": {
+            "low_freq_range": [60, 250],
+            "low_boost": 5.0,
+            "cry_freq_range": [2200, 4500],
+            "cry_reduction": -2.0
+        },
+        "focus": {
+            "low_freq_range": [30, 150],
+            "low_boost": 2.5,
+            "cry_freq_range": [3000, 6000],
+            "cry_reduction": -5.0
+        }
+    },
+    "audio": {
+        "crossfade_duration": 3.0,
+        "sample_rate": 44100,
+        "quality": 2
+    },
+    "encoding": {
+        "default_tier": "balanced",
+        "tiers": {
+            "fast": {
+                "preset": "veryfast",
+                "crf": 26,
+                "tune": None,
+                "gop_seconds": 4,
+                "threads": 0,
+                "audio_codec": "aac",
+                "audio_bitrate": "128k"
+            },
+            "balanced": {
+                "preset": "medium",
+                "crf": 23,
+                "tune": None,
+                "gop_seconds": 10,
+                "threads": 0,
+                "audio_codec": "aac",
+                "audio_bitrate": "192k"
+            },
+            "archive": {
+                "preset": "slow",
+                "crf": 18,
+                "tune": "film",
+                "gop_seconds": 10,
+                "threads": 0,
+                "audio_codec": "aac",
+                "audio_bitrate": "256k"
+            }
+        }
+    }
+}
+
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow",
+                "placebo")
+
+# Expected type of each known setting, by section. Unknown keys are allowed.
+SCHEMA = {
+    "audio": {
+        "crossfade_duration": (int, float),
+        "sample_rate": int,
+        "quality": int,
+        "pipeline": str,
+        "optimize_before_loop": bool,
+        "loop_mode": str,
+        "loop_cache_dir": str,
+        "normalization": str,
+    },
+    "video": {
+        "still_fast_path": bool,
+        "segment_duration": (int, float),
+        "motion_type": str,
+        "motion_cycle_duration": (int, float),
+        "resolution": list,
+        "image_cache_dir": str,
+        "segment_cache_dir": str,
+        "prebuild_default_background": bool,
+    },
+    "optimizer": {
+        "engine": str,
+        "blocksize": int,
+        "workers": int,
+        "mix_to_mono": bool,
+    },
+    "cache": {
+        "enabled": bool,
+        "max_bytes": int,
+    },
+    "uploads": {
+        "max_audio_bytes": int,
+        "max_image_bytes": int,
+        "chunk_size": int,
+    },
+    "jobs": {
+        "store": str,
+        "store_path": str,
+        "progress_flush_interval": (int, float),
+        "queue_path": str,
+        "max_queue": int,
+        "lease_seconds": (int, float),
+        "heartbeat_interval": (int, float),
+        "max_attempts": int,
+        "poll_interval": (int, float),
+        "embedded_workers": int,
+        "worker_concurrency": int,
+        "metrics_interval": (int, float),
+        "class_limits": dict,
+        "max_batch_variants": int,
+    },
+    "storage": {
+        "index_path": str,
+        "quota_bytes": int,
+        "min_free_bytes": int,
+        "low_watermark": (int, float),
+        "protect_seconds": (int, float),
+        "retention_hours": (int, float),
+        "orphan_grace_seconds": (int, float),
+        "check_interval": (int, float),
+    },
+    "encoding": {
+        "default_tier": str,
+        "tiers": dict,
+    },
+}
+
+CHOICES = {
+    ("audio", "pipeline"): ("single_pass", "multi_pass"),
+    ("audio", "loop_mode"): ("crossfade", "fade"),
+    ("audio", "normalization"): ("gain", "loudnorm"),
+    ("optimizer", "engine"): ("streaming", "fft"),
+    ("jobs", "store"): ("sqlite", "memory"),
+}
+
+
+class ConfigError(ValueError):
+    """
+    Raised when config.json cannot be parsed or does not match the schema
+    """
+
+
+class Config:
+    """
+    Process-wide view of config.json
+
+    The file is parsed and validated once, then reloaded only when its mtime
+    changes (checked at most every CHECK_INTERVAL seconds). If a reloaded file
+    is invalid, the error is logged and the last valid configuration stays in
+    use. Values derived from the configuration (e.g. filter designs) can be
+    memoized with ``memoize`` and are dropped on every reload.
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    _lock = threading.RLock()
+    _config: Optional[Dict] = None
+    _mtime_ns: Optional[int] = None
+    _checked_at = 0.0
+    _derived: Dict[Hashable, Any] = {}
+
+    @staticmethod
+    def get() -> Dict:
+        """
+        Get the current configuration
+
+        Returns:
+            The parsed configuration (shared; do not modify)
+
+        Raises:
+            ConfigError: If the file is invalid and no valid configuration
+                         has been loaded yet
+        """
+        now = time.monotonic()
+        if Config._config is not None and now - Config._checked_at < Config.CHECK_INTERVAL:
+            return Config._config
+
+        with Config._lock:
+            Config._checked_at = now
+            try:
+                mtime_ns = os.stat(CONFIG_PATH).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+
+            if Config._config is not None and mtime_ns == Config._mtime_ns:
+                return Config._config
+
+            try:
+                config = Config._read(mtime_ns)
+            except ConfigError as e:
+                if Config._config is None:
+                    raise
+                print(f"Ignoring invalid config.json, keeping the previous configuration: {e}")
+                Config._mtime_ns = mtime_ns
+                return Config._config
+
+            Config._config = config
+            Config._mtime_ns = mtime_ns
+            Config._derived = {}
+            return config
+
+    @staticmethod
+    def _read(mtime_ns: Optional[int]) -> Dict:
+        if mtime_ns is None:
+            # Write the defaults so there is a file to edit
+            try:
+                with open(CONFIG_PATH, 'w') as f:
+                    json.dump(DEFAULT_CONFIG, f, indent=4)
+            except Exception as e:
+                print(f"Failed to save the default config: {e}")
+            return DEFAULT_CONFIG
+
+        try:
+            with open(CONFIG_PATH, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"could not read {CONFIG_PATH}: {e}") from e
+
+        Config.validate(config)
+        return config
+
+    @staticmethod
+    def validate(config: Any) -> None:
+        """
+        Check a parsed configuration against the schema
+
+        Args:
+            config: Parsed config.json contents
+
+        Raises:
+            ConfigError: Listing every problem found
+        """
+        errors: List[str] = []
+        if not isinstance(config, dict):
+            raise ConfigError("top level must be an object")
+
+        profiles = config.get("profiles")
+        if not isinstance(profiles, dict) or "default" not in profiles:
+            errors.append("profiles: must be an object containing a 'default' profile")
+        else:
+            for name, profile in profiles.items():
+                errors.extend(Config._validate_profile(name, profile))
+
+        encoding = config.get("encoding", {})
+        if isinstance(encoding, dict) and isinstance(encoding.get("tiers", {}), dict):
+            tiers = encoding.get("tiers", {})
+            for name, tier in tiers.items():
+                errors.extend(Config._validate_tier(name, tier))
+            default_tier = encoding.get("default_tier")
+            if tiers and default_tier is not None and default_tier not in tiers:
+                errors.append(f"encoding.default_tier: no tier named {default_tier!r}")
+
+        for section, fields in SCHEMA.items():
+            values = config.get(section, {})
+            if not isinstance(values, dict):
+                errors.append(f"{section}: must be an object")
+                continue
+            for key, expected in fields.items():
+                if key not in values:
+                    continue
+                value = values[key]
+                # bool is an int subclass, but a flag is never a valid number
+                if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+                    errors.append(f"{section}.{key}: unexpected value {value!r}")
+                    continue
+                choices = CHOICES.get((section, key))
+                if choices and value not in choices:
+                    errors.append(f"{section}.{key}: must be one of {', '.join(choices)}")
+                elif isinstance(value, (int, float)) and not isinstance(value, bool) and value < 0:
+                    errors.append(f"{section}.{key}: must not be negative")
+
+        if errors:
+            raise ConfigError("; ".join(errors))
+
+    @staticmethod
+    def _validate_profile(name: str, profile: Any) -> List[str]:
+        if not isinstance(profile, dict):
+            return [f"profiles.{name}: must be an object"]
+
+        errors = []
+        for range_key, gain_key in (("low_freq_range", "low_boost"), ("cry_freq_range", "cry_reduction")):
+            band = profile.get(range_key)
+            if (not isinstance(band, list) or len(band) != 2
+                    or not all(isinstance(f, (int, float)) and not isinstance(f, bool) for f in band)
+                    or not 0 < band[0] < band[1]):
+                errors.append(f"profiles.{name}.{range_key}: must be [low, high] with 0 < low < high")
+            gain = profile.get(gain_key)
+            if not isinstance(gain, (int, float)) or isinstance(gain, bool):
+                errors.append(f"profiles.{name}.{gain_key}: must be a number (dB)")
+        return errors
+
+    @staticmethod
+    def _validate_tier(name: str, tier: Any) -> List[str]:
+        if not isinstance(tier, dict):
+            return [f"encoding.tiers.{name}: must be an object"]
+
+        errors = []
+        if tier.get("preset") not in X264_PRESETS:
+            errors.append(f"encoding.tiers.{name}.preset: must be one of {', '.join(X264_PRESETS)}")
+        crf = tier.get("crf")
+        if not isinstance(crf, (int, float)) or isinstance(crf, bool) or not 0 <= crf <= 51:
+            errors.append(f"encoding.tiers.{name}.crf: must be a number from 0 to 51")
+        if tier.get("tune") is not None and not isinstance(tier.get("tune"), str):
+            errors.append(f"encoding.tiers.{name}.tune: must be a string or null")
+        gop = tier.get("gop_seconds")
+        if not isinstance(gop, (int, float)) or isinstance(gop, bool) or gop <= 0:
+            errors.append(f"encoding.tiers.{name}.gop_seconds: must be a positive number")
+        threads = tier.get("threads", 0)
+        if not isinstance(threads, int) or isinstance(threads, bool) or threads < 0:
+            errors.append(f"encoding.tiers.{name}.threads: must be a non-negative integer (0 = automatic)")
+        for key in ("audio_codec", "audio_bitrate"):
+            if not isinstance(tier.get(key), str):
+                errors.append(f"encoding.tiers.{name}.{key}: must be a string")
+        return errors
+
+    @staticmethod
+    def section(name: str) -> Dict:
+        """
+        Get one section of the configuration (empty if absent)
+        """
+        return Config.get().get(name, {})
+
+    @staticmethod
+    def get_profile(profile: str = "default") -> Tuple[str, Dict]:
+        """
+        Get a frequency profile, falling back to "default" if it does not exist
+
+        Returns:
+            Tuple of the profile name actually used and its settings
+        """
+        profiles = Config.get()["profiles"]
+        if profile not in profiles:
+            print(f"Warning: profile '{profile}' not found, using the default profile")
+            profile = "default"
+        return profile, profiles[profile]
+
+    @staticmethod
+    def profile_names() -> List[str]:
+        """
+        Get the names of all frequency profiles
+        """
+        return list(Config.get()["profiles"].keys())
+
+    @staticmethod
+    def _encoding() -> Tuple[str, Dict]:
+        encoding = Config.section("encoding")
+        tiers = encoding.get("tiers") or DEFAULT_CONFIG["encoding"]["tiers"]
+        default_tier = encoding.get("default_tier", DEFAULT_CONFIG["encoding"]["default_tier"])
+        if default_tier not in tiers:
+            default_tier = next(iter(tiers))
+        return default_tier, tiers
+
+    @staticmethod
+    def get_tier(tier: Optional[str] = None) -> Tuple[str, Dict]:
+        """
+        Get an encoding tier, falling back to the default tier if it does not exist
+
+        Args:
+            tier: Tier name (None for the default tier)
+
+        Returns:
+            Tuple of the tier name actually used and its settings
+        """
+        default_tier, tiers = Config._encoding()
+        if tier is None:
+            tier = default_tier
+        elif tier not in tiers:
+            print(f"Warning: encoding tier '{tier}' not found, using the '{default_tier}' tier")
+            tier = default_tier
+        return tier, tiers[tier]
+
+    @staticmethod
+    def tier_names() -> List[str]:
+        """
+        Get the names of all encoding tiers
+        """
+        return list(Config._encoding()[1].keys())
+
+    @staticmethod
+    @contextmanager
+    def override(**sections: Dict) -> Iterator[None]:
+        """
+        Temporarily replace settings of some sections (for benchmarks and checks)
+
+        The overrides apply to the whole process until the block exits, and
+        memoized values are dropped on both ends.
+
+        Args:
+            **sections: Settings to replace, by section (e.g. audio={"loop_mode": "fade"})
+        """
+        with Config._lock:
+            previous = Config.get()
+            overridden = {**previous, **{name: {**previous.get(name, {}), **values}
+                                         for name, values in sections.items()}}
+            Config._config = overridden
+            Config._derived = {}
+        try:
+            yield
+        finally:
+            with Config._lock:
+                # Keep a configuration reloaded from disk meanwhile
+                if Config._config is overridden:
+                    Config._config = previous
+                    Config._derived = {}
+
+    @staticmethod
+    def memoize(key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Get a value derived from the current configuration, computing it once
+
+        Args:
+            key: Identifies the derived value (e.g. ("sos", profile, sample_rate))
+            compute: Builds the value from the current configuration
+
+        Returns:
+            The cached or newly computed value
+        """
+        Config.get()
+        with Config._lock:
+            derived = Config._derived
+            if key in derived:
+                return derived[key]
+
+        value = compute()
+        with Config._lock:
+            # Do not store values computed from a configuration replaced meanwhile
+            if derived is Config._derived:
+                derived[key] = value
+        return value
@@ -0,0 +1,191 @@
+import time
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from processors import metrics
+
+# Job whose pipeline runs in the current thread, so its ffmpeg processes can be stopped together
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("ffmpeg_job", default=None)
+
+
+class JobCancelled(Exception):
+    """
+    Raised when ffmpeg was stopped, or is about to start, for a cancelled job
+    """
+
+
+class FFmpegRunner:
+    """
+    Runs ffmpeg commands, optionally reporting progress from ``-progress pipe:1``
+
+    Every running ffmpeg process is tracked with the job it works for, so a
+    worker can stop the processes of one job (when it loses the job's lease)
+    or all of them (when it shuts down).
+    """
+
+    _lock = threading.Lock()
+    _processes: Dict[subprocess.Popen, Optional[str]] = {}
+    _jobs: Set[str] = set()
+    _cancelled: Set[str] = set()
+
+    @staticmethod
+    @contextmanager
+    def job_scope(job_id: str) -> Iterator[None]:
+        """
+        Attribute the ffmpeg processes started in this thread to a job
+        """
+        token = _current_job.set(job_id)
+        with FFmpegRunner._lock:
+            FFmpegRunner._jobs.add(job_id)
+        try:
+            yield
+        finally:
+            _current_job.reset(token)
+            with FFmpegRunner._lock:
+                FFmpegRunner._jobs.discard(job_id)
+                FFmpegRunner._cancelled.discard(job_id)
+
+    @staticmethod
+    def cancel(job_id: Optional[str] = None, timeout: float = 5.0) -> int:
+        """
+        Stop the ffmpeg processes of a job and refuse to start new ones for it
+
+        Args:
+            job_id: Job to cancel (None for every running job and process)
+            timeout: Seconds given to ffmpeg to exit before it is killed
+
+        Returns:
+            Number of processes stopped
+        """
+        with FFmpegRunner._lock:
+            jobs = set(FFmpegRunner._jobs) if job_id is None else {job_id} & FFmpegRunner._jobs
+            FFmpegRunner._cancelled |= jobs
+            processes = [process for process, owner in FFmpegRunner._processes.items()
+                         if job_id is None or owner == job_id]
+
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            try:
+                process.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        return len(processes)
+
+    @staticmethod
+    def is_cancelled(job_id: str) -> bool:
+        """
+        Check whether a job running in this process has been cancelled
+        """
+        with FFmpegRunner._lock:
+            return job_id in FFmpegRunner._cancelled
+
+    @staticmethod
+    def run(cmd: List[str], duration: Optional[float] = None,
+            on_progress: Optional[Callable[[float], None]] = None) -> None:
+        """
+        Run an ffmpeg command
+
+        Args:
+            cmd: ffmpeg command line (starting with 'ffmpeg')
+            duration: Expected output duration in seconds, used to turn the
+                      reported output time into a fraction
+            on_progress: Called with the completed fraction (0.0-1.0)
+
+        Raises:
+            subprocess.CalledProcessError: If ffmpeg exits with an error
+            JobCancelled: If the job running the command was cancelled
+        """
+        FFmpegRunner._timed(FFmpegRunner._run, cmd, duration, on_progress)
+
+    @staticmethod
+    def run_capture(cmd: List[str]) -> str:
+        """
+        Run an ffmpeg command and return what it wrote to stderr
+
+        Used for analysis passes whose report is only logged (e.g. loudnorm
+        with print_format=json).
+
+        Raises:
+            subprocess.CalledProcessError: If ffmpeg exits with an error
+            JobCancelled: If the job running the command was cancelled
+        """
+        return FFmpegRunner._timed(FFmpegRunner._run_capture, cmd)
+
+    @staticmethod
+    def _timed(fn: Callable, *args):
+        stage = metrics.current_stage() or "other"
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        except JobCancelled:
+            raise
+        except Exception:
+            metrics.ffmpeg_failures.inc(stage=stage)
+            raise
+        finally:
+            metrics.ffmpeg_duration.observe(time.perf_counter() - started, stage=stage)
+
+    @staticmethod
+    def _start(cmd: List[str], **kwargs) -> subprocess.Popen:
+        job_id = _current_job.get()
+        with FFmpegRunner._lock:
+            if job_id in FFmpegRunner._cancelled:
+                raise JobCancelled(f"Job {job_id} was cancelled")
+            process = subprocess.Popen(cmd, **kwargs)
+            FFmpegRunner._processes[process] = job_id
+        return process
+
+    @staticmethod
+    def _wait(process: subprocess.Popen, cmd: List[str],
+              read: Optional[Callable[[], None]] = None) -> Optional[str]:
+        try:
+            if read is not None:
+                read()
+            _, stderr = process.communicate()
+        except BaseException:
+            # A raising on_progress must not leave ffmpeg running with an unread pipe
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            with FFmpegRunner._lock:
+                job_id = FFmpegRunner._processes.pop(process, None)
+                cancelled = job_id in FFmpegRunner._cancelled
+
+        if cancelled:
+            raise JobCancelled(f"Job {job_id} was cancelled")
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+        return stderr
+
+    @staticmethod
+    def _run_capture(cmd: List[str]) -> str:
+        process = FFmpegRunner._start(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        return FFmpegRunner._wait(process, cmd)
+
+    @staticmethod
+    def _run(cmd: List[str], duration: Optional[float],
+             on_progress: Optional[Callable[[float], None]]) -> None:
+        if on_progress is None or not duration:
+            FFmpegRunner._wait(FFmpegRunner._start(cmd), cmd)
+            return
+
+        progress_cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+        process = FFmpegRunner._start(progress_cmd, stdout=subprocess.PIPE, text=True)
+
+        def read_progress():
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                # out_time_ms is reported in microseconds despite its name
+                if key == 'out_time_ms' and value.isdigit():
+                    on_progress(min(int(value) / 1e6 / duration, 1.0))
+                elif key == 'progress' and value == 'end':
+                    on_progress(1.0)
+
+        FFmpegRunner._wait(process, progress_cmd, read_progress)
@@ -1,10 +1,14 @@
-import os
 import sys
-import json
 import numpy as np
 from scipy import signal
 import soundfile as sf
-from typing import Dict, List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Optional
+
+from processors.config import Config
+from processors.pcm_buffer import PCMBuffer
+from processors.ffmpeg_runner import JobCancelled
+from processors import metrics
 
 class FrequencyOptimizer:
     """
@@ -14,63 +18,376 @@ class FrequencyOptimizer:
     @staticmethod
     def load_config() -> Dict:
         """
-        設定ファイルを読み込む
-        """
-        # デフォルト設定
-        default_config = {
-            "profiles": {
-                "default": {
-                    "low_freq_range": [50, 200],
-                    "low_boost": 3.0,
-                    "cry_freq_range": [2500, 5000],
-                    "cry_reduction": -3.0
-                },
-                "work": {
-                    "low_freq_range": [40, 180],
-                    "low_boost": 4.0,
-                    "cry_freq_range": [2800, 5500],
-                    "cry_reduction": -4.0
-                },
-                "relax": {
-                    "low_freq_range": [60, 250],
-                    "low_boost": 5.0,
-                    "cry_freq_range": [2200, 4500],
-                    "cry_reduction": -2.0
-                },
-                "focus": {
-                    "low_freq_range": [30, 150],
-                    "low_boost": 2.5,
-                    "cry_freq_range": [3000, 6000],
-                    "cry_reduction": -5.0
-                }
-            }
-        }
-        
-        # 設定ファイルのパスを確認
-        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
-        
-        # 設定ファイルが存在する場合は読み込み、なければデフォルト設定を使用
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r') as f:
-                    config = json.load(f)
-                return config
-            except Exception as e:
-                print(f"設定ファイルの読み込みに失敗しました: {str(e)}")
-                return default_config
+        設定を取得する（読み込みと検証はConfigで一度だけ行い、変更時のみ再読み込みする）
+        """
+        return Config.get()
+    
+    @staticmethod
+    def get_profile_config(profile: str = "default") -> Tuple[str, Dict]:
+        """
+        プロファイル設定を取得する（見つからなければデフォルト）
+        
+        Args:
+            profile: 最適化プロファイル名
+            
+        Returns:
+            Tuple[str, Dict]: 実際に使用するプロファイル名と設定
+        """
+        return Config.get_profile(profile)
+    
+    @staticmethod
+    def get_filter(profile: str, samplerate: int) -> np.ndarray:
+        """
+        プロファイルとサンプリングレートに対応するSOS係数を取得する
+        
+        設計結果は設定が変更されるまでキャッシュされるため、ジョブごとに再設計しない
+        
+        Args:
+            profile: 最適化プロファイル名
+            samplerate: サンプリングレート
+            
+        Returns:
+            np.ndarray: SOS係数（セクション数 x 6）
+        """
+        profile, config = FrequencyOptimizer.get_profile_config(profile)
+        return Config.memoize(
+            ("sos", profile, samplerate),
+            lambda: FrequencyOptimizer.design_filter(config, samplerate)
+        )
+    
+    @staticmethod
+    def precompute_filters(samplerates: Tuple[int, ...] = (44100, 48000)) -> None:
+        """
+        全プロファイルのフィルタ係数とffmpegフィルタ文字列を事前に計算する
+        
+        Args:
+            samplerates: 係数を設計するサンプリングレート
+        """
+        for profile in Config.profile_names():
+            FrequencyOptimizer.build_ffmpeg_filter(profile)
+            for samplerate in samplerates:
+                FrequencyOptimizer.get_filter(profile, samplerate)
+    
+    @staticmethod
+    def build_ffmpeg_filter(profile: str = "default") -> str:
+        """
+        optimize_audioと同等の周波数最適化を行うffmpegフィルタ文字列を構築する
+        
+        Args:
+            profile: 最適化プロファイル名
+            
+        Returns:
+            str: フィルタ文字列
+        """
+        profile, config = FrequencyOptimizer.get_profile_config(profile)
+        return Config.memoize(("ffmpeg_filter", profile),
+                              lambda: FrequencyOptimizer._format_ffmpeg_filter(config))
+    
+    @staticmethod
+    def _format_ffmpeg_filter(config: Dict) -> str:
+        low_min, low_max = config['low_freq_range']
+        cry_min, cry_max = config['cry_freq_range']
+        
+        # optimize_audioと同様にモノラルで処理し、結果を両チャンネルに複製する
+        mono_mix = "pan=stereo|c0=0.5*c0+0.5*c1|c1=0.5*c0+0.5*c1"
+        
+        # 周波数帯域ごとのゲイン（dB）をfirequalizerで適用
+        gain_expr = (
+            f"if(between(f,{low_min},{low_max}),{config['low_boost']},0)+"
+            f"if(between(f,{cry_min},{cry_max}),{config['cry_reduction']},0)"
+        )
+        return f"{mono_mix},firequalizer=gain='{gain_expr}'"
+    
+    @staticmethod
+    def design_filter(config: Dict, samplerate: int) -> np.ndarray:
+        """
+        プロファイル設定からピーキングEQのSOS係数を設計する
+        
+        各周波数帯域を1つのピーキングフィルタ（RBJ方式）で表し、
+        中心周波数は帯域の幾何平均、帯域幅は帯域のオクターブ幅とする
+        
+        Args:
+            config: プロファイル設定
+            samplerate: サンプリングレート
+            
+        Returns:
+            np.ndarray: SOS係数（セクション数 x 6）
+        """
+        sections = []
+        bands = [
+            (config['low_freq_range'], config['low_boost']),
+            (config['cry_freq_range'], config['cry_reduction'])
+        ]
+        
+        for (f_min, f_max), gain_db in bands:
+            center = np.sqrt(f_min * f_max)
+            if gain_db == 0 or center >= samplerate / 2:
+                continue
+            
+            bandwidth = np.log2(f_max / f_min)
+            a = 10 ** (gain_db / 40)
+            w0 = 2 * np.pi * center / samplerate
+            alpha = np.sin(w0) * np.sinh(np.log(2) / 2 * bandwidth * w0 / np.sin(w0))
+            
+            b = [1 + alpha * a, -2 * np.cos(w0), 1 - alpha * a]
+            a_coeffs = [1 + alpha / a, -2 * np.cos(w0), 1 - alpha / a]
+            sections.append([c / a_coeffs[0] for c in b] + [c / a_coeffs[0] for c in a_coeffs])
+        
+        if not sections:
+            # 補正なし（素通し）
+            sections.append([1.0, 0.0, 0.0, 1.0, 0.0, 0.0])
+        
+        return np.array(sections, dtype=np.float64)
+    
+    @staticmethod
+    def _read_blocks(source, blocksize: int, preroll_frames: int) -> Iterator[Tuple[np.ndarray, bool]]:
+        """
+        プリロール（末尾から循環的に取り出したフレーム）に続けて、先頭から順にブロックを返す
+        
+        Args:
+            source: 入力音声ファイルのパス、またはサンプル配列（PCMBufferのビューなど、コピーせずに読む）
+            blocksize: 1ブロックあたりのフレーム数
+            preroll_frames: プリロールのフレーム数
+            
+        Yields:
+            Tuple[np.ndarray, bool]: ブロック（フレーム数 x チャンネル数）とプリロールかどうか
+        """
+        if isinstance(source, np.ndarray):
+            preroll_frames = min(preroll_frames, len(source))
+            if preroll_frames > 0:
+                yield source[len(source) - preroll_frames:], True
+            for offset in range(0, len(source), blocksize):
+                yield source[offset:offset + blocksize], False
+            return
+        
+        with sf.SoundFile(source) as f:
+            preroll_frames = min(preroll_frames, f.frames)
+            if preroll_frames > 0:
+                f.seek(f.frames - preroll_frames)
+                yield f.read(preroll_frames, dtype='float64', always_2d=True), True
+                f.seek(0)
+            for block in f.blocks(blocksize=blocksize, dtype='float64', always_2d=True):
+                yield block, False
+    
+    @staticmethod
+    def _filter_blocks(source, sos: np.ndarray, mix_to_mono: bool = True,
+                       blocksize: int = 65536, executor: Optional[ThreadPoolExecutor] = None,
+                       preroll_frames: int = 0) -> Iterator[np.ndarray]:
+        """
+        音声をブロック単位で読み込み、フィルタを適用したブロックを返す
+        
+        フィルタの内部状態はブロック間で引き継ぐため、全体を一括処理した場合と同じ結果になる
+        
+        Args:
+            source: 入力音声ファイルのパス、またはサンプル配列（フレーム数 x チャンネル数）
+            sos: SOS係数
+            mix_to_mono: モノラルで処理し、結果を全チャンネルに複製するかどうか
+            blocksize: 1ブロックあたりのフレーム数
+            executor: チャンネルごとの並列処理に使用するスレッドプール
+            preroll_frames: 先頭の前にファイル末尾から循環的に通すフレーム数（ループ素材のエッジ対策）
+            
+        Yields:
+            np.ndarray: フィルタ適用後のブロック（フレーム数 x チャンネル数）
+        """
+        channels = source.shape[1] if isinstance(source, np.ndarray) else sf.info(source).channels
+        filtered_channels = 1 if mix_to_mono else channels
+        states = [np.zeros((sos.shape[0], 2)) for _ in range(filtered_channels)]
+        
+        def filter_channel(index: int, x: np.ndarray) -> np.ndarray:
+            y, states[index] = signal.sosfilt(sos, x, zi=states[index])
+            return y
+        
+        # プリロールはフィルタの内部状態を温めるためだけに通す（出力は破棄）
+        for block, is_preroll in FrequencyOptimizer._read_blocks(source, blocksize, preroll_frames):
+            if mix_to_mono:
+                y = filter_channel(0, np.mean(block, axis=1))
+                if not is_preroll:
+                    yield np.repeat(y[:, np.newaxis], channels, axis=1)
+                continue
+            
+            if executor is not None and channels > 1:
+                # チャンネルごとに並列でフィルタを適用（sosfiltはGILを解放する）
+                futures = [executor.submit(filter_channel, i, block[:, i]) for i in range(channels)]
+                y = np.column_stack([future.result() for future in futures])
+            else:
+                y = np.column_stack([filter_channel(i, block[:, i]) for i in range(channels)])
+            if not is_preroll:
+                yield y
+    
+    @staticmethod
+    def _optimize_audio_streaming(input_file: str, output_file: str, profile: str,
+                                  blocksize: int = 65536, workers: int = 1,
+                                  mix_to_mono: bool = True, pad_seconds: float = 0.0) -> None:
+        """
+        ブロックストリーミングで周波数最適化を適用する（メモリ使用量は再生時間に依存しない）
+        
+        1パス目でフィルタ後のピーク値を求め、2パス目で正規化しながら書き出す
+        
+        Args:
+            input_file: 入力音声ファイルのパス
+            output_file: 出力音声ファイルのパス
+            profile: 最適化プロファイル名
+            blocksize: 1ブロックあたりのフレーム数
+            workers: チャンネルごとの並列処理に使用するスレッド数
+            mix_to_mono: モノラルで処理し、結果を全チャンネルに複製するかどうか
+            pad_seconds: ループ素材として扱う場合に末尾から循環的に通すパディング（秒）
+        """
+        info = sf.info(input_file)
+        samplerate, channels = info.samplerate, info.channels
+        print(f"サンプリングレート: {samplerate}Hz")
+        print(f"チャンネル数: {channels}")
+        
+        sos = FrequencyOptimizer.get_filter(profile, samplerate)
+        preroll_frames = int(pad_seconds * samplerate)
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 and not mix_to_mono else None
+        
+        try:
+            # 1パス目: ピーク値を計算
+            print("周波数帯域の最適化を適用しています（ピーク解析）...")
+            peak = 0.0
+            for block in FrequencyOptimizer._filter_blocks(input_file, sos, mix_to_mono, blocksize,
+                                                            executor, preroll_frames):
+                peak = max(peak, float(np.max(np.abs(block))) if len(block) else 0.0)
+            
+            # 2パス目: 正規化して書き出す
+            scale = 0.95 / peak if peak > 0 else 1.0  # ヘッドルーム確保
+            print("最適化された音声を保存しています...")
+            with sf.SoundFile(output_file, 'w', samplerate=samplerate, channels=channels) as out:
+                for block in FrequencyOptimizer._filter_blocks(input_file, sos, mix_to_mono, blocksize,
+                                                            executor, preroll_frames):
+                    out.write(block * scale)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    
+    @staticmethod
+    @metrics.timed("optimize")
+    def optimize_buffer(source: PCMBuffer, output_file: str, profile: str = "default",
+                        pad_seconds: float = 0.0) -> PCMBuffer:
+        """
+        デコード済みのPCMバッファに周波数最適化を適用する
+        
+        入力はメモリマップのビューをコピーせずに読み、フィルタ結果を新しいPCMバッファへ
+        直接書き込んでから、その場でピーク正規化する（フィルタは1回だけ通す）
+        
+        Args:
+            source: 入力のPCMバッファ
+            output_file: 出力PCMバッファのパス（.f32）
+            profile: 最適化プロファイル名
+            pad_seconds: ループ素材として処理する場合のパディング（秒）。エッジでの過渡応答を防ぐ
+            
+        Returns:
+            PCMBuffer: 最適化されたPCMバッファ
+        
+        Raises:
+            Exception: 処理に失敗した場合（出力は削除される）
+        """
+        optimizer_config = Config.section('optimizer')
+        blocksize = optimizer_config.get('blocksize', 65536)
+        mix_to_mono = optimizer_config.get('mix_to_mono', True)
+        workers = optimizer_config.get('workers', 1)
+        
+        sos = FrequencyOptimizer.get_filter(profile, source.sample_rate)
+        preroll_frames = int(pad_seconds * source.sample_rate)
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 and not mix_to_mono else None
+        output = PCMBuffer.create(output_file, source.sample_rate, source.channels, source.frames, source.metadata)
+        
+        try:
+            out = output.samples
+            peak = 0.0
+            offset = 0
+            for block in FrequencyOptimizer._filter_blocks(source.samples, sos, mix_to_mono, blocksize,
+                                                            executor, preroll_frames):
+                out[offset:offset + len(block)] = block
+                peak = max(peak, float(np.max(np.abs(block))) if len(block) else 0.0)
+                offset += len(block)
+            
+            scale = 0.95 / peak if peak > 0 else 1.0  # ヘッドルーム確保
+            for block in output.blocks(blocksize):
+                block *= scale
+            output.flush()
+            return output
+        except BaseException:
+            output.remove()
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    
+    @staticmethod
+    def _optimize_audio_fft(input_file: str, output_file: str, config: Dict) -> None:
+        """
+        ファイル全体をFFTで処理して周波数最適化を適用する（従来方式）
+        
+        Args:
+            input_file: 入力音声ファイルのパス
+            output_file: 出力音声ファイルのパス
+            config: プロファイル設定
+        """
+        # 音声ファイルを読み込む
+        print("音声ファイルを読み込んでいます...")
+        data, samplerate = sf.read(input_file)
+        print(f"サンプリングレート: {samplerate}Hz")
+        print(f"データ長: {len(data)} サンプル")
+        
+        # ステレオの場合、モノラルに変換
+        if len(data.shape) > 1:
+            print("ステレオをモノラルに変換しています...")
+            data_mono = np.mean(data, axis=1)
+            print(f"変換後のデータ長: {len(data_mono)} サンプル")
+            
+            # モノラルデータをステレオに戻す準備（処理はモノラルで行い、結果をステレオに複製）
+            channels = data.shape[1]
+            stereo_result = True
         else:
-            # 設定ファイルが存在しない場合はデフォルト設定を保存
-            try:
-                os.makedirs(os.path.dirname(config_path), exist_ok=True)
-                with open(config_path, 'w') as f:
-                    json.dump(default_config, f, indent=4)
-            except Exception as e:
-                print(f"デフォルト設定の保存に失敗しました: {str(e)}")
-            
-            return default_config
+            data_mono = data
+            stereo_result = False
+        
+        # FFTを実行
+        print("FFTを実行しています...")
+        fft_data = np.fft.fft(data_mono)
+        freqs = np.fft.fftfreq(len(data_mono), 1/samplerate)
+        
+        # 周波数帯域ごとのゲインを計算
+        print("周波数帯域の最適化を適用しています...")
+        gain = np.ones_like(freqs)
+        
+        # 低周波帯域の強調
+        low_freq_mask = (np.abs(freqs) >= config['low_freq_range'][0]) & (np.abs(freqs) <= config['low_freq_range'][1])
+        gain[low_freq_mask] *= 10 ** (config['low_boost'] / 20)
+        
+        # 泣き声周波数帯域の抑制
+        cry_freq_mask = (np.abs(freqs) >= config['cry_freq_range'][0]) & (np.abs(freqs) <= config['cry_freq_range'][1])
+        gain[cry_freq_mask] *= 10 ** (config['cry_reduction'] / 20)
+        
+        # ゲインを適用
+        fft_data *= gain
+        
+        # 逆FFTを実行
+        print("逆FFTを実行しています...")
+        optimized_data = np.real(np.fft.ifft(fft_data))
+        
+        # 正規化
+        print("音量を正規化しています...")
+        max_amplitude = np.max(np.abs(optimized_data))
+        optimized_data = optimized_data / max_amplitude * 0.95  # ヘッドルーム確保
+        
+        # ステレオの場合は結果をステレオに戻す
+        if stereo_result:
+            optimized_stereo = np.zeros((len(optimized_data), channels))
+            for i in range(channels):
+                optimized_stereo[:, i] = optimized_data
+            optimized_data = optimized_stereo
+        
+        # 出力ファイルを保存
+        print("最適化された音声を保存しています...")
+        sf.write(output_file, optimized_data, samplerate)
     
     @staticmethod
-    def optimize_audio(input_file: str, output_file: str, profile: str = "default") -> bool:
+    @metrics.timed("optimize")
+    def optimize_audio(input_file: str, output_file: str, profile: str = "default",
+                       engine: Optional[str] = None, workers: Optional[int] = None,
+                       pad_seconds: float = 0.0) -> bool:
         """
         音声ファイルの周波数を最適化する
         
@@ -78,84 +395,41 @@ class FrequencyOptimizer:
             input_file: 入力音声ファイルのパス
             output_file: 出力音声ファイルのパス
             profile: 最適化プロファイル名
+            engine: "streaming"（ブロック処理）または "fft"（従来方式）。未指定の場合は設定値を使用
+            workers: チャンネルごとの並列処理に使用するスレッド数。未指定の場合は設定値を使用
+            pad_seconds: ループ素材として処理する場合のパディング（秒）。エッジでの過渡応答を防ぐ
             
         Returns:
             bool: 処理が成功したかどうか
         """
         try:
-            # 設定を読み込む
-            all_configs = FrequencyOptimizer.load_config()
-            
             # プロファイル設定を取得（指定がなければデフォルト）
-            if profile not in all_configs['profiles']:
-                print(f"警告: プロファイル '{profile}' が見つかりません。デフォルト設定を使用します。")
-                profile = "default"
-                
-            config = all_configs['profiles'][profile]
+            profile, config = FrequencyOptimizer.get_profile_config(profile)
             print(f"プロファイル '{profile}' の設定を適用します")
             
-            # 音声ファイルを読み込む
-            print("音声ファイルを読み込んでいます...")
-            data, samplerate = sf.read(input_file)
-            print(f"サンプリングレート: {samplerate}Hz")
-            print(f"データ長: {len(data)} サンプル")
-            
-            # ステレオの場合、モノラルに変換
-            if len(data.shape) > 1:
-                print("ステレオをモノラルに変換しています...")
-                data_mono = np.mean(data, axis=1)
-                print(f"変換後のデータ長: {len(data_mono)} サンプル")
-                
-                # モノラルデータをステレオに戻す準備（処理はモノラルで行い、結果をステレオに複製）
-                channels = data.shape[1]
-                stereo_result = True
+            optimizer_config = FrequencyOptimizer.load_config().get('optimizer', {})
+            if engine is None:
+                engine = optimizer_config.get('engine', 'streaming')
+            if workers is None:
+                workers = optimizer_config.get('workers', 1)
+            
+            if engine == "fft":
+                FrequencyOptimizer._optimize_audio_fft(input_file, output_file, config)
             else:
-                data_mono = data
-                stereo_result = False
-            
-            # FFTを実行
-            print("FFTを実行しています...")
-            fft_data = np.fft.fft(data_mono)
-            freqs = np.fft.fftfreq(len(data_mono), 1/samplerate)
-            
-            # 周波数帯域ごとのゲインを計算
-            print("周波数帯域の最適化を適用しています...")
-            gain = np.ones_like(freqs)
-            
-            # 低周波帯域の強調
-            low_freq_mask = (np.abs(freqs) >= config['low_freq_range'][0]) & (np.abs(freqs) <= config['low_freq_range'][1])
-            gain[low_freq_mask] *= 10 ** (config['low_boost'] / 20)
-            
-            # 泣き声周波数帯域の抑制
-            cry_freq_mask = (np.abs(freqs) >= config['cry_freq_range'][0]) & (np.abs(freqs) <= config['cry_freq_range'][1])
-            gain[cry_freq_mask] *= 10 ** (config['cry_reduction'] / 20)
-            
-            # ゲインを適用
-            fft_data *= gain
-            
-            # 逆FFTを実行
-            print("逆FFTを実行しています...")
-            optimized_data = np.real(np.fft.ifft(fft_data))
-            
-            # 正規化
-            print("音量を正規化しています...")
-            max_amplitude = np.max(np.abs(optimized_data))
-            optimized_data = optimized_data / max_amplitude * 0.95  # ヘッドルーム確保
-            
-            # ステレオの場合は結果をステレオに戻す
-            if stereo_result:
-                optimized_stereo = np.zeros((len(optimized_data), channels))
-                for i in range(channels):
-                    optimized_stereo[:, i] = optimized_data
-                optimized_data = optimized_stereo
-            
-            # 出力ファイルを保存
-            print("最適化された音声を保存しています...")
-            sf.write(output_file, optimized_data, samplerate)
+                FrequencyOptimizer._optimize_audio_streaming(
+                    input_file, output_file, profile,
+                    blocksize=optimizer_config.get('blocksize', 65536),
+                    workers=workers,
+                    mix_to_mono=optimizer_config.get('mix_to_mono', True),
+                    pad_seconds=pad_seconds
+                )
             
             print("周波数最適化が完了しました")
             return True
             
+        except JobCancelled:
+            # ジョブのキャンセルは失敗として扱わず、呼び出し元に伝える
+            raise
         except Exception as e:
             print(f"エラーが発生しました: {str(e)}")
             import traceback
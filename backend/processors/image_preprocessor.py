@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+from PIL import Image, ImageOps
+from typing import Dict, Tuple
+
+from processors import metrics, storage_manager
+
+
+class ImagePreprocessor:
+    """
+    Decodes uploaded images once and caches a normalized, ready-to-encode frame
+
+    Results are keyed by the image content hash, so the same background is
+    only decoded and resized once across jobs.
+    """
+
+    @staticmethod
+    @metrics.timed("image_prepare")
+    def prepare(image_file: str, cache_dir: str, size: Tuple[int, int] = (1280, 720)) -> Dict:
+        """
+        Get image metadata and a normalized frame of the given size
+
+        Static images are rotated according to EXIF, converted to RGB and
+        scaled/cropped to cover exactly ``size`` (even dimensions, suitable for
+        yuv420p). Animated images are left as they are.
+
+        Args:
+            image_file: Path to input image file
+            cache_dir: Directory for normalized frames and metadata
+            size: Target width and height (rounded down to even numbers)
+
+        Returns:
+            Dict with "path" (file to encode from), "hash", "is_animated",
+            "width", "height", "mode" and "format" of the source image
+        """
+        width, height = size[0] // 2 * 2, size[1] // 2 * 2
+        os.makedirs(cache_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        with open(image_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        image_hash = digest.hexdigest()
+
+        metadata_file = os.path.join(cache_dir, f"{image_hash}.json")
+        normalized_file = os.path.join(cache_dir, f"{image_hash}_{width}x{height}.png")
+
+        metadata = None
+        if os.path.exists(metadata_file):
+            try:
+                with open(metadata_file, 'r') as f:
+                    metadata = json.load(f)
+            except Exception:
+                metadata = None
+
+        if metadata is not None and (metadata["is_animated"] or os.path.exists(normalized_file)):
+            if not metadata["is_animated"]:
+                storage_manager.touch(normalized_file)
+            return ImagePreprocessor._result(image_file, normalized_file, image_hash, metadata)
+
+        with Image.open(image_file) as img:
+            metadata = {
+                "is_animated": bool(getattr(img, "is_animated", False)),
+                "width": img.width,
+                "height": img.height,
+                "mode": img.mode,
+                "format": img.format,
+            }
+
+            if not metadata["is_animated"]:
+                frame = ImageOps.exif_transpose(img).convert("RGB")
+                frame = ImageOps.fit(frame, (width, height), Image.LANCZOS)
+                tmp_file = f"{normalized_file}.{os.getpid()}.tmp.png"
+                frame.save(tmp_file, format="PNG")
+                os.replace(tmp_file, normalized_file)
+                storage_manager.track(normalized_file, "image")
+
+        tmp_file = f"{metadata_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_file, metadata_file)
+
+        return ImagePreprocessor._result(image_file, normalized_file, image_hash, metadata)
+
+    @staticmethod
+    def _result(image_file: str, normalized_file: str, image_hash: str, metadata: Dict) -> Dict:
+        path = image_file if metadata["is_animated"] else normalized_file
+        return {"path": path, "hash": image_hash, **metadata}
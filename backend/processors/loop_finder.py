@@ -0,0 +1,265 @@
+import os
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+from processors.config import Config
+from processors.pcm_buffer import PCMBuffer
+from processors.result_cache import ResultCache
+from processors import metrics, storage_manager
+
+# Envelope resolution used to compare the start and end of a clip
+ENVELOPE_RATE = 100
+
+# Level (relative to the loudest envelope frame) below which a frame counts as silence
+SILENCE_DB = -50.0
+
+# Number of loop start candidates tried in the head of the clip
+START_CANDIDATES = 16
+
+
+class LoopUnitUnavailable(ValueError):
+    """
+    Raised when a clip is too short (or empty) to build a crossfaded loop unit;
+    callers fall back to looping the clip with fades
+    """
+
+
+class LoopFinder:
+    """
+    Finds seamless loop points and builds crossfaded loop units
+
+    Loop start and end are chosen where the audio is most alike: a short
+    window after each candidate start is matched against the tail of the clip
+    by normalized FFT cross-correlation of a 10 ms RMS envelope, then aligned
+    to the sample on the waveform. All analysis runs on views of a decoded
+    PCMBuffer. The loop unit is the audio between the two
+    points with the material following the end crossfaded (equal power) into
+    the start, so repeating the unit back to back has no gap or level dip.
+    """
+
+    @staticmethod
+    def envelope(samples: np.ndarray, hop: int, blocksize: int = 1000) -> np.ndarray:
+        """
+        Compute the RMS envelope of the mono mix, block by block
+
+        Args:
+            samples: Audio (frames x channels), typically a memory-mapped view
+            hop: Frames per envelope value
+            blocksize: Envelope values computed per block
+
+        Returns:
+            np.ndarray: One RMS value per full hop
+        """
+        values = []
+        usable = len(samples) // hop * hop
+        for offset in range(0, usable, hop * blocksize):
+            mono = samples[offset:min(offset + hop * blocksize, usable)].mean(axis=1)
+            values.append(np.sqrt(np.mean(mono.reshape(-1, hop) ** 2, axis=1)))
+        return np.concatenate(values) if values else np.zeros(0, dtype=np.float32)
+
+    @staticmethod
+    def normalized_xcorr(template: np.ndarray, series: np.ndarray) -> np.ndarray:
+        """
+        Zero-mean normalized cross-correlation of a template at every offset of a series
+
+        Args:
+            template: Window to look for (length m)
+            series: Signal searched (length n >= m)
+
+        Returns:
+            np.ndarray: n - m + 1 scores in [-1, 1]
+        """
+        m, n = len(template), len(series)
+        series = series.astype(np.float64)
+        template = template.astype(np.float64) - template.mean()
+        norm = np.sqrt(np.sum(template ** 2))
+        if norm == 0:
+            return np.zeros(n - m + 1)
+
+        size = 1 << int(np.ceil(np.log2(n + m)))
+        products = np.fft.irfft(np.fft.rfft(series, size) * np.conj(np.fft.rfft(template, size)), size)[:n - m + 1]
+
+        # Per-offset standard deviation of the series from running sums
+        sums = np.concatenate(([0.0], np.cumsum(series)))
+        squares = np.concatenate(([0.0], np.cumsum(series ** 2)))
+        window_sum = sums[m:] - sums[:-m]
+        window_energy = np.maximum(squares[m:] - squares[:-m] - window_sum ** 2 / m, 0.0)
+        denominator = norm * np.sqrt(window_energy)
+        return np.where(denominator > 1e-12, products / np.maximum(denominator, 1e-12), 0.0)
+
+    @staticmethod
+    def find_loop_points(samples: np.ndarray, samplerate: int, crossfade_frames: int,
+                         min_loop_fraction: float = 0.5) -> Tuple[int, int, float]:
+        """
+        Find the loop start and end of a decoded clip
+
+        Args:
+            samples: Audio (frames x channels)
+            samplerate: Sample rate of the audio
+            crossfade_frames: Length of the crossfade in frames
+            min_loop_fraction: Shortest loop accepted, as a fraction of the audible part
+
+        Returns:
+            Tuple of (start frame, end frame, similarity score); audio from the
+            end frame onward is crossfaded into the start
+        """
+        frames = len(samples)
+        hop = max(samplerate // ENVELOPE_RATE, 1)
+
+        # Fall back to looping the whole clip when it is too short to search
+        if frames < 4 * crossfade_frames or frames < 4 * hop:
+            return 0, max(frames - crossfade_frames, 1), 0.0
+
+        env = LoopFinder.envelope(samples, hop)
+        log_env = np.log10(env + 1e-6)
+        audible = np.flatnonzero(20 * np.log10(env + 1e-12) > 20 * np.log10(env.max() + 1e-12) + SILENCE_DB)
+        # In digital silence every frame is within SILENCE_DB of the (zero) peak
+        if len(audible) == 0 or env.max() == 0:
+            return 0, frames - crossfade_frames, 0.0
+        first, last = int(audible[0]), int(audible[-1]) + 1
+
+        # Compare at least 2 s so the match covers more than one beat
+        window = max(int(np.ceil(crossfade_frames / hop)), 2 * ENVELOPE_RATE)
+        min_loop = int((last - first) * min_loop_fraction)
+        latest_start = first + (last - first) // 4
+        end_limit = min(last, len(env)) - window
+        if end_limit - first - min_loop <= 0:
+            return first * hop, frames - crossfade_frames, 0.0
+
+        best = (first, end_limit, -np.inf)
+        starts = np.linspace(first, min(latest_start, end_limit - min_loop), START_CANDIDATES)
+        for start in np.unique(starts.astype(int)):
+            lo = start + min_loop
+            scores = LoopFinder.normalized_xcorr(log_env[start:start + window], log_env[lo:end_limit + window])
+            # Prefer longer loops when matches are about as good
+            scores = scores + 0.02 * np.arange(len(scores)) / max(len(scores), 1)
+            offset = int(np.argmax(scores))
+            if scores[offset] > best[2]:
+                best = (int(start), lo + offset, float(scores[offset]))
+
+        start_frame, end_frame = best[0] * hop, best[1] * hop
+        end_frame = LoopFinder._align(samples, start_frame, end_frame, hop, samplerate)
+        end_frame = min(end_frame, frames - crossfade_frames)
+        return start_frame, end_frame, best[2]
+
+    @staticmethod
+    def _align(samples: np.ndarray, start_frame: int, end_frame: int, hop: int, samplerate: int) -> int:
+        # Shift the end by up to one hop so the waveforms at start and end are in phase
+        length = min(samplerate // 20, 4096)
+        head = samples[start_frame:start_frame + length].mean(axis=1)
+        tail = samples[max(end_frame - hop, 0):end_frame + hop + length].mean(axis=1)
+        if len(head) < length or len(tail) < length:
+            return end_frame
+        scores = LoopFinder.normalized_xcorr(head, tail)
+        return max(end_frame - hop, 0) + int(np.argmax(scores))
+
+    @staticmethod
+    def write_loop_unit(source: PCMBuffer, output_file: str, start_frame: int, end_frame: int,
+                        crossfade_frames: int, blocksize: int = 65536) -> PCMBuffer:
+        """
+        Write the crossfaded loop unit between two loop points
+
+        The first crossfade_frames of the unit blend the audio following the
+        end (fading out) with the audio at the start (fading in) using
+        equal-power curves; the rest is copied block by block.
+
+        Returns:
+            PCMBuffer: The loop unit
+
+        Raises:
+            LoopUnitUnavailable: If the loop points do not lie within the source
+        """
+        if not 0 <= start_frame < end_frame <= source.frames:
+            raise LoopUnitUnavailable(f"invalid loop points {start_frame}-{end_frame} in {source.frames} frames")
+        samples = source.samples
+        crossfade_frames = max(min(crossfade_frames, end_frame - start_frame, source.frames - end_frame), 0)
+        head = samples[start_frame:start_frame + crossfade_frames]
+        tail = samples[end_frame:end_frame + crossfade_frames]
+        angle = (np.arange(crossfade_frames, dtype=np.float32) + 0.5) / max(crossfade_frames, 1) * (np.pi / 2)
+
+        unit = PCMBuffer.create(output_file, source.sample_rate, source.channels, end_frame - start_frame,
+                                source.metadata)
+        out = unit.samples
+        out[:crossfade_frames] = head * np.sin(angle)[:, np.newaxis] + tail * np.cos(angle)[:, np.newaxis]
+        for offset in range(crossfade_frames, end_frame - start_frame, blocksize):
+            stop = min(offset + blocksize, end_frame - start_frame)
+            out[offset:stop] = samples[start_frame + offset:start_frame + stop]
+        unit.flush()
+        return unit
+
+    @staticmethod
+    @metrics.timed("loop_unit")
+    def get_loop_unit(input_file: str, crossfade_duration: float, sample_rate: int = 44100,
+                      frequency_factor: Optional[float] = None) -> PCMBuffer:
+        """
+        Get the seamless loop unit of an audio file, building it on a cache miss
+
+        Units are cached by the content hash of the input and the settings, so
+        repeat jobs with the same upload (any target duration) reuse them. A
+        PCM buffer made by AudioProcessor.decode_source is keyed by the upload
+        and frequency factor it was decoded from, like the upload itself.
+
+        Args:
+            input_file: Path to input audio file (or PCM buffer)
+            crossfade_duration: Crossfade length in seconds
+            sample_rate: Sample rate of the unit
+            frequency_factor: Optional factor to adjust frequency before analysis
+
+        Returns:
+            PCMBuffer: Stereo loop unit; its metadata has "start"/"end" (loop
+            points in seconds of the decoded input) and "score"
+
+        Raises:
+            LoopUnitUnavailable: If the decoded audio is shorter than two crossfades
+        """
+        if frequency_factor == 1.0:
+            frequency_factor = None
+        cache_dir = Config.section('audio').get('loop_cache_dir', './temp/cache/loops')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        origin = PCMBuffer.open(input_file).metadata.get("origin") if PCMBuffer.is_buffer(input_file) else None
+        if origin and frequency_factor is None:
+            audio_hash, frequency = origin["audio"], origin["frequency"]
+        else:
+            audio_hash, frequency = ResultCache.hash_file(input_file), frequency_factor
+        key = ResultCache.make_key("loop", audio=audio_hash, crossfade=crossfade_duration,
+                                   sample_rate=sample_rate, frequency=frequency)
+        unit_file = os.path.join(cache_dir, f"{key}{PCMBuffer.EXTENSION}")
+        if PCMBuffer.is_buffer(unit_file):
+            try:
+                unit = PCMBuffer.open(unit_file)
+                storage_manager.touch(unit_file)
+                return unit
+            except Exception:
+                pass
+
+        suffix = f"{os.getpid()}.{threading.get_ident()}"
+        decoded = PCMBuffer.decode(input_file, os.path.join(cache_dir, f"{key}.{suffix}.source.tmp.f32"),
+                                   sample_rate, 2, frequency_factor)
+        unit = None
+        try:
+            crossfade_frames = int(crossfade_duration * sample_rate)
+            # The unit needs a crossfade worth of audio plus the material crossfaded into its start
+            if decoded.frames < 2 * max(crossfade_frames, 1):
+                raise LoopUnitUnavailable(f"{decoded.duration:.3f}s of audio is shorter than two crossfades")
+            start, end, score = LoopFinder.find_loop_points(decoded.samples, sample_rate, crossfade_frames)
+            unit = LoopFinder.write_loop_unit(decoded, f"{unit_file}.{suffix}.tmp.f32", start, end, crossfade_frames)
+            unit.metadata = {**decoded.metadata, "start": start / sample_rate, "end": end / sample_rate,
+                             "score": score}
+            unit.write_sidecar()
+            unit.move(unit_file)
+        except BaseException:
+            if unit is not None:
+                unit.remove()
+            raise
+        finally:
+            # Keep the input when it already was a buffer in the right format
+            if decoded.path != input_file:
+                decoded.remove()
+            else:
+                decoded.close()
+        storage_manager.track(unit_file, "loop")
+
+        print(f"Loop points: {start / sample_rate:.3f}s - {end / sample_rate:.3f}s (score {score:.3f})")
+        return unit
@@ -0,0 +1,105 @@
+import os
+import json
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class MediaProbe:
+    """
+    Collects media metadata with a single ffprobe call per file
+
+    Results are memoized by (path, size, mtime), so a file is probed again
+    only if it changes.
+    """
+
+    MAX_ENTRIES = 256
+
+    _lock = threading.Lock()
+    _cache: "OrderedDict[Tuple[str, int, int], Dict]" = OrderedDict()
+
+    @staticmethod
+    def probe(file_path: str) -> Dict:
+        """
+        Get duration, sample rate, channels, codec and bitrate of a media file
+
+        Args:
+            file_path: Path to the media file
+
+        Returns:
+            Dict with "duration" (seconds), "sample_rate", "channels",
+            "codec", "bit_rate" of the first audio stream (None if absent),
+            "width"/"height" of the first video stream (None if absent) and
+            "format"
+        """
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+        with MediaProbe._lock:
+            cached = MediaProbe._cache.get(key)
+            if cached is not None:
+                MediaProbe._cache.move_to_end(key)
+                return dict(cached)
+
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-show_format',
+            '-show_streams',
+            '-of', 'json',
+            file_path
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        info = MediaProbe.parse(json.loads(result.stdout))
+
+        with MediaProbe._lock:
+            MediaProbe._cache[key] = info
+            while len(MediaProbe._cache) > MediaProbe.MAX_ENTRIES:
+                MediaProbe._cache.popitem(last=False)
+        return dict(info)
+
+    @staticmethod
+    def parse(data: Dict) -> Dict:
+        """
+        Extract the fields used by the pipeline from ffprobe JSON output
+        """
+        fmt = data.get('format', {})
+        streams = data.get('streams', [])
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+
+        def as_number(value, cast):
+            try:
+                return cast(value)
+            except (TypeError, ValueError):
+                return None
+
+        duration = as_number(fmt.get('duration'), float)
+        if duration is None and audio is not None:
+            duration = as_number(audio.get('duration'), float)
+
+        bit_rate = as_number(audio.get('bit_rate'), int) if audio else None
+        if bit_rate is None:
+            bit_rate = as_number(fmt.get('bit_rate'), int)
+
+        return {
+            "duration": duration,
+            "sample_rate": as_number(audio.get('sample_rate'), int) if audio else None,
+            "channels": audio.get('channels') if audio else None,
+            "codec": audio.get('codec_name') if audio else None,
+            "bit_rate": bit_rate,
+            "width": video.get('width') if video else None,
+            "height": video.get('height') if video else None,
+            "format": fmt.get('format_name'),
+        }
+
+    @staticmethod
+    def get_duration(file_path: str) -> float:
+        """
+        Get the duration of a media file in seconds
+        """
+        duration: Optional[float] = MediaProbe.probe(file_path)["duration"]
+        if duration is None:
+            raise ValueError(f"Could not determine duration of {file_path}")
+        return duration
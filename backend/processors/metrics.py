@@ -0,0 +1,366 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) for stage timings, from image decodes to 10 h renders
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+# Snapshot files holding the counts of workers that stopped publishing
+RETIRED_PREFIX = "retired-"
+
+# Name of the pipeline stage running in the current thread, used to label ffmpeg timings
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("stage", default=None)
+
+
+class Metric:
+    """
+    Base class of labelled metrics kept in process memory
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return [(key, _copy(value)) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+    return value
+
+
+class Registry:
+    """
+    Collection of metrics that can be rendered in the Prometheus text format
+
+    Worker processes write their counters and histograms to snapshot files
+    (see ``write_snapshot``); the API process adds them to its own values
+    when rendering, so /metrics covers every worker. Snapshots of workers
+    that stopped are folded into a retired total, so counters never go down.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, List]:
+        """
+        Get the current counter and histogram values (gauges are process-local)
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: [[list(key), value] for key, value in m.samples()]
+                for m in metrics if m.kind != "gauge"}
+
+    def write_snapshot(self, path: str):
+        """
+        Atomically write the snapshot of this process to a JSON file
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def render(self, snapshot_dir: Optional[str] = None, max_snapshot_age: float = 86400) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Args:
+            snapshot_dir: Directory of worker snapshot files to add in
+            max_snapshot_age: Fold snapshot files not updated for this many seconds
+                              into the retired total
+        """
+        snapshots = _read_snapshots(snapshot_dir, max_snapshot_age) if snapshot_dir else []
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            values = dict(metric.samples())
+            for snapshot in snapshots:
+                for key, value in snapshot.get(metric.name, []):
+                    values[tuple(key)] = _merge(values.get(tuple(key)), value)
+
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(values.items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.kind == "histogram":
+                    for bound, count in zip(metric.buckets, value["buckets"]):
+                        lines.append(f"{metric.name}_bucket{_labels({**labels, 'le': _number(bound)})} {count}")
+                    lines.append(f"{metric.name}_bucket{_labels({**labels, 'le': '+Inf'})} {value['count']}")
+                    lines.append(f"{metric.name}_sum{_labels(labels)} {_number(value['sum'])}")
+                    lines.append(f"{metric.name}_count{_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{metric.name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _read_snapshots(snapshot_dir: str, max_age: float) -> List[Dict]:
+    snapshots = []
+    if not os.path.isdir(snapshot_dir):
+        return snapshots
+    now = time.time()
+    expired = []
+    for filename in os.listdir(snapshot_dir):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(snapshot_dir, filename)
+        try:
+            # A worker that has not published for max_age is gone; its last counts are kept
+            if not filename.startswith(RETIRED_PREFIX) and now - os.path.getmtime(path) > max_age:
+                expired.append(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+
+    if expired:
+        retired = [os.path.join(snapshot_dir, filename) for filename in os.listdir(snapshot_dir)
+                   if filename.startswith(RETIRED_PREFIX) and filename.endswith(".json")]
+        # The retired files are read again as part of the fold
+        snapshots = [s for s in snapshots if not s.get("_retired")]
+        snapshots.append(_fold_snapshots(snapshot_dir, retired + expired))
+    return snapshots
+
+
+def _fold_snapshots(snapshot_dir: str, paths: List[str]) -> Dict:
+    """
+    Merge snapshot files into one new retired file and delete them
+
+    Each file is claimed by renaming it first, so concurrent renders never
+    fold the same file twice.
+    """
+    claimed = []
+    for path in paths:
+        try:
+            os.rename(path, f"{path}.folding")
+            claimed.append(f"{path}.folding")
+        except OSError:
+            continue
+
+    folded: Dict[str, Dict[tuple, Any]] = {}
+    for path in claimed:
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, samples in snapshot.items():
+            if name == "_retired":
+                continue
+            values = folded.setdefault(name, {})
+            for key, value in samples:
+                values[tuple(key)] = _merge(values.get(tuple(key)), value)
+
+    retired = {name: [[list(key), value] for key, value in values.items()] for name, values in folded.items()}
+    retired["_retired"] = True
+    path = os.path.join(snapshot_dir, f"{RETIRED_PREFIX}{uuid.uuid4().hex}.json")
+    try:
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(retired, f)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        # Keep the claimed files so the counts are not lost
+        print(f"Could not write retired metrics: {e}")
+        for claimed_path in claimed:
+            try:
+                os.rename(claimed_path, claimed_path[:-len(".folding")])
+            except OSError:
+                pass
+        return retired
+    for claimed_path in claimed:
+        try:
+            os.remove(claimed_path)
+        except OSError:
+            pass
+    return retired
+
+
+def _merge(current: Any, value: Any) -> Any:
+    if current is None:
+        return _copy(value)
+    if isinstance(current, dict):
+        return {"buckets": [a + b for a, b in zip(current["buckets"], value["buckets"])],
+                "sum": current["sum"] + value["sum"], "count": current["count"] + value["count"]}
+    return current + value
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+stage_duration = registry.histogram(
+    "bgm_stage_duration_seconds", "Wall time of pipeline stages", ["stage"])
+stage_failures = registry.counter(
+    "bgm_stage_failures_total", "Pipeline stages that raised an error", ["stage"])
+ffmpeg_duration = registry.histogram(
+    "bgm_ffmpeg_duration_seconds", "Wall time of ffmpeg invocations by pipeline stage", ["stage"])
+ffmpeg_failures = registry.counter(
+    "bgm_ffmpeg_failures_total", "ffmpeg invocations that exited with an error", ["stage"])
+jobs_finished = registry.counter(
+    "bgm_jobs_finished_total", "Jobs that reached a final status", ["status"])
+upload_bytes = registry.counter(
+    "bgm_upload_bytes_total", "Bytes received in uploads", ["kind"])
+download_bytes = registry.counter(
+    "bgm_download_bytes_total", "Bytes of rendered files sent to clients")
+queue_depth = registry.gauge(
+    "bgm_queue_depth", "Jobs waiting in the job queue")
+active_jobs = registry.gauge(
+    "bgm_active_jobs", "Jobs being rendered by a worker", ["job_class"])
+temp_disk_bytes = registry.gauge(
+    "bgm_temp_disk_bytes", "Disk space used under ./temp", ["directory"])
+
+
+def current_stage() -> Optional[str]:
+    """
+    Get the name of the pipeline stage running in this thread
+    """
+    return _current_stage.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a pipeline stage and label the ffmpeg calls made inside it
+
+    Nested stages are timed separately; ffmpeg calls carry the innermost name.
+    """
+    token = _current_stage.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_failures.inc(stage=name)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - started, stage=name)
+        _current_stage.reset(token)
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorator form of ``stage``
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def directory_size(path: str) -> int:
+    """
+    Total size in bytes of the files below a directory
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.stat(os.path.join(root, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
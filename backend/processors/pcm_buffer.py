@@ -0,0 +1,210 @@
+import os
+import json
+import numpy as np
+from typing import Dict, Iterator, List, Optional
+
+from processors.ffmpeg_runner import FFmpegRunner
+from processors.media_probe import MediaProbe
+from processors import metrics
+
+
+class PCMBuffer:
+    """
+    Decoded audio kept as raw float32 PCM in a scratch file and memory-mapped
+
+    The samples live in ``<name>.f32`` (interleaved frames x channels) next
+    to a ``<name>.f32.json`` sidecar with the sample rate, channel count,
+    frame count and the probe metadata of the source. In-Python stages work
+    on zero-copy views of the mapping, so the source is decoded once and the
+    pages are shared through the page cache instead of process memory.
+    """
+
+    EXTENSION = ".f32"
+
+    def __init__(self, path: str, sample_rate: int, channels: int, frames: int,
+                 metadata: Optional[Dict] = None, writable: bool = False):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = frames
+        self.metadata = metadata or {}
+        self.writable = writable
+        self._samples: Optional[np.ndarray] = None
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate
+
+    @property
+    def samples(self) -> np.ndarray:
+        """
+        Memory-mapped samples (frames x channels)
+        """
+        if self._samples is None:
+            if self.frames == 0:
+                self._samples = np.zeros((0, self.channels), dtype=np.float32)
+            else:
+                self._samples = np.memmap(self.path, dtype=np.float32, mode='r+' if self.writable else 'r',
+                                          shape=(self.frames, self.channels))
+        return self._samples
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        Zero-copy view of frames [start, end)
+        """
+        return self.samples[max(start, 0):end]
+
+    def blocks(self, blocksize: int = 65536, start: int = 0, end: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Iterate over zero-copy views of consecutive blocks
+        """
+        end = self.frames if end is None else min(end, self.frames)
+        for offset in range(start, end, blocksize):
+            yield self.samples[offset:min(offset + blocksize, end)]
+
+    def ffmpeg_input(self) -> List[str]:
+        """
+        ffmpeg arguments reading this buffer as an input
+        """
+        return ['-f', 'f32le', '-ar', str(self.sample_rate), '-ac', str(self.channels), '-i', self.path]
+
+    def flush(self) -> None:
+        if self._samples is not None and isinstance(self._samples, np.memmap):
+            self._samples.flush()
+
+    def close(self) -> None:
+        """
+        Release the mapping (the file is kept)
+        """
+        self.flush()
+        self._samples = None
+
+    def remove(self) -> None:
+        """
+        Release the mapping and delete the file and its sidecar
+        """
+        self.close()
+        PCMBuffer.delete(self.path)
+
+    def move(self, path: str) -> "PCMBuffer":
+        """
+        Atomically rename the buffer (data first, then sidecar)
+        """
+        self.close()
+        os.replace(self.path, path)
+        os.replace(PCMBuffer.sidecar(self.path), PCMBuffer.sidecar(path))
+        self.path = path
+        self.writable = False
+        return self
+
+    def write_sidecar(self) -> None:
+        sidecar = PCMBuffer.sidecar(self.path)
+        tmp_file = f"{sidecar}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"sample_rate": self.sample_rate, "channels": self.channels,
+                       "frames": self.frames, "metadata": self.metadata}, f)
+        os.replace(tmp_file, sidecar)
+
+    @staticmethod
+    def sidecar(path: str) -> str:
+        return f"{path}.json"
+
+    @staticmethod
+    def is_buffer(path: str) -> bool:
+        return path.endswith(PCMBuffer.EXTENSION) and os.path.exists(PCMBuffer.sidecar(path))
+
+    @staticmethod
+    def open(path: str) -> "PCMBuffer":
+        """
+        Open an existing buffer read-only
+        """
+        with open(PCMBuffer.sidecar(path), 'r') as f:
+            header = json.load(f)
+        return PCMBuffer(path, header["sample_rate"], header["channels"], header["frames"], header["metadata"])
+
+    @staticmethod
+    def create(path: str, sample_rate: int, channels: int, frames: int,
+               metadata: Optional[Dict] = None) -> "PCMBuffer":
+        """
+        Allocate a writable buffer of the given size (sparse until written)
+        """
+        with open(path, 'wb') as f:
+            f.truncate(frames * channels * 4)
+        buffer = PCMBuffer(path, sample_rate, channels, frames, metadata, writable=True)
+        buffer.write_sidecar()
+        return buffer
+
+    @staticmethod
+    def delete(path: str) -> None:
+        for file_path in [path, PCMBuffer.sidecar(path)]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    @staticmethod
+    def input_args(path: str) -> List[str]:
+        """
+        ffmpeg input arguments for a path that may be a PCM buffer or a media file
+        """
+        return PCMBuffer.open(path).ffmpeg_input() if PCMBuffer.is_buffer(path) else ['-i', path]
+
+    @staticmethod
+    def probe(path: str) -> Dict:
+        """
+        Probe metadata of a media file, or of the source of a PCM buffer
+        (with the buffer's own duration and sample rate)
+        """
+        if not PCMBuffer.is_buffer(path):
+            return MediaProbe.probe(path)
+        buffer = PCMBuffer.open(path)
+        return {**buffer.metadata, "duration": buffer.duration, "sample_rate": buffer.sample_rate,
+                "channels": buffer.channels, "codec": "pcm_f32le"}
+
+    @staticmethod
+    def decode(input_file: str, output_file: str, sample_rate: int = 44100, channels: int = 2,
+               frequency_factor: Optional[float] = None) -> "PCMBuffer":
+        """
+        Decode audio once into a PCM buffer, applying the frequency adjustment
+
+        A buffer that already has the requested format is reused as it is.
+
+        Args:
+            input_file: Path to input audio file (or PCM buffer)
+            output_file: Path of the new buffer (should end in .f32)
+            sample_rate: Sample rate of the buffer
+            channels: Channel count of the buffer
+            frequency_factor: Optional factor to adjust frequency
+
+        Returns:
+            PCMBuffer: The decoded audio
+
+        Raises:
+            ValueError: If the input contains no audio
+        """
+        if frequency_factor == 1.0:
+            frequency_factor = None
+        # The frequency adjustment runs inside this decode, so such decodes are timed as their own stage
+        with metrics.stage("decode" if frequency_factor is None else "frequency_adjust"):
+            return PCMBuffer._decode(input_file, output_file, sample_rate, channels, frequency_factor)
+
+    @staticmethod
+    def _decode(input_file: str, output_file: str, sample_rate: int, channels: int,
+                frequency_factor: Optional[float]) -> "PCMBuffer":
+        if PCMBuffer.is_buffer(input_file) and frequency_factor is None:
+            source = PCMBuffer.open(input_file)
+            if source.sample_rate == sample_rate and source.channels == channels:
+                return source
+
+        metadata = PCMBuffer.probe(input_file)
+        cmd = ['ffmpeg', '-y'] + PCMBuffer.input_args(input_file) + ['-vn']
+        if frequency_factor is not None:
+            cmd += ['-filter:a', f'asetrate=44100*{frequency_factor},aresample=44100']
+        cmd += ['-ar', str(sample_rate), '-ac', str(channels), '-f', 'f32le', '-c:a', 'pcm_f32le', output_file]
+        FFmpegRunner.run(cmd)
+
+        frames = os.path.getsize(output_file) // (4 * channels)
+        if frames == 0:
+            os.remove(output_file)
+            raise ValueError(f"No audio could be decoded from {input_file}")
+        buffer = PCMBuffer(output_file, sample_rate, channels, frames, metadata)
+        buffer.write_sidecar()
+        return buffer
@@ -0,0 +1,76 @@
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+
+def scaled(on_progress: Optional[Callable[[float], None]], start: float, end: float) -> Optional[Callable[[float], None]]:
+    """
+    Map a sub-step's 0.0-1.0 progress into the [start, end] part of a parent callback
+
+    Args:
+        on_progress: Parent progress callback (may be None)
+        start: Parent fraction at which the sub-step begins
+        end: Parent fraction at which the sub-step ends
+
+    Returns:
+        Progress callback for the sub-step, or None if there is no parent
+    """
+    if on_progress is None:
+        return None
+    return lambda fraction: on_progress(start + (end - start) * fraction)
+
+
+class ProgressTracker:
+    """
+    Combines per-stage progress into one weighted job progress with an ETA
+
+    Args:
+        weights: Relative weight of each stage, in execution order
+        callback: Called with (percent, stage, eta_seconds) on every update
+        start_percent: Percentage reported when the first stage starts
+        end_percent: Percentage reported when the last stage completes
+        min_interval: Minimum seconds between callbacks (the final update is always sent)
+    """
+
+    def __init__(self, weights: Dict[str, float],
+                 callback: Callable[[int, str, Optional[float]], None],
+                 start_percent: int = 0, end_percent: int = 100, min_interval: float = 0.5):
+        total = sum(weights.values())
+        self.weights = {stage: weight / total for stage, weight in weights.items()}
+        self.callback = callback
+        self.start_percent = start_percent
+        self.end_percent = end_percent
+        self.min_interval = min_interval
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._fractions = {stage: 0.0 for stage in weights}
+        self._last_report = 0.0
+
+    def stage(self, name: str) -> Callable[[float], None]:
+        """
+        Get the progress callback for a stage
+        """
+        return lambda fraction: self.update(name, fraction)
+
+    def update(self, name: str, fraction: float):
+        """
+        Record a stage's completed fraction and report the overall progress
+        """
+        with self._lock:
+            self._fractions[name] = max(self._fractions.get(name, 0.0), min(fraction, 1.0))
+            # Earlier stages are complete once a later one reports progress
+            for stage in self.weights:
+                if stage == name:
+                    break
+                self._fractions[stage] = 1.0
+
+            overall = sum(self.weights[s] * f for s, f in self._fractions.items())
+            now = time.monotonic()
+            if now - self._last_report < self.min_interval and fraction < 1.0:
+                return
+            self._last_report = now
+
+        elapsed = now - self.started_at
+        eta = elapsed * (1 - overall) / overall if overall > 0 else None
+        percent = int(self.start_percent + (self.end_percent - self.start_percent) * overall)
+        self.callback(percent, name, eta)
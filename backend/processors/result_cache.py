@@ -0,0 +1,186 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from processors import storage_manager
+
+class ResultCache:
+    """
+    Content-addressed cache for rendered audio and video files
+
+    Entries are stored as ``<key><ext>`` in the cache directory. The key is a
+    hash of the input file contents and every processing parameter, so equal
+    requests map to the same entry. The total size is bounded by evicting the
+    least recently used entries. Recency is kept in the storage index, not in
+    the file mtime: outputs are hard links to the entries, and their ETags
+    must not change when a later request hits the same entry.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Compute the SHA-256 hex digest of a file
+
+        Args:
+            file_path: Path to the file
+            chunk_size: Read size in bytes
+
+        Returns:
+            Hex digest of the file contents
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(kind: str, **parts) -> str:
+        """
+        Build a cache key from content hashes and processing parameters
+
+        Args:
+            kind: Entry kind (e.g. "audio", "video")
+            **parts: Content hashes and parameters that affect the result
+
+        Returns:
+            Hex digest identifying the entry
+        """
+        payload = json.dumps({"kind": kind, **parts}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{ext}")
+
+    def _count(self, kind: str, outcome: str):
+        with self._lock:
+            counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0})
+            counters[outcome] += 1
+
+    def get(self, kind: str, key: str, ext: str) -> Optional[str]:
+        """
+        Look up a cached entry and mark it as recently used
+
+        Args:
+            kind: Entry kind, used for the hit/miss counters
+            key: Cache key
+            ext: File extension including the dot
+
+        Returns:
+            Path to the cached file, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(key, ext)
+        if not os.path.isfile(path):
+            self._count(kind, "misses")
+            return None
+
+        self._count(kind, "hits")
+        storage_manager.touch(path)
+        return path
+
+    def put(self, kind: str, key: str, ext: str, source_file: str) -> Optional[str]:
+        """
+        Store a file in the cache and evict old entries if over the size limit
+
+        Args:
+            kind: Entry kind
+            key: Cache key
+            ext: File extension including the dot
+            source_file: File to store (it is linked, not moved)
+
+        Returns:
+            Path to the cached file, or None if caching is disabled
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(key, ext)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        ResultCache.link_or_copy(source_file, tmp_path)
+        os.replace(tmp_path, path)
+        storage_manager.track(path, "cache")
+
+        self.evict()
+        return path
+
+    @staticmethod
+    def link_or_copy(source_file: str, dest_file: str) -> str:
+        """
+        Hard-link a file, falling back to a copy across file systems
+
+        Args:
+            source_file: Existing file
+            dest_file: New path
+
+        Returns:
+            The destination path
+        """
+        if os.path.exists(dest_file):
+            os.remove(dest_file)
+        try:
+            os.link(source_file, dest_file)
+        except OSError:
+            shutil.copyfile(source_file, dest_file)
+        return dest_file
+
+    def evict(self) -> int:
+        """
+        Remove least recently used entries until the cache fits in max_bytes
+
+        Returns:
+            Number of bytes freed
+        """
+        entries = []
+        total = 0
+        # Entries missing from the index fall back to their mtime (when they were stored)
+        accessed = storage_manager.last_access("cache")
+        for filename in os.listdir(self.cache_dir):
+            file_path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            if not os.path.isfile(file_path):
+                continue
+            entries.append((accessed.get(os.path.abspath(file_path), stat.st_mtime), stat.st_size, file_path))
+            total += stat.st_size
+
+        freed = 0
+        removed = []
+        for _, size, file_path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+                freed += size
+                removed.append(file_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error evicting cache entry {file_path}: {e}")
+
+        if removed:
+            storage_manager.untrack(removed)
+        return freed
+
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters per entry kind
+        """
+        with self._lock:
+            counters = {kind: dict(values) for kind, values in self._counters.items()}
+        return {"enabled": self.enabled, "max_bytes": self.max_bytes, "counters": counters}
@@ -0,0 +1,485 @@
+import os
+import re
+import time
+import shutil
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from processors.config import Config
+
+# Kinds evicted first when space is needed (uploads are useless once their job finished)
+EVICTION_PRIORITY = {"upload": 0, "output": 1, "cache": 2, "image": 2, "segment": 2, "loop": 2}
+
+# Leftovers of interrupted renders in the output directory
+ORPHAN_PATTERNS = [
+    re.compile(r"^temp_[0-9a-f-]{36}$"),                                  # AudioLooper scratch dirs
+    re.compile(r"\.tmp(\.\w+)*$"),                                        # Partially written files
+    re.compile(r"\.segments\.txt$"),                                      # Concat lists
+    re.compile(r"^[0-9a-f-]{36}_(1|2|3|source|final|unit)\.(mp3|wav|f32)(\.json)?$"),  # Pipeline intermediates
+    re.compile(r"_prescaled\.png$"),
+]
+
+# Job being rendered in the current thread; shared artifacts it uses are pinned to it
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("storage_job", default=None)
+
+
+class StorageManager:
+    """
+    Index of the files created under ./temp, with a byte quota
+
+    Every artifact (upload, rendered output, cache entry, image, segment or loop unit)
+    is recorded with its size, owning job and last access time in a SQLite
+    table shared by the API and the workers. Hard links (e.g. an output linked
+    from the result cache) are counted once. When the indexed total exceeds
+    quota_bytes or the disk runs low on free space, the least recently used
+    artifacts are deleted, skipping those owned by or pinned to jobs still
+    queued or running and those used within protect_seconds. Shared
+    artifacts (cache entries, images, segments, loop units) are pinned to
+    every job that creates or reuses them until the job releases its pins.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            path TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            job_id TEXT,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            inode TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts (last_access);
+        CREATE INDEX IF NOT EXISTS idx_artifacts_job_id ON artifacts (job_id);
+        CREATE TABLE IF NOT EXISTS artifact_pins (
+            path TEXT NOT NULL,
+            job_id TEXT NOT NULL,
+            PRIMARY KEY (path, job_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_artifact_pins_job_id ON artifact_pins (job_id);
+    """
+
+    def __init__(self, index_path: str, roots: Dict[str, str], quota_bytes: int,
+                 min_free_bytes: int = 0, low_watermark: float = 0.9,
+                 protect_seconds: float = 3600, orphan_grace_seconds: float = 3600,
+                 active_jobs: Optional[Callable[[], Set[str]]] = None,
+                 running_jobs: Optional[Callable[[], Set[str]]] = None):
+        self.index_path = index_path
+        self.roots = roots
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.low_watermark = low_watermark
+        self.protect_seconds = protect_seconds
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.active_jobs = active_jobs
+        self.running_jobs = running_jobs
+        self._local = threading.local()
+        self._enforcing = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        # Indexes created before hard links were deduplicated lack the inode column
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(artifacts)")}
+        if "inode" not in columns:
+            conn.execute("ALTER TABLE artifacts ADD COLUMN inode TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_inode ON artifacts (inode)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    @staticmethod
+    def _inode(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}"
+
+    def register(self, path: str, kind: str, job_id: Optional[str] = None,
+                 pinned_by: Optional[str] = None) -> None:
+        """
+        Record a new or rewritten artifact
+
+        If this pushes the total over the quota, eviction starts on a
+        background thread.
+
+        Args:
+            path: Path of the file
+            kind: "upload", "output", "cache", "image", "segment" or "loop"
+            job_id: Job that owns the file, if any
+            pinned_by: Job that uses the file without owning it, if any
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        now = time.time()
+        key = self._key(path)
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO artifacts (path, kind, job_id, size, created_at, last_access, inode) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, job_id = COALESCE(excluded.job_id, job_id), "
+            "size = excluded.size, last_access = excluded.last_access, inode = excluded.inode",
+            (key, kind, job_id, st.st_size, now, now, self._inode(st))
+        )
+        if pinned_by:
+            conn.execute("INSERT OR IGNORE INTO artifact_pins (path, job_id) VALUES (?, ?)", (key, pinned_by))
+        if self.under_pressure():
+            threading.Thread(target=self.enforce, name="storage-evict", daemon=True).start()
+
+    def touch(self, path: str, pinned_by: Optional[str] = None) -> None:
+        """
+        Mark an artifact as used (e.g. downloaded or served from cache)
+
+        Args:
+            path: Path of the file
+            pinned_by: Job that is about to read the file, if any
+        """
+        key = self._key(path)
+        conn = self._connect()
+        conn.execute("UPDATE artifacts SET last_access = ? WHERE path = ?", (time.time(), key))
+        if pinned_by:
+            conn.execute("INSERT OR IGNORE INTO artifact_pins (path, job_id) VALUES (?, ?)", (key, pinned_by))
+
+    def last_access(self, kind: str) -> Dict[str, float]:
+        """
+        Get the last access time of every indexed artifact of a kind, by absolute path
+        """
+        rows = self._connect().execute("SELECT path, last_access FROM artifacts WHERE kind = ?", (kind,))
+        return {row["path"]: row["last_access"] for row in rows}
+
+    def release(self, job_id: str) -> None:
+        """
+        Drop the pins a job holds once it no longer reads its shared artifacts
+        """
+        self._connect().execute("DELETE FROM artifact_pins WHERE job_id = ?", (job_id,))
+
+    def forget(self, paths: Iterable[str]) -> None:
+        """
+        Drop deleted files from the index
+        """
+        keys = [(self._key(path),) for path in paths]
+        conn = self._connect()
+        conn.executemany("DELETE FROM artifacts WHERE path = ?", keys)
+        conn.executemany("DELETE FROM artifact_pins WHERE path = ?", keys)
+
+    # Rows sharing an inode are hard links to the same data; each file is counted once
+    _UNIQUE_FILES = "SELECT kind, MAX(size) AS size FROM artifacts GROUP BY COALESCE(inode, path)"
+
+    def usage(self) -> Dict[str, int]:
+        """
+        Get the indexed bytes per artifact kind (hard-linked files count once)
+        """
+        rows = self._connect().execute(
+            f"SELECT kind, SUM(size) AS total FROM ({self._UNIQUE_FILES}) GROUP BY kind")
+        return {row["kind"]: row["total"] for row in rows}
+
+    def _total(self) -> int:
+        return self._connect().execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM ({self._UNIQUE_FILES})").fetchone()[0]
+
+    def _pinned_paths(self, protected: Set[str]) -> Set[str]:
+        rows = self._connect().execute("SELECT path, job_id FROM artifact_pins")
+        return {row["path"] for row in rows if row["job_id"] in protected}
+
+    def _free_bytes(self) -> int:
+        root = next(iter(self.roots.values()))
+        try:
+            return shutil.disk_usage(root).free
+        except OSError:
+            return self.min_free_bytes
+
+    def under_pressure(self) -> bool:
+        """
+        Check whether the quota is exceeded or free disk space is below min_free_bytes
+        """
+        return self._total() > self.quota_bytes or self._free_bytes() < self.min_free_bytes
+
+    def enforce(self) -> int:
+        """
+        Evict least recently used artifacts until usage is back under the low watermark
+
+        Returns:
+            Number of bytes freed (0 if another eviction was already running)
+        """
+        if not self._enforcing.acquire(blocking=False):
+            return 0
+        try:
+            return self._evict()
+        finally:
+            self._enforcing.release()
+
+    def _evict(self) -> int:
+        target = self.quota_bytes * self.low_watermark
+        total = self._total()
+        shortfall = self.min_free_bytes - self._free_bytes()
+        if total <= self.quota_bytes and shortfall <= 0:
+            return 0
+
+        protected = self.active_jobs() if self.active_jobs else set()
+        pinned = self._pinned_paths(protected)
+        recent = time.time() - self.protect_seconds
+        rows = self._connect().execute(
+            "SELECT path, kind, job_id, size, last_access, inode FROM artifacts").fetchall()
+
+        # Space only comes back once every link to a file is gone, so hard links
+        # are evicted together and a file is kept if any of its links is in use
+        files: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            files.setdefault(row["inode"] or row["path"], []).append(row)
+        candidates = sorted(
+            (links for links in files.values()
+             if not any(row["job_id"] in protected or row["path"] in pinned or row["last_access"] >= recent
+                        for row in links)),
+            key=lambda links: (max(EVICTION_PRIORITY.get(row["kind"], 1) for row in links),
+                               max(row["last_access"] for row in links))
+        )
+
+        freed = 0
+        removed = []
+        for links in candidates:
+            if total - freed <= target and shortfall - freed <= 0:
+                break
+            deleted = []
+            for row in links:
+                try:
+                    _remove_artifact(row["path"])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Error evicting {row['path']}: {e}")
+                    continue
+                deleted.append(row["path"])
+            removed.extend(deleted)
+            if len(deleted) == len(links):
+                freed += max(row["size"] for row in links)
+
+        self.forget(removed)
+        if total - freed > self.quota_bytes:
+            print(f"Storage quota still exceeded after eviction ({total - freed} bytes in use)")
+        return freed
+
+    def expire(self, kinds: Iterable[str], max_age_hours: float) -> int:
+        """
+        Delete artifacts of the given kinds not used for max_age_hours
+
+        Returns:
+            Number of files deleted
+        """
+        protected = self.active_jobs() if self.active_jobs else set()
+        pinned = self._pinned_paths(protected)
+        cutoff = time.time() - max_age_hours * 3600
+        kinds = list(kinds)
+        rows = self._connect().execute(
+            f"SELECT path, job_id FROM artifacts WHERE last_access < ? AND kind IN ({','.join('?' for _ in kinds)})",
+            (cutoff, *kinds)
+        ).fetchall()
+
+        removed = []
+        for row in rows:
+            if row["job_id"] in protected or row["path"] in pinned:
+                continue
+            try:
+                _remove_artifact(row["path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error deleting file {row['path']}: {e}")
+                continue
+            removed.append(row["path"])
+        self.forget(removed)
+        return len(removed)
+
+    def sweep(self) -> int:
+        """
+        Reconcile the index with the disk
+
+        Removes leftovers of interrupted renders (scratch dirs, partial and
+        intermediate files) older than orphan_grace_seconds, drops index rows
+        whose file is gone, adopts unindexed files in the managed roots and
+        drops the pins of jobs that are no longer queued or running.
+
+        Intermediates are not indexed with their job, so leftovers are only
+        removed while no job is running: a long render (or a batch reading
+        its decoded source across variants) keeps files that look stale.
+
+        Returns:
+            Number of orphans removed
+        """
+        conn = self._connect()
+        rows = conn.execute("SELECT path, inode FROM artifacts").fetchall()
+        indexed = {row["path"] for row in rows}
+        # Rows indexed before hard links were deduplicated get their inode now
+        for row in rows:
+            if row["inode"] is None:
+                try:
+                    conn.execute("UPDATE artifacts SET inode = ? WHERE path = ?",
+                                  (self._inode(os.stat(row["path"])), row["path"]))
+                except OSError:
+                    pass
+        cutoff = time.time() - self.orphan_grace_seconds
+        removed = 0
+        busy = bool(self.running_jobs and self.running_jobs())
+
+        for kind, root in self.roots.items():
+            if not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                key = self._key(path)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                if any(pattern.search(name) for pattern in ORPHAN_PATTERNS):
+                    if not busy and _last_modified(path, st) < cutoff and key not in indexed:
+                        try:
+                            if os.path.isdir(path):
+                                shutil.rmtree(path)
+                            else:
+                                os.remove(path)
+                            removed += 1
+                        except OSError as e:
+                            print(f"Error removing orphan {path}: {e}")
+                    continue
+
+                if os.path.isfile(path) and key not in indexed and not name.endswith((".json", ".sqlite3")):
+                    conn.execute(
+                        "INSERT OR IGNORE INTO artifacts (path, kind, job_id, size, created_at, last_access, inode) "
+                        "VALUES (?, ?, NULL, ?, ?, ?, ?)",
+                        (key, kind, st.st_size, st.st_mtime, st.st_mtime, self._inode(st))
+                    )
+
+        self.forget(path for path in indexed if not os.path.exists(path))
+        if self.active_jobs:
+            protected = self.active_jobs()
+            stale = {row["job_id"] for row in conn.execute("SELECT DISTINCT job_id FROM artifact_pins")} - protected
+            conn.executemany("DELETE FROM artifact_pins WHERE job_id = ?", [(job_id,) for job_id in stale])
+        return removed
+
+
+def _remove_artifact(path: str) -> None:
+    os.remove(path)
+    # PCM buffers keep their format in a JSON sidecar
+    if os.path.exists(f"{path}.json"):
+        os.remove(f"{path}.json")
+
+
+def _last_modified(path: str, st: os.stat_result) -> float:
+    # A scratch dir is in use as long as a render keeps writing to its files
+    if not os.path.isdir(path):
+        return st.st_mtime
+    latest = st.st_mtime
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                latest = max(latest, os.stat(os.path.join(root, filename)).st_mtime)
+            except FileNotFoundError:
+                pass
+    return latest
+
+
+_manager: Optional[StorageManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """
+    Get the process-wide storage manager configured by the "storage" config section
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            config = Config.section("storage")
+            video_config = Config.section("video")
+            audio_config = Config.section("audio")
+            _manager = StorageManager(
+                config.get("index_path", Config.section("jobs").get("store_path", "./temp/jobs/jobs.sqlite3")),
+                roots={
+                    "upload": "./temp/uploads",
+                    "output": "./temp/outputs",
+                    "cache": "./temp/cache",
+                    "image": video_config.get("image_cache_dir", "./temp/cache/images"),
+                    "segment": video_config.get("segment_cache_dir", "./temp/cache/segments"),
+                    "loop": audio_config.get("loop_cache_dir", "./temp/cache/loops"),
+                },
+                quota_bytes=config.get("quota_bytes", 50 * 1024 ** 3),
+                min_free_bytes=config.get("min_free_bytes", 5 * 1024 ** 3),
+                low_watermark=config.get("low_watermark", 0.9),
+                protect_seconds=config.get("protect_seconds", 3600),
+                orphan_grace_seconds=config.get("orphan_grace_seconds", 3600),
+            )
+        return _manager
+
+
+@contextmanager
+def job_scope(job_id: str) -> Iterator[None]:
+    """
+    Pin the artifacts tracked or touched in this thread to a job until it ends
+    """
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+        try:
+            get_storage_manager().release(job_id)
+        except Exception as e:
+            print(f"Could not release the artifacts of job {job_id}: {e}")
+
+
+# The helpers below never fail the caller: a missed index update only delays
+# eviction until the next sweep.
+
+def track(path: str, kind: str, job_id: Optional[str] = None) -> None:
+    """
+    Register an artifact with the storage manager
+    """
+    try:
+        get_storage_manager().register(path, kind, job_id, pinned_by=_current_job.get())
+    except Exception as e:
+        print(f"Could not index {path}: {e}")
+
+
+def touch(path: str) -> None:
+    """
+    Mark an indexed artifact as recently used
+    """
+    try:
+        get_storage_manager().touch(path, pinned_by=_current_job.get())
+    except Exception as e:
+        print(f"Could not update the last access of {path}: {e}")
+
+
+def last_access(kind: str) -> Dict[str, float]:
+    """
+    Get the indexed last access times of a kind of artifact (empty if the index is unavailable)
+    """
+    try:
+        return get_storage_manager().last_access(kind)
+    except Exception as e:
+        print(f"Could not read the storage index: {e}")
+        return {}
+
+
+def untrack(paths: Iterable[str]) -> None:
+    """
+    Drop files deleted outside the storage manager from the index
+    """
+    try:
+        get_storage_manager().forget(paths)
+    except Exception as e:
+        print(f"Could not update the storage index: {e}")
@@ -2,13 +2,406 @@ import os
 import subprocess
 import uuid
 import shutil
+import hashlib
+import threading
 from PIL import Image
-from typing import Optional, Tuple, List
+from typing import Callable, Dict, Optional, Tuple, List
 import math
 
+from processors.ffmpeg_runner import FFmpegRunner
+from processors.media_probe import MediaProbe
+from processors.config import Config
+from processors.image_preprocessor import ImagePreprocessor
+from processors import metrics, storage_manager
+
 class VideoProcessor:
+    # Periodic motion types: zoompan expressions of the output frame number
+    # ("on") over a cycle of N frames, so frame N matches frame 0 and the
+    # rendered cycle can be repeated seamlessly
+    PERIODIC_MOTIONS = {
+        # Zoom in to 1.15x and back out
+        "zoom_cycle": {
+            "z": "1+0.075*(1-cos(2*PI*on/{frames}))",
+            "x": "iw/2-(iw/zoom/2)",
+            "y": "ih/2-(ih/zoom/2)",
+        },
+        # Circular pan at a fixed 1.15x zoom
+        "pan_cycle": {
+            "z": "1.15",
+            "x": "iw/2-(iw/zoom/2)+iw*0.05*sin(2*PI*on/{frames})",
+            "y": "ih/2-(ih/zoom/2)+ih*0.05*cos(2*PI*on/{frames})",
+        },
+        # Subtle zoom combined with a small circular drift
+        "drift_cycle": {
+            "z": "1.08+0.04*(1-cos(2*PI*on/{frames}))",
+            "x": "iw/2-(iw/zoom/2)+iw*0.02*sin(2*PI*on/{frames})",
+            "y": "ih/2-(ih/zoom/2)+ih*0.02*cos(2*PI*on/{frames})",
+        },
+    }
+    
+    @staticmethod
+    def video_codec_args(tier: Dict, fps: Optional[float] = None, tune: Optional[str] = None) -> List[str]:
+        """
+        Build the x264 arguments of an encoding tier
+        
+        Args:
+            tier: Encoding tier settings (see Config.get_tier)
+            fps: Frame rate of the output, to place a keyframe every
+                 gop_seconds (None leaves the GOP to the caller)
+            tune: Tune overriding the tier's own (e.g. stillimage)
+            
+        Returns:
+            ffmpeg output arguments for the video stream
+        """
+        args = ['-c:v', 'libx264', '-preset', tier['preset'], '-crf', str(tier['crf'])]
+        tune = tune or tier.get('tune')
+        if tune:
+            args += ['-tune', tune]
+        if fps is not None:
+            args += ['-g', str(max(int(round(fps * tier['gop_seconds'])), 1))]
+        if tier.get('threads'):
+            args += ['-threads', str(tier['threads'])]
+        return args
+    
+    @staticmethod
+    def audio_codec_args(tier: Dict) -> List[str]:
+        """
+        Build the audio encoder arguments of an encoding tier
+        """
+        return ['-c:a', tier['audio_codec'], '-b:a', tier['audio_bitrate']]
+    
+    @staticmethod
+    def tier_tag(tier: Dict) -> str:
+        """
+        Name the settings that change the encoded video, for segment cache file names
+        """
+        return "_".join(str(part) for part in (tier['preset'], f"crf{tier['crf']}", tier.get('tune')) if part)
+    
+    @staticmethod
+    @metrics.timed("image_prepare")
+    def prescale_image(image_file: str, output_file: str, width: int, height: int) -> str:
+        """
+        Scale and crop an image once to cover the given size
+        
+        Args:
+            image_file: Path to input image file
+            output_file: Path to output image file (.png)
+            width: Target width
+            height: Target height
+            
+        Returns:
+            Path to the scaled image
+        """
+        cmd = [
+            'ffmpeg',
+            '-i', image_file,
+            '-vf', f'scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1',
+            '-frames:v', '1',
+            '-y',
+            output_file
+        ]
+        
+        FFmpegRunner.run(cmd)
+        return output_file
+    
     @staticmethod
-    def create_video_from_image(audio_file: str, image_file: str, output_file: str, duration: Optional[int] = None) -> str:
+    @metrics.timed("video_segment")
+    def render_motion_cycle(image_file: str, cycle_file: str, motion_type: str,
+                            cycle_duration: float = 20, fps: int = 30,
+                            size: Tuple[int, int] = (1280, 720),
+                            encoding_tier: Optional[str] = None) -> str:
+        """
+        Encode one seamless cycle of a periodic motion effect
+        
+        Args:
+            image_file: Path to a pre-scaled image
+            cycle_file: Path to output cycle file (.mp4)
+            motion_type: One of PERIODIC_MOTIONS
+            cycle_duration: Cycle length in seconds
+            fps: Frame rate
+            size: Output width and height
+            encoding_tier: Encoding tier name (None for the default tier)
+            
+        Returns:
+            Path to the cycle file
+        """
+        frames = int(cycle_duration * fps)
+        expressions = {
+            key: value.format(frames=frames)
+            for key, value in VideoProcessor.PERIODIC_MOTIONS[motion_type].items()
+        }
+        zoompan = "zoompan=z='{z}':x='{x}':y='{y}':d={d}:s={w}x{h}:fps={fps}".format(
+            d=frames, w=size[0], h=size[1], fps=fps, **expressions
+        )
+        
+        # Closed GOPs of about the tier's gop_seconds that divide the cycle exactly,
+        # so every copy joined by stream copy starts on a keyframe with no partial GOP
+        _, tier = Config.get_tier(encoding_tier)
+        gop_size = str(VideoProcessor.cycle_gop_size(frames, fps * tier['gop_seconds']))
+        cmd = [
+            'ffmpeg',
+            '-i', image_file,      # Input image (single frame)
+            '-vf', zoompan,
+            '-frames:v', str(frames),
+            *VideoProcessor.video_codec_args(tier),
+            '-pix_fmt', 'yuv420p', # Pixel format
+            '-g', gop_size,
+            '-keyint_min', gop_size,
+            '-sc_threshold', '0',
+            '-flags', '+cgop',
+            '-an',
+            '-y',                  # Overwrite output file if it exists
+            cycle_file
+        ]
+        
+        FFmpegRunner.run(cmd)
+        return cycle_file
+    
+    @staticmethod
+    def cycle_gop_size(frames: int, target: float) -> int:
+        """
+        Pick the GOP length closest to target frames that divides a cycle of frames exactly
+        
+        Divisors shorter than half the target are not considered (a cycle with
+        a prime frame count becomes a single GOP).
+        """
+        candidates = [size for size in range(1, frames + 1) if frames % size == 0 and size >= target / 2]
+        if not candidates:
+            return frames
+        return min(candidates, key=lambda size: (abs(size - target), -size))
+    
+    @staticmethod
+    @metrics.timed("video_segment")
+    def render_still_segment(image_file: str, segment_file: str, segment_duration: float = 10,
+                             fps: int = 25, encoding_tier: Optional[str] = None) -> str:
+        """
+        Encode a short closed-GOP video segment of a still image
+        
+        The segment has a single keyframe at its start, so it can be repeated
+        with stream copy without re-encoding.
+        
+        Args:
+            image_file: Path to image file
+            segment_file: Path to output segment file (.mp4)
+            segment_duration: Segment length in seconds
+            fps: Frame rate
+            encoding_tier: Encoding tier name (None for the default tier)
+            
+        Returns:
+            Path to the segment file
+        """
+        _, tier = Config.get_tier(encoding_tier)
+        gop_size = str(int(segment_duration * fps))
+        cmd = [
+            'ffmpeg',
+            '-loop', '1',          # Loop image
+            '-framerate', str(fps),
+            '-i', image_file,      # Input image
+            '-t', str(segment_duration),
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', # yuv420p needs even dimensions
+            *VideoProcessor.video_codec_args(tier, tune='stillimage'),
+            '-pix_fmt', 'yuv420p', # Pixel format
+            '-g', gop_size,        # One closed GOP per segment
+            '-keyint_min', gop_size,
+            '-sc_threshold', '0',
+            '-flags', '+cgop',
+            '-an',
+            '-y',                  # Overwrite output file if it exists
+            segment_file
+        ]
+        
+        FFmpegRunner.run(cmd)
+        return segment_file
+    
+    @staticmethod
+    def get_cached_segment(image_file: str, variant: str, render: Callable[[str], str]) -> str:
+        """
+        Get a loopable video segment for an image, rendering it only on a cache miss
+        
+        Segments are cached by the image content hash and the render variant,
+        so backgrounds used by many jobs (like the default one) are encoded once.
+        
+        Args:
+            image_file: Path to the image the segment is rendered from
+            variant: Name describing the render settings
+            render: Function rendering the segment to the given path
+            
+        Returns:
+            Path to the cached segment
+        """
+        cache_dir = Config.section('video').get('segment_cache_dir', './temp/cache/segments')
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        digest = hashlib.sha256()
+        with open(image_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        segment_file = os.path.join(cache_dir, f"{digest.hexdigest()}_{variant}.mp4")
+        
+        if os.path.exists(segment_file):
+            os.utime(segment_file)
+            storage_manager.touch(segment_file)
+            return segment_file
+        
+        tmp_file = f"{segment_file}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+        try:
+            render(tmp_file)
+            os.replace(tmp_file, segment_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        storage_manager.track(segment_file, "segment")
+        return segment_file
+    
+    @staticmethod
+    def get_still_segment(image_file: str, encoding_tier: Optional[str] = None) -> Tuple[str, float]:
+        """
+        Get the cached still-image segment for an image
+        
+        Returns:
+            Tuple of the segment path and its duration in seconds
+        """
+        segment_duration = Config.section('video').get('segment_duration', 10)
+        encoding_tier, tier = Config.get_tier(encoding_tier)
+        segment_file = VideoProcessor.get_cached_segment(
+            image_file, f"still_{segment_duration}s_{VideoProcessor.tier_tag({**tier, 'tune': 'stillimage'})}",
+            lambda path: VideoProcessor.render_still_segment(image_file, path, segment_duration,
+                                                             encoding_tier=encoding_tier)
+        )
+        return segment_file, segment_duration
+    
+    @staticmethod
+    def get_motion_cycle(image_file: str, motion_type: str,
+                         encoding_tier: Optional[str] = None) -> Tuple[str, float]:
+        """
+        Get the cached periodic motion cycle for a pre-scaled image
+        
+        Returns:
+            Tuple of the cycle path and its duration in seconds
+        """
+        video_config = Config.section('video')
+        cycle_duration = video_config.get('motion_cycle_duration', 20)
+        width, height = video_config.get('resolution', [1280, 720])
+        encoding_tier, tier = Config.get_tier(encoding_tier)
+        cycle_file = VideoProcessor.get_cached_segment(
+            image_file, f"{motion_type}_{cycle_duration}s_{width}x{height}_{VideoProcessor.tier_tag(tier)}",
+            lambda path: VideoProcessor.render_motion_cycle(image_file, path, motion_type, cycle_duration,
+                                                            size=(width, height), encoding_tier=encoding_tier)
+        )
+        return cycle_file, cycle_duration
+    
+    @staticmethod
+    def prebuild_segments(image_file: str, motion_type: str) -> None:
+        """
+        Encode the static segment and motion cycle for an image ahead of time
+        
+        Used at startup for the default background, so jobs without an
+        uploaded image only need to mux their audio onto a prebuilt track.
+        Only the default encoding tier is prebuilt.
+        
+        Args:
+            image_file: Path to image file
+            motion_type: Motion type used for motion videos
+        """
+        video_config = Config.section('video')
+        width, height = video_config.get('resolution', [1280, 720])
+        cache_dir = video_config.get('image_cache_dir', './temp/cache/images')
+        
+        image = ImagePreprocessor.prepare(image_file, cache_dir, (width, height))
+        if image["is_animated"]:
+            return
+        VideoProcessor.get_still_segment(image["path"])
+        
+        if motion_type in VideoProcessor.PERIODIC_MOTIONS:
+            motion_image = ImagePreprocessor.prepare(image_file, cache_dir, (width * 3 // 2, height * 3 // 2))
+            VideoProcessor.get_motion_cycle(motion_image["path"], motion_type)
+    
+    @staticmethod
+    @metrics.timed("video_mux")
+    def mux_looped_segment(segment_file: str, audio_file: str, output_file: str, duration: float,
+                           segment_duration: float,
+                           on_progress: Optional[Callable[[float], None]] = None,
+                           encoding_tier: Optional[str] = None) -> str:
+        """
+        Repeat a pre-encoded video segment to the target duration and mux it with audio
+        
+        The video stream is stream-copied, so only the audio is encoded.
+        
+        Args:
+            segment_file: Path to a closed-GOP video segment
+            audio_file: Path to audio file
+            output_file: Path to output video file
+            duration: Target duration in seconds
+            segment_duration: Length of the segment in seconds
+            on_progress: Optional callback receiving the completed fraction
+            encoding_tier: Encoding tier name, for the audio codec and bitrate
+            
+        Returns:
+            Path to the created video file
+        """
+        _, tier = Config.get_tier(encoding_tier)
+        repeat_count = math.ceil(duration / segment_duration) + 1
+        file_list_path = f"{output_file}.segments.txt"
+        with open(file_list_path, 'w') as file_list:
+            file_list.write(f"file '{os.path.abspath(segment_file)}'\n" * repeat_count)
+        
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', file_list_path,  # Repeated video segment
+            '-i', audio_file,      # Input audio
+            '-map', '0:v',
+            '-map', '1:a',
+            '-c:v', 'copy',        # No video re-encoding
+            *VideoProcessor.audio_codec_args(tier),
+            '-t', str(duration),
+            '-movflags', '+faststart', # Move the moov atom to the front for progressive playback
+            '-y',                  # Overwrite output file if it exists
+            output_file
+        ]
+        
+        try:
+            FFmpegRunner.run(cmd, duration, on_progress)
+        finally:
+            os.remove(file_list_path)
+        return output_file
+    
+    @staticmethod
+    @metrics.timed("video_trim")
+    def trim_video(input_file: str, output_file: str, duration: float) -> str:
+        """
+        Cut a rendered video to a shorter duration without re-encoding
+        
+        Args:
+            input_file: Path to a video created by this class
+            output_file: Path to output video file
+            duration: Target duration in seconds
+            
+        Returns:
+            Path to the trimmed video file
+        """
+        cmd = [
+            'ffmpeg',
+            '-i', input_file,
+            '-map', '0',
+            '-c', 'copy',
+            '-t', str(duration),
+            '-movflags', '+faststart',
+            '-y',
+            output_file
+        ]
+        
+        FFmpegRunner.run(cmd)
+        return output_file
+    
+    @staticmethod
+    @metrics.timed("video_encode")
+    def create_video_from_image(audio_file: str, image_file: str, output_file: str, duration: Optional[int] = None,
+                                on_progress: Optional[Callable[[float], None]] = None,
+                                fast_path: Optional[bool] = None,
+                                is_animated: Optional[bool] = None,
+                                encoding_tier: Optional[str] = None) -> str:
         """
         Create a video using a static image and audio
         
@@ -17,29 +410,35 @@ class VideoProcessor:
             image_file: Path to image file
             output_file: Path to output video file
             duration: Optional duration in seconds (defaults to audio length)
+            on_progress: Optional callback receiving the completed fraction
+            fast_path: Encode one still segment and repeat it by stream copy
+                       (defaults to the config value)
+            is_animated: Whether the image is animated, if already known
+            encoding_tier: Encoding tier name (None for the default tier)
             
         Returns:
             Path to the created video file
         """
+        video_config = Config.section('video')
+        if fast_path is None:
+            fast_path = video_config.get('still_fast_path', True)
+        encoding_tier, tier = Config.get_tier(encoding_tier)
+        
         # Get audio duration if not provided
         if duration is None:
-            cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=duration', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                audio_file
-            ]
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            duration = float(result.stdout)
+            duration = MediaProbe.get_duration(audio_file)
         
         # Check if image is a GIF
-        is_gif = False
-        try:
-            with Image.open(image_file) as img:
-                is_gif = getattr(img, "is_animated", False)
-        except Exception:
-            pass
+        if is_animated is None:
+            is_animated = VideoProcessor.is_animated_image(image_file)
+        is_gif = is_animated
+        
+        # Static image fast path: reuse or encode one segment, then stream-copy it
+        if not is_gif and fast_path:
+            segment_file, segment_duration = VideoProcessor.get_still_segment(image_file, encoding_tier)
+            return VideoProcessor.mux_looped_segment(
+                segment_file, audio_file, output_file, duration, segment_duration, on_progress, encoding_tier
+            )
         
         # Command for static image or GIF
         if is_gif:
@@ -49,10 +448,13 @@ class VideoProcessor:
                 '-i', image_file,      # Input GIF
                 '-i', audio_file,      # Input audio
                 '-shortest',           # End when the shorter input ends (audio in this case)
-                '-c:v', 'libx264',     # Video codec
+                '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', # yuv420p needs even dimensions
+                *VideoProcessor.video_codec_args(tier),
+                # GIF frame rates vary, so keyframes are placed by time
+                '-force_key_frames', f"expr:gte(t,n_forced*{tier['gop_seconds']})",
                 '-pix_fmt', 'yuv420p', # Pixel format
-                '-c:a', 'aac',         # Audio codec
-                '-b:a', '192k',        # Audio bitrate
+                *VideoProcessor.audio_codec_args(tier),
+                '-movflags', '+faststart', # Move the moov atom to the front for progressive playback
                 '-y',                  # Overwrite output file if it exists
                 output_file
             ]
@@ -63,21 +465,23 @@ class VideoProcessor:
                 '-loop', '1',          # Loop image
                 '-i', image_file,      # Input image
                 '-i', audio_file,      # Input audio
-                '-c:v', 'libx264',     # Video codec
-                '-tune', 'stillimage', # Optimize for still image
-                '-c:a', 'aac',         # Audio codec
-                '-b:a', '192k',        # Audio bitrate
+                *VideoProcessor.video_codec_args(tier, fps=25, tune='stillimage'),
+                *VideoProcessor.audio_codec_args(tier),
                 '-pix_fmt', 'yuv420p', # Pixel format
                 '-shortest',           # End when the shorter input ends (audio)
+                '-movflags', '+faststart', # Move the moov atom to the front for progressive playback
                 '-y',                  # Overwrite output file if it exists
                 output_file
             ]
         
-        subprocess.run(cmd, check=True)
+        FFmpegRunner.run(cmd, duration, on_progress)
         return output_file
     
     @staticmethod
-    def add_motion_to_image(image_file: str, output_file: str, audio_file: str, duration: int, motion_type: str = "zoom") -> str:
+    @metrics.timed("video_encode")
+    def add_motion_to_image(image_file: str, output_file: str, audio_file: str, duration: int, motion_type: str = "zoom",
+                            on_progress: Optional[Callable[[float], None]] = None,
+                            prescaled: bool = False, encoding_tier: Optional[str] = None) -> str:
         """
         Create a video with motion effect on a static image
         
@@ -86,11 +490,34 @@ class VideoProcessor:
             output_file: Path to output video file
             audio_file: Path to audio file
             duration: Duration in seconds
-            motion_type: Type of motion effect (zoom, pan, etc.)
+            motion_type: Type of motion effect (zoom, pan, or a periodic type
+                         such as zoom_cycle, pan_cycle, drift_cycle)
+            on_progress: Optional callback receiving the completed fraction
+            prescaled: Whether image_file is already scaled to the motion source size
+            encoding_tier: Encoding tier name (None for the default tier)
             
         Returns:
             Path to the processed video file
         """
+        encoding_tier, tier = Config.get_tier(encoding_tier)
+        
+        # Periodic motion: reuse or render one cycle and repeat it by stream copy
+        if motion_type in VideoProcessor.PERIODIC_MOTIONS:
+            scaled_image = f"{os.path.splitext(output_file)[0]}_prescaled.png"
+            try:
+                if prescaled:
+                    scaled_image = image_file
+                else:
+                    # 1.5x headroom keeps zoomed frames sharp
+                    VideoProcessor.prescale_image(image_file, scaled_image, 1920, 1080)
+                cycle_file, cycle_duration = VideoProcessor.get_motion_cycle(scaled_image, motion_type, encoding_tier)
+                return VideoProcessor.mux_looped_segment(
+                    cycle_file, audio_file, output_file, duration, cycle_duration, on_progress, encoding_tier
+                )
+            finally:
+                if scaled_image != image_file and os.path.exists(scaled_image):
+                    os.remove(scaled_image)
+        
         # Define filter based on motion type
         if motion_type == "zoom":
             # Slow zoom in effect
@@ -108,20 +535,22 @@ class VideoProcessor:
             '-i', image_file,      # Input image
             '-i', audio_file,      # Input audio
             '-filter_complex', filter_complex,
-            '-c:v', 'libx264',     # Video codec
-            '-c:a', 'aac',         # Audio codec
-            '-b:a', '192k',        # Audio bitrate
+            *VideoProcessor.video_codec_args(tier, fps=30),
+            *VideoProcessor.audio_codec_args(tier),
             '-pix_fmt', 'yuv420p', # Pixel format
             '-shortest',           # End when the shorter input ends (audio)
+            '-movflags', '+faststart', # Move the moov atom to the front for progressive playback
             '-y',                  # Overwrite output file if it exists
             output_file
         ]
         
-        subprocess.run(cmd, check=True)
+        FFmpegRunner.run(cmd, duration, on_progress)
         return output_file
     
     @staticmethod
-    def process_video(audio_file: str, image_file: str, output_dir: str, duration: int, add_motion: bool = False, motion_type: str = "zoom") -> str:
+    def process_video(audio_file: str, image_file: str, output_dir: str, duration: int, add_motion: bool = False, motion_type: str = "zoom",
+                      on_progress: Optional[Callable[[float], None]] = None,
+                      encoding_tier: Optional[str] = None) -> str:
         """
         Process audio and image to create a video
         
@@ -132,6 +561,8 @@ class VideoProcessor:
             duration: Target duration in seconds
             add_motion: Whether to add motion effect to static images
             motion_type: Type of motion effect
+            on_progress: Optional callback receiving the completed fraction
+            encoding_tier: Encoding tier name (speed/size trade-off, None for the default tier)
             
         Returns:
             Path to the final video file
@@ -140,18 +571,32 @@ class VideoProcessor:
         output_filename = str(uuid.uuid4())
         output_file = os.path.join(output_dir, f"{output_filename}.mp4")
         
-        # Check if image is a GIF
-        is_gif = False
-        try:
-            with Image.open(image_file) as img:
-                is_gif = getattr(img, "is_animated", False)
-        except Exception:
-            pass
+        # Decode the image once: metadata plus a normalized, cached frame.
+        # Motion sources keep 1.5x headroom so zoomed frames stay sharp.
+        video_config = Config.section('video')
+        width, height = video_config.get('resolution', [1280, 720])
+        source_size = (width * 3 // 2, height * 3 // 2) if add_motion else (width, height)
+        image = ImagePreprocessor.prepare(
+            image_file, video_config.get('image_cache_dir', './temp/cache/images'), source_size
+        )
         
         # Process based on image type and motion setting
-        if is_gif or not add_motion:
+        if image["is_animated"] or not add_motion:
             # GIFs already have motion or user doesn't want motion effect
-            return VideoProcessor.create_video_from_image(audio_file, image_file, output_file, duration)
+            return VideoProcessor.create_video_from_image(audio_file, image["path"], output_file, duration, on_progress,
+                                                          is_animated=image["is_animated"], encoding_tier=encoding_tier)
         else:
             # Add motion effect to static image
-            return VideoProcessor.add_motion_to_image(image_file, output_file, audio_file, duration, motion_type)
+            return VideoProcessor.add_motion_to_image(image["path"], output_file, audio_file, duration, motion_type, on_progress,
+                                                      prescaled=True, encoding_tier=encoding_tier)
+    
+    @staticmethod
+    def is_animated_image(image_file: str) -> bool:
+        """
+        Check whether an image file is animated (e.g. an animated GIF)
+        """
+        try:
+            with Image.open(image_file) as img:
+                return getattr(img, "is_animated", False)
+        except Exception:
+            return False
@@ -0,0 +1,101 @@
+"""
+Synthetic clips and spectral measurements shared by the rendering tests
+
+Needs numpy, scipy and soundfile; the tests that use it skip without them
+or without ffmpeg on PATH.
+"""
+import os
+import subprocess
+from typing import Tuple
+
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+
+def write_clip(path: str, seconds: float = 10.0, samplerate: int = 44100) -> str:
+    """
+    Write a stereo clip with energy in the bass and in the 2.5-5 kHz band
+
+    A bass line and a chord change every second, with short noise bursts on
+    every beat, so loop points and band energies are well defined.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    chords = [(110.0, 261.6, 329.6), (98.0, 246.9, 293.7), (87.3, 220.0, 261.6), (130.8, 329.6, 392.0)]
+    mono = np.zeros_like(t)
+    for n, start in enumerate(range(0, len(t), samplerate)):
+        bass, *tones = chords[n % len(chords)]
+        segment = t[start:start + samplerate] - t[start]
+        envelope = np.exp(-segment * 1.5)
+        mono[start:start + samplerate] = envelope * (0.4 * np.sin(2 * np.pi * bass * segment)
+                                                     + 0.2 * sum(np.sin(2 * np.pi * f * segment) for f in tones)
+                                                     + 0.1 * np.sin(2 * np.pi * 3500 * segment))
+    beat = samplerate // 2
+    burst = rng.standard_normal(beat) * np.exp(-np.arange(beat) / (0.02 * samplerate))
+    for start in range(0, len(t) - beat, beat):
+        mono[start:start + beat] += 0.1 * burst
+    mono = mono / np.max(np.abs(mono)) * 0.8
+    sf.write(path, np.column_stack([mono, np.roll(mono, 22)]).astype(np.float32), samplerate)
+    return path
+
+
+def decode_mono(path: str) -> Tuple[np.ndarray, int]:
+    """
+    Decode a rendered file to mono samples with ffmpeg
+    """
+    wav_path = f"{path}.mono.wav"
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', path, '-ac', '1', wav_path], check=True)
+    data, samplerate = sf.read(wav_path)
+    os.remove(wav_path)
+    return data, samplerate
+
+
+def spectrum_db(data: np.ndarray, samplerate: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Average power spectrum in dB
+    """
+    freqs, power = signal.welch(data, samplerate, nperseg=8192)
+    return freqs, 10 * np.log10(power + 1e-20)
+
+
+def band_db(data: np.ndarray, samplerate: int, low: float, high: float) -> float:
+    """
+    Energy (dB) of the average power spectrum between low and high Hz
+    """
+    freqs, power = signal.welch(data, samplerate, nperseg=8192)
+    return float(10 * np.log10(np.sum(power[(freqs >= low) & (freqs <= high)]) + 1e-20))
+
+
+def rms_db(data: np.ndarray) -> float:
+    return float(20 * np.log10(np.sqrt(np.mean(data ** 2)) + 1e-12))
+
+
+def boundary_level_diff(before: np.ndarray, after: np.ndarray, samplerate: int, unit_duration: float,
+                        window: float = 0.1) -> float:
+    """
+    Largest short-time level difference (dB) within +-window seconds of the loop boundaries
+
+    Levels are 10 ms RMS frames; the overall level offset between the two
+    renders is removed first, and silent frames are skipped.
+    """
+    hop = samplerate // 100
+    count = min(len(before), len(after)) // hop
+
+    def level_db(data: np.ndarray) -> np.ndarray:
+        frames = data[:count * hop].reshape(count, hop)
+        return 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-9)
+
+    before_db, after_db = level_db(before), level_db(after)
+    audible = (before_db > np.max(before_db) - 50) & (after_db > np.max(after_db) - 50)
+    if not np.any(audible):
+        return 0.0
+    diff = before_db - after_db
+    diff -= np.median(diff[audible])
+
+    near = np.zeros(count, dtype=bool)
+    for boundary in np.arange(unit_duration, count / 100, unit_duration):
+        center = int(boundary * 100)
+        near[max(center - int(window * 100), 0):center + int(window * 100) + 1] = True
+    selected = near & audible
+    return float(np.max(np.abs(diff[selected]))) if np.any(selected) else 0.0
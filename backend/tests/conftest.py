@@ -0,0 +1,13 @@
+import pytest
+
+from processors import storage_manager
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """
+    Run each test in its own directory, so the ./temp caches and indexes start empty
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage_manager, "_manager", None)
+    return tmp_path
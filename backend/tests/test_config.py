@@ -0,0 +1,66 @@
+import copy
+import json
+
+import pytest
+
+from processors.config import CONFIG_PATH, DEFAULT_CONFIG, Config, ConfigError
+
+
+def modified(**changes):
+    """
+    Copy the default configuration with values replaced (section__key=value)
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    for path, value in changes.items():
+        *parents, key = path.split("__")
+        target = config
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = value
+    return config
+
+
+def test_default_config_is_valid():
+    Config.validate(DEFAULT_CONFIG)
+
+
+def test_shipped_config_is_valid():
+    with open(CONFIG_PATH) as f:
+        Config.validate(json.load(f))
+
+
+def test_unknown_keys_are_allowed():
+    Config.validate(modified(audio__future_setting="x", extra_section={"a": 1}))
+
+
+@pytest.mark.parametrize("config, message", [
+    (modified(audio__sample_rate="44100"), "audio.sample_rate: unexpected value"),
+    (modified(audio__crossfade_duration=True), "audio.crossfade_duration: unexpected value"),
+    (modified(audio__pipeline="two_pass"), "audio.pipeline: must be one of single_pass, multi_pass"),
+    (modified(jobs__lease_seconds=-1), "jobs.lease_seconds: must not be negative"),
+    (modified(video=[]), "video: must be an object"),
+    (modified(profiles={"work": DEFAULT_CONFIG["profiles"]["work"]}), "must be an object containing a 'default'"),
+    (modified(profiles__default__low_freq_range=[200, 50]), "profiles.default.low_freq_range"),
+    (modified(profiles__relax__cry_reduction="-2"), "profiles.relax.cry_reduction: must be a number"),
+    (modified(encoding__default_tier="turbo"), "encoding.default_tier: no tier named 'turbo'"),
+    (modified(encoding__tiers__fast__preset="warp"), "encoding.tiers.fast.preset"),
+    (modified(encoding__tiers__fast__crf=52), "encoding.tiers.fast.crf"),
+    (modified(encoding__tiers__fast__gop_seconds=0), "encoding.tiers.fast.gop_seconds"),
+    (modified(encoding__tiers__fast__threads=-1), "encoding.tiers.fast.threads"),
+])
+def test_invalid_values(config, message):
+    with pytest.raises(ConfigError, match=message.replace(".", r"\.")):
+        Config.validate(config)
+
+
+def test_every_problem_is_reported():
+    config = modified(audio__quality="high", jobs__max_queue=-5)
+    with pytest.raises(ConfigError) as error:
+        Config.validate(config)
+    assert "audio.quality" in str(error.value)
+    assert "jobs.max_queue" in str(error.value)
+
+
+def test_top_level_must_be_an_object():
+    with pytest.raises(ConfigError):
+        Config.validate([])
@@ -0,0 +1,66 @@
+from email.utils import formatdate
+
+import pytest
+
+pytest.importorskip("anyio")
+pytest.importorskip("starlette")
+
+from app.downloads import _if_range_matches, parse_range
+
+ETAG = '"3e8-17a"'
+MTIME = 1700000000.5
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=5-5", (5, 5)),
+    ("BYTES = 0-0", (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1010", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=5--3",
+    "bytes=-",
+    "bytes=",
+    "bytes=5",
+    "bytes=5-3",
+    "bytes=+5-10",
+    "bytes=5-1_0",
+    "bytes=a-b",
+    "bytes=0-1,5-6",
+    "items=0-1",
+])
+def test_parse_range_malformed(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_if_range_absent():
+    assert _if_range_matches(None, ETAG, MTIME)
+    assert _if_range_matches("", ETAG, MTIME)
+
+
+def test_if_range_etag():
+    assert _if_range_matches(ETAG, ETAG, MTIME)
+    assert _if_range_matches(f" {ETAG} ", ETAG, MTIME)
+    assert not _if_range_matches('"other"', ETAG, MTIME)
+    # Weak validators never match for If-Range
+    assert not _if_range_matches(f"W/{ETAG}", ETAG, MTIME)
+
+
+def test_if_range_date():
+    assert _if_range_matches(formatdate(MTIME, usegmt=True), ETAG, MTIME)
+    assert _if_range_matches(formatdate(MTIME + 60, usegmt=True), ETAG, MTIME)
+    assert not _if_range_matches(formatdate(MTIME - 60, usegmt=True), ETAG, MTIME)
+    assert not _if_range_matches("not a date", ETAG, MTIME)
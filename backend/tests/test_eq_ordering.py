@@ -0,0 +1,70 @@
+"""
+EQ on the loop source before looping (the default, optimize_before_loop)
+must sound like EQ on the looped output: same spectral shape, and no
+transients where the loop wraps
+"""
+import shutil
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("soundfile")
+if shutil.which("ffmpeg") is None:
+    pytest.skip("ffmpeg is not on PATH", allow_module_level=True)
+
+from processors.config import Config
+from processors.audio_looper import AudioLooper
+from processors.frequency_optimizer import FrequencyOptimizer
+from processors.loop_finder import LoopFinder
+from processors.pcm_buffer import PCMBuffer
+from tests.audio_helpers import boundary_level_diff, decode_mono, spectrum_db, write_clip
+
+DURATION = 40
+MEAN_TOLERANCE_DB = 1.0
+MAX_TOLERANCE_DB = 3.0
+BOUNDARY_TOLERANCE_DB = 1.0
+
+
+@pytest.mark.parametrize("loop_mode", ["crossfade", "fade"])
+def test_eq_before_loop_matches_eq_after_loop(workdir, loop_mode):
+    out = lambda name: str(workdir / name)
+    source = write_clip(out("clip.wav"))
+    audio_config = Config.section("audio")
+    crossfade = audio_config.get("crossfade_duration", 3.0)
+    sample_rate = audio_config.get("sample_rate", 44100)
+    crossfade_loop = loop_mode == "crossfade"
+
+    with Config.override(audio={"loop_mode": loop_mode}):
+        # The loop source the pipeline repeats: the loop unit, or the decoded clip in fade mode
+        if crossfade_loop:
+            unit = LoopFinder.get_loop_unit(source, crossfade, sample_rate)
+        else:
+            unit = PCMBuffer.decode(source, out("decoded.f32"), sample_rate)
+        unit_duration = unit.duration
+
+        # EQ on the loop source, then loop
+        FrequencyOptimizer.optimize_buffer(unit, out("source_eq.f32"), "default", pad_seconds=crossfade).close()
+        AudioLooper.combine_audio_with_loops(out("source_eq.f32"), out("before.mp3"), DURATION,
+                                             input_duration=unit_duration, is_loop_unit=crossfade_loop)
+        # Loop, then EQ on the looped output
+        AudioLooper.combine_audio_with_loops(unit.path, out("looped.mp3"), DURATION,
+                                             input_duration=unit_duration, is_loop_unit=crossfade_loop)
+        unit.close()
+        assert FrequencyOptimizer.optimize_audio(out("looped.mp3"), out("after.wav"), "default")
+
+    before, samplerate = decode_mono(out("before.mp3"))
+    after, _ = decode_mono(out("after.wav"))
+    frames = min(len(before), len(after))
+    before, after = before[:frames], after[:frames]
+
+    # Compare spectral shape where there is signal; the overall level may differ
+    freqs, before_db = spectrum_db(before, samplerate)
+    _, after_db = spectrum_db(after, samplerate)
+    band = (freqs >= 40) & (freqs <= min(16000, samplerate / 2 * 0.9)) & (before_db > np.max(before_db) - 60)
+    diff = before_db[band] - after_db[band]
+    diff -= np.median(diff)
+
+    assert np.mean(np.abs(diff)) <= MEAN_TOLERANCE_DB
+    assert np.max(np.abs(diff)) <= MAX_TOLERANCE_DB
+    assert boundary_level_diff(before, after, samplerate, unit_duration) <= BOUNDARY_TOLERANCE_DB
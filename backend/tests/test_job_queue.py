@@ -0,0 +1,130 @@
+import pytest
+
+from app.job_queue import QueueFullError, SQLiteJobQueue
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(**options):
+        return SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"), **options)
+    return make
+
+
+def expire_leases(queue: SQLiteJobQueue):
+    queue._connect().execute("UPDATE job_queue SET lease_expires_at = 0 WHERE state = 'leased'")
+
+
+def test_claim_in_fifo_order(make_queue):
+    queue = make_queue()
+    assert queue.enqueue("a", "process_job", "static", {"duration": 60}) == 1
+    assert queue.enqueue("b", "process_job", "static", {}) == 2
+    assert queue.position("b") == 2
+
+    assert queue.claim("w1") == ("a", "process_job", {"duration": 60})
+    assert queue.position("a") is None
+    assert queue.position("b") == 1
+    assert queue.leased_job_ids() == {"a"}
+    assert queue.active_job_ids() == {"a", "b"}
+    assert queue.stats() == {"queued": 1, "running": {"static": 1}}
+
+
+def test_claim_empty_queue(make_queue):
+    assert make_queue().claim("w1") is None
+
+
+def test_enqueue_when_full(make_queue):
+    queue = make_queue(max_queue=1)
+    queue.enqueue("a", "process_job", "static", {})
+    with pytest.raises(QueueFullError):
+        queue.enqueue("b", "process_job", "static", {})
+    # Leased jobs do not count against max_queue
+    queue.claim("w1")
+    queue.enqueue("b", "process_job", "static", {})
+
+
+def test_heartbeat_and_complete_need_the_lease(make_queue):
+    queue = make_queue()
+    queue.enqueue("a", "process_job", "static", {})
+    queue.claim("w1")
+
+    assert queue.heartbeat("a", "w1")
+    assert not queue.heartbeat("a", "w2")
+    assert not queue.complete("a", "w2")
+    assert queue.complete("a", "w1")
+    assert not queue.heartbeat("a", "w1")
+    assert queue.active_job_ids() == set()
+
+
+def test_heartbeat_keeps_lease_alive(make_queue):
+    queue = make_queue(lease_seconds=3600)
+    queue.enqueue("a", "process_job", "static", {})
+    queue.claim("w1")
+    expire_leases(queue)
+    queue.heartbeat("a", "w1")
+
+    assert queue.requeue_expired() == ([], [])
+    assert queue.leased_job_ids() == {"a"}
+
+
+def test_expired_lease_is_requeued(make_queue):
+    queue = make_queue()
+    queue.enqueue("a", "process_job", "static", {})
+    queue.claim("w1")
+    expire_leases(queue)
+
+    assert queue.requeue_expired() == (["a"], [])
+    # The lost worker no longer holds the lease
+    assert not queue.heartbeat("a", "w1")
+    assert not queue.complete("a", "w1")
+    assert queue.claim("w2")[0] == "a"
+
+
+def test_release_requeues_without_waiting_for_expiry(make_queue):
+    queue = make_queue()
+    queue.enqueue("a", "process_job", "static", {})
+    queue.claim("w1")
+
+    assert queue.release("a", "w1")
+    assert queue.position("a") == 1
+    assert not queue.release("a", "w1")
+
+
+def test_max_attempts(make_queue):
+    queue = make_queue(max_attempts=2)
+    queue.enqueue("a", "process_job", "static", {})
+
+    queue.claim("w1")
+    expire_leases(queue)
+    assert queue.requeue_expired() == (["a"], [])
+
+    queue.claim("w2")
+    expire_leases(queue)
+    assert queue.requeue_expired() == ([], ["a"])
+    assert queue.active_job_ids() == set()
+
+
+def test_class_limits(make_queue):
+    queue = make_queue(class_limits={"motion": 1})
+    queue.enqueue("m1", "process_job", "motion", {})
+    queue.enqueue("m2", "process_job", "motion", {})
+    queue.enqueue("s1", "process_job", "static", {})
+    queue.enqueue("s2", "process_job", "static", {})
+
+    assert queue.claim("w1")[0] == "m1"
+    # m2 waits for m1; unlimited static jobs are started past it
+    assert queue.claim("w2")[0] == "s1"
+    assert queue.claim("w3")[0] == "s2"
+    assert queue.claim("w4") is None
+
+    queue.complete("m1", "w1")
+    assert queue.claim("w4")[0] == "m2"
+
+
+def test_class_limits_shared_between_processes(make_queue):
+    first = make_queue(class_limits={"motion": 1})
+    second = make_queue(class_limits={"motion": 1})
+    first.enqueue("m1", "process_job", "motion", {})
+    first.enqueue("m2", "process_job", "motion", {})
+
+    assert first.claim("w1")[0] == "m1"
+    assert second.claim("w2") is None
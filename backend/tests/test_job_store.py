@@ -0,0 +1,72 @@
+import pytest
+
+from app.job_store import TERMINAL_STATUSES, MemoryJobStore, SQLiteJobStore
+
+
+def test_flush_does_not_overwrite_requeued_job(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker = SQLiteJobStore(path, flush_interval=3600)
+    recovery = SQLiteJobStore(path, flush_interval=3600)
+
+    worker.create("job", "pending", 0, "queued")
+    assert worker.update("job", "processing", 10, "Processing audio...")
+    # Within flush_interval, so only buffered
+    assert worker.update("job", "processing", 50, "Processing audio...")
+
+    # Another process re-queues the job before the buffer is written
+    assert recovery.update("job", "pending", 0, "Worker stopped responding, job queued again")
+    worker.flush()
+
+    job = recovery.get("job")
+    assert job["status"] == "pending"
+    assert job["progress"] == 0
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore()
+    # No buffering, so every update is checked against the stored status
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), flush_interval=0)
+
+
+def test_job_lifecycle(store):
+    store.create("job", "pending", 0, "queued", data={"position": 1})
+    assert store.update("job", "processing", 10, "Processing audio...", data={"stage": "audio"})
+    assert store.update("job", "completed", 100, "Done", file_id="file")
+
+    job = store.get("job")
+    assert (job["status"], job["progress"], job["file_id"]) == ("completed", 100, "file")
+    assert job["position"] == 1 and job["stage"] == "audio"
+
+
+@pytest.mark.parametrize("final", TERMINAL_STATUSES)
+@pytest.mark.parametrize("status", ["pending", "processing", "completed", "failed"])
+def test_finished_jobs_do_not_change(store, final, status):
+    store.create("job", "processing", 50, "Processing audio...")
+    assert store.update("job", final, 100, "Finished")
+
+    assert not store.update("job", status, 0, "Late update", file_id="late")
+    job = store.get("job")
+    assert (job["status"], job["message"], job["file_id"]) == (final, "Finished", None)
+
+
+def test_requeued_job_can_restart(store):
+    store.create("job", "processing", 50, "Processing audio...")
+    assert store.update("job", "pending", 0, "Worker stopped responding, job queued again")
+    assert store.update("job", "processing", 5, "Processing audio...")
+
+
+def test_unknown_job(store):
+    assert not store.update("missing", "processing", 10, "Processing audio...")
+    assert store.get("missing") is None
+
+
+def test_delete_older_than_keeps_unfinished_jobs(store):
+    store.create("done", "processing", 0, "")
+    store.update("done", "failed", 0, "Error")
+    store.create("running", "processing", 0, "")
+
+    assert store.delete_older_than(hours=-1) == 1
+    assert store.get("done") is None
+    assert store.get("running") is not None
@@ -0,0 +1,51 @@
+import importlib
+
+import pytest
+
+for module in ("numpy", "scipy", "soundfile", "PIL"):
+    pytest.importorskip(module)
+
+
+@pytest.fixture
+def plan_batch():
+    # Imported inside the test directory: app.jobs opens its job store under ./temp
+    return importlib.import_module("app.jobs").plan_batch
+
+
+def variant(duration, frequency=None, audio_profile="default", add_motion=False,
+            apply_frequency_optimization=True, encoding_tier=None):
+    return {"duration": duration, "frequency": frequency, "audio_profile": audio_profile,
+            "add_motion": add_motion, "apply_frequency_optimization": apply_frequency_optimization,
+            "encoding_tier": encoding_tier}
+
+
+def test_durations_share_one_render(plan_batch):
+    plan = plan_batch([variant(30), variant(180), variant(60)])
+    assert plan == [{"render": 1, "derive": [2, 0], "frequency": None}]
+
+
+def test_differing_parameters_render_separately(plan_batch):
+    variants = [
+        variant(60),
+        variant(60, frequency=432),
+        variant(60, audio_profile="relax"),
+        variant(60, add_motion=True),
+        variant(60, apply_frequency_optimization=False),
+        variant(60, encoding_tier="archive"),
+    ]
+    plan = plan_batch(variants)
+    assert sorted(group["render"] for group in plan) == list(range(len(variants)))
+    assert all(group["derive"] == [] for group in plan)
+    assert [group["frequency"] for group in plan if group["render"] == 1] == [432]
+
+
+def test_groups_are_independent(plan_batch):
+    plan = plan_batch([variant(60, frequency=432), variant(60), variant(600, frequency=432), variant(120)])
+    assert sorted(plan, key=lambda group: group["render"]) == [
+        {"render": 2, "derive": [0], "frequency": 432},
+        {"render": 3, "derive": [1], "frequency": None},
+    ]
+
+
+def test_empty_batch(plan_batch):
+    assert plan_batch([]) == []
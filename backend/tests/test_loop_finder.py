@@ -0,0 +1,96 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from processors.loop_finder import LoopFinder, LoopUnitUnavailable
+from processors.pcm_buffer import PCMBuffer
+
+SAMPLERATE = 8000
+HOP = SAMPLERATE // 100
+
+
+def periodic_clip(seconds: float, period: float, seed: int = 0) -> np.ndarray:
+    """
+    Stereo clip repeating one period of decaying noise bursts (a steady beat)
+    """
+    rng = np.random.default_rng(seed)
+    length = int(period * SAMPLERATE)
+    t = np.arange(length) / SAMPLERATE
+    bar = rng.standard_normal(length) * (0.1 + np.exp(-t * 8)) * 0.2
+    mono = np.tile(bar, int(np.ceil(seconds / period)))[:int(seconds * SAMPLERATE)]
+    return np.stack([mono, mono * 0.8], axis=1).astype(np.float32)
+
+
+def test_loop_length_is_a_whole_number_of_periods():
+    period = 1.0
+    samples = periodic_clip(20, period)
+    crossfade = SAMPLERATE // 2
+    start, end, score = LoopFinder.find_loop_points(samples, SAMPLERATE, crossfade)
+
+    period_frames = int(period * SAMPLERATE)
+    assert 0 <= start < end <= len(samples) - crossfade
+    assert end - start >= 0.5 * len(samples) - period_frames
+    assert min((end - start) % period_frames, -(end - start) % period_frames) <= HOP
+    assert score > 0.9
+
+
+def test_short_clip_loops_whole():
+    samples = periodic_clip(0.5, 0.25)
+    crossfade = SAMPLERATE // 4
+    assert LoopFinder.find_loop_points(samples, SAMPLERATE, crossfade) == (0, len(samples) - crossfade, 0.0)
+
+
+def test_silent_clip_loops_whole():
+    samples = np.zeros((10 * SAMPLERATE, 2), dtype=np.float32)
+    crossfade = SAMPLERATE // 2
+    assert LoopFinder.find_loop_points(samples, SAMPLERATE, crossfade) == (0, len(samples) - crossfade, 0.0)
+
+
+def test_normalized_xcorr_finds_template():
+    rng = np.random.default_rng(1)
+    series = rng.standard_normal(1000)
+    scores = LoopFinder.normalized_xcorr(series[300:400], series)
+    assert len(scores) == 901
+    assert int(np.argmax(scores)) == 300
+    assert scores[300] == pytest.approx(1.0)
+
+
+@pytest.fixture
+def source(tmp_path):
+    frames = 4000
+    ramp = np.arange(frames, dtype=np.float32) / frames
+    buffer = PCMBuffer.create(str(tmp_path / f"source{PCMBuffer.EXTENSION}"), SAMPLERATE, 2, frames)
+    buffer.samples[:] = np.stack([ramp, -ramp], axis=1)
+    buffer.flush()
+    return buffer
+
+
+def test_write_loop_unit(source, tmp_path):
+    start, end, crossfade = 500, 3000, 400
+    unit = LoopFinder.write_loop_unit(source, str(tmp_path / f"unit{PCMBuffer.EXTENSION}"),
+                                      start, end, crossfade, blocksize=256)
+
+    samples = source.samples
+    assert unit.frames == end - start
+    assert (unit.sample_rate, unit.channels) == (SAMPLERATE, 2)
+    # After the crossfade the unit is a plain copy
+    np.testing.assert_array_equal(unit.samples[crossfade:], samples[start + crossfade:end])
+
+    # The material following the end fades out (cos) as the start fades in (sin)
+    angle = (np.arange(crossfade) + 0.5) / crossfade * (np.pi / 2)
+    expected = (samples[start:start + crossfade] * np.sin(angle)[:, None]
+                + samples[end:end + crossfade] * np.cos(angle)[:, None])
+    np.testing.assert_allclose(unit.samples[:crossfade], expected, rtol=1e-5, atol=1e-6)
+
+
+def test_write_loop_unit_shortens_crossfade_at_the_end(source, tmp_path):
+    unit = LoopFinder.write_loop_unit(source, str(tmp_path / f"unit{PCMBuffer.EXTENSION}"),
+                                      1000, source.frames - 100, 400)
+    # Only 100 frames follow the end, so only 100 are crossfaded
+    np.testing.assert_array_equal(unit.samples[100:], source.samples[1100:source.frames - 100])
+
+
+@pytest.mark.parametrize("start, end", [(3000, 3000), (3000, 2000), (-1, 2000), (0, 4001)])
+def test_write_loop_unit_rejects_invalid_points(source, tmp_path, start, end):
+    with pytest.raises(LoopUnitUnavailable):
+        LoopFinder.write_loop_unit(source, str(tmp_path / f"unit{PCMBuffer.EXTENSION}"), start, end, 400)
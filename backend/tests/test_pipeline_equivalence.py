@@ -0,0 +1,54 @@
+"""
+The single pass (one ffmpeg graph, firequalizer EQ) and the multi pass (PCM
+buffer, SOS biquad EQ) must render equivalent audio
+"""
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("soundfile")
+if shutil.which("ffmpeg") is None:
+    pytest.skip("ffmpeg is not on PATH", allow_module_level=True)
+
+from processors.config import Config
+from processors.audio_looper import AudioLooper
+from processors.audio_processor import AudioProcessor
+from tests.audio_helpers import band_db, decode_mono, rms_db, write_clip
+
+DURATION = 30
+TOLERANCE_DB = 1.0
+DURATION_TOLERANCE_S = 0.1
+
+
+def stats(path: str) -> dict:
+    data, samplerate = decode_mono(path)
+    _, profile = Config.get_profile("default")
+    return {
+        "duration_s": len(data) / samplerate,
+        "loudness_lufs": AudioLooper.measure_loudness(path)["input_i"],
+        "rms_db": rms_db(data),
+        "low_band_db": band_db(data, samplerate, *profile["low_freq_range"]),
+        "cry_band_db": band_db(data, samplerate, *profile["cry_freq_range"]),
+    }
+
+
+@pytest.mark.parametrize("loop_mode", ["crossfade", "fade"])
+def test_single_and_multi_pass_render_equivalent_audio(workdir, loop_mode):
+    clip = write_clip(str(workdir / "clip.wav"))
+    output_dir = str(workdir / "outputs")
+    os.makedirs(output_dir)
+
+    with Config.override(audio={"loop_mode": loop_mode}):
+        # Called directly: process_audio would silently fall back to the multi pass
+        single = stats(AudioProcessor.process_audio_single_pass(
+            clip, os.path.join(output_dir, "single.mp3"), DURATION))
+        multi = stats(AudioProcessor.process_audio(
+            clip, output_dir, DURATION, None, 0, 0, "default", True, "multi_pass"))
+
+    assert single["duration_s"] == pytest.approx(DURATION, abs=DURATION_TOLERANCE_S)
+    assert multi["duration_s"] == pytest.approx(DURATION, abs=DURATION_TOLERANCE_S)
+    for key in ("loudness_lufs", "rms_db", "low_band_db", "cry_band_db"):
+        assert single[key] == pytest.approx(multi[key], abs=TOLERANCE_DB), key
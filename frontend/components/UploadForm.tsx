@@ -30,34 +30,58 @@ export const UploadForm: React.FC = () => {
     }
   };
 
-  // ジョブ状態の定期的なチェック
+  // ジョブ状態の受信（Server-Sent Events、使えない場合は定期的なチェック）
   useEffect(() => {
     let interval: NodeJS.Timeout | null = null;
-    
-    if (jobId && isUploading) {
+    let eventSource: EventSource | null = null;
+
+    const handleStatus = (data: { status: string; progress: number; file_id?: string }) => {
+      const { status, progress, file_id } = data;
+
+      setProgress(progress);
+
+      if (status === 'completed' && file_id) {
+        setIsUploading(false);
+        setDownloadUrl(`http://localhost:8000/api/download/${file_id}`);
+        return true;
+      } else if (status === 'failed') {
+        setIsUploading(false);
+        setError('処理中にエラーが発生しました。もう一度お試しください。');
+        return true;
+      }
+      return false;
+    };
+
+    const startPolling = () => {
       interval = setInterval(async () => {
         try {
           const statusResponse = await axios.get(`http://localhost:8000/api/status/${jobId}`);
-          const { status, progress, file_id } = statusResponse.data;
-          
-          setProgress(progress);
-          
-          if (status === 'completed' && file_id) {
-            setIsUploading(false);
-            setDownloadUrl(`http://localhost:8000/api/download/${file_id}`);
-            if (interval) clearInterval(interval);
-          } else if (status === 'failed') {
-            setIsUploading(false);
-            setError('処理中にエラーが発生しました。もう一度お試しください。');
-            if (interval) clearInterval(interval);
-          }
+          if (handleStatus(statusResponse.data) && interval) clearInterval(interval);
         } catch (error) {
           console.error('Error checking job status:', error);
         }
       }, 2000);
+    };
+
+    if (jobId && isUploading) {
+      if (typeof EventSource !== 'undefined') {
+        eventSource = new EventSource(`http://localhost:8000/api/events/${jobId}`);
+        eventSource.onmessage = (event) => {
+          if (handleStatus(JSON.parse(event.data)) && eventSource) eventSource.close();
+        };
+        eventSource.onerror = () => {
+          // ストリームが切断された場合は定期的なチェックに切り替える
+          if (eventSource) eventSource.close();
+          eventSource = null;
+          if (!interval) startPolling();
+        };
+      } else {
+        startPolling();
+      }
     }
-    
+
     return () => {
+      if (eventSource) eventSource.close();
       if (interval) clearInterval(interval);
     };
   }, [jobId, isUploading]);